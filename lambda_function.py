@@ -28,6 +28,14 @@ from ask_sdk_model.interfaces.audioplayer import (
     StopDirective)
 from ask_sdk_model.interfaces import display
 
+def log_request(message, request_envelope, level=logging.INFO):
+    # one line per request instead of the whole envelope, which is slow to turn
+    # into a string and puts the user and device ids in the logs
+    if logger.isEnabledFor(level):
+        request = request_envelope.request
+        logger.log(level, "%s: %s %s token=%s offset=%s", message, request.object_type, request.request_id,
+                   getattr(request, "token", None), getattr(request, "offset_in_milliseconds", None))
+
 small_image_url = create_presigned_url("Media/Note108.png")
 large_image_url = create_presigned_url("Media/Note512.png")
 
@@ -119,8 +127,7 @@ class AudioStopIntentHandler(AbstractRequestHandler):
                 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("in AudioStopIntent and request")
-        logger.info(handler_input.request_envelope.request)
+        log_request("in AudioStopIntent", handler_input.request_envelope)
         speech_text = "Goodbye"
         
         directive = StopDirective()
@@ -173,8 +180,7 @@ class PlaybackStoppedHandler(AbstractRequestHandler):
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("In PlaybackStoppedHandler and request is")
-        logger.info(handler_input.request_envelope.request)
+        log_request("In PlaybackStoppedHandler", handler_input.request_envelope)
 
         return handler_input.response_builder.response
 
@@ -231,8 +237,7 @@ class ExceptionEncounteredHandler(AbstractRequestHandler):
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("\n**************** EXCEPTION *******************")
-        logger.info(handler_input.request_envelope)
+        log_request("EXCEPTION encountered", handler_input.request_envelope, level=logging.WARNING)
         return handler_input.response_builder.response
 
 # ###################################################################
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+# Container-local cache of the persistent attributes, in front of a versioned
+# adapter (dynamodb_persistence.UpdateItemDynamoDbAdapter).
+#
+# A listening session is a burst of requests from one user, and the ones that
+# need the stored state (PlaybackStopped, the intents, PlaybackNearlyFinished
+# with tokens queued in up_next...) read the same item again and again.
+# get_attributes answers from the cache for ttl seconds after the item was
+# read or written; past that, or after max_items other users, it reads
+# DynamoDB again. Saves go straight through to DynamoDB (write-through).
+#
+# Another container may have written the item meanwhile, so a cached copy can
+# be stale. Saves are conditional on the version the attributes were read at:
+# instead of overwriting the newer item, the save fails, the item is read
+# again and the changes this request made (TrackedDict.changed_paths) are
+# applied to it and saved, conditional on that version in turn. The version
+# is the one the saving thread read: in Lambda that is the cached entry's,
+# in a threaded server (webservice.py) another request for the same user may
+# have moved the entry on since.
+#
+# A read from the cache can still be up to ttl seconds behind a write made in
+# another container, e.g. a resume right after pausing on another device
+# would start from an older offset. So it is off unless ATTRIBUTE_CACHE_TTL
+# is set (persistence_backends.py), for deployments where one user's requests
+# reach the same container; keep ttl to seconds, the cache is for bursts of
+# requests.
+#
+#   adapter = CachingPersistenceAdapter(PackedStateDynamoDbAdapter(...), ttl=60)
+
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from ask_sdk_core.attributes_manager import AbstractPersistenceAdapter
+
+import metrics
+from persistence import StaleAttributesError, TrackedDict, replay_changes
+
+logger = logging.getLogger(__name__)
+
+MAX_RETRIES = 3
+
+
+class CachingPersistenceAdapter(AbstractPersistenceAdapter):
+    """Read-through, write-through cache of a versioned adapter's attributes.
+
+    Attributes of the cached adapter (table_name, dynamodb, ...) are available
+    on this one too.
+
+    :param adapter: adapter with get_versioned() and save_versioned()
+    :param ttl: seconds a cached copy is used for
+    :param max_items: users cached before the least recently used is dropped
+    :param clock: time source, for tests
+    """
+
+    def __init__(self, adapter, ttl=60.0, max_items=1000, clock=time.monotonic):
+        self.adapter = adapter
+        self.ttl = ttl
+        self.max_items = max_items
+        self.clock = clock
+        self._entries = OrderedDict()     # partition key -> [attributes, version, expires]
+        self._lock = threading.Lock()
+        self._read = threading.local()    # .last: (partition key, version) this thread read last
+
+    def get_attributes(self, request_envelope):
+        # type: (RequestEnvelope) -> Dict[str, object]
+        key = self.adapter.partition_keygen(request_envelope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > self.clock():
+                self._entries.move_to_end(key)
+                metrics.count(metrics.ATTRIBUTE_CACHE_HITS)
+                self._read.last = (key, entry[1])
+                return copy.deepcopy(entry[0])
+        attributes, version = self.adapter.get_versioned(request_envelope)
+        self._store(key, attributes, version)
+        self._read.last = (key, version)
+        return copy.deepcopy(attributes)
+
+    def save_attributes(self, request_envelope, attributes):
+        # type: (RequestEnvelope, Dict[str, object]) -> None
+        key = self.adapter.partition_keygen(request_envelope)
+        last = getattr(self._read, "last", None)
+        version = last[1] if last is not None and last[0] == key else None
+        if version is None:
+            # not read through this cache by this thread, so the version it was read at is unknown
+            self.adapter.save_attributes(request_envelope, attributes)
+            self.invalidate(key)
+            return
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                version = self.adapter.save_versioned(request_envelope, attributes, version)
+                break
+            except StaleAttributesError:
+                metrics.count(metrics.ATTRIBUTE_CACHE_CONFLICTS)
+                if attempt == MAX_RETRIES or not isinstance(attributes, TrackedDict):
+                    self.invalidate(key)
+                    raise
+                logger.info("Attributes changed elsewhere, applying the changes to the stored ones")
+                stored, version = self.adapter.get_versioned(request_envelope)
+                changed, attributes = attributes, TrackedDict(stored)
+                replay_changes(changed, attributes)
+        self._store(key, attributes, version)
+        self._read.last = (key, version)
+
+    def delete_attributes(self, request_envelope):
+        # type: (RequestEnvelope) -> None
+        self.adapter.delete_attributes(request_envelope)
+        self.invalidate(self.adapter.partition_keygen(request_envelope))
+
+    def invalidate(self, key):
+        # type: (str) -> None
+        """Forget the cached attributes for a partition key, e.g. after writing the item directly."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, key, attributes, version):
+        entry = [copy.deepcopy(attributes), version, self.clock() + self.ttl]
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current[1] > version:
+                # a concurrent request in this container already stored a newer version
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def __getattr__(self, name):
+        if name.startswith("_") or name == "adapter":
+            raise AttributeError(name)
+        return getattr(self.adapter, name)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# attribute_cache.CachingPersistenceAdapter in front of the packed DynamoDB
+# adapter, on local_dynamodb.py.
+#
+# First two "containers" (two caches on one table) are checked to keep each
+# other's writes: A reads, B saves a new offset, A saves a track change from
+# its now stale copy. Without versions A's packed position overwrites B's
+# offset; with them A's save is refused, A reads the item again and saves its
+# change on top.
+#
+# Then a burst of requests from one user that need the stored state goes
+# through lambda_handler with and without the cache, counting the GetItem
+# calls. --dynamodb-ms adds a delay to every table call, to stand in for the
+# network round trip to a real table.
+#
+#   python benchmarks/bench_attribute_cache.py --dynamodb-ms 4
+
+import argparse
+import time
+
+import common  # sets up sys.path and dummy AWS settings
+
+import lambda_function
+from attribute_cache import CachingPersistenceAdapter
+from check_persistence import envelope
+from dynamodb_persistence import PackedStateDynamoDbAdapter
+from local_dynamodb import LocalDynamoDbResource
+from persistence import TrackedDict
+from stream_token import encode_token
+
+
+def adapter_on(resource):
+    return PackedStateDynamoDbAdapter(table_name="cache", create_table=False, dynamodb_resource=resource)
+
+
+def two_containers(cached):
+    resource = LocalDynamoDbResource()
+    first, second = adapter_on(resource), adapter_on(resource)
+    if cached:
+        first, second = CachingPersistenceAdapter(first), CachingPersistenceAdapter(second)
+    user = envelope(common.USER_ID)
+    first.save_attributes(user, {"track_number": 1, "playback_settings": {
+        "token": encode_token(1), "offset_in_milliseconds": 0, "url": None, "next_stream_enqueued": False}})
+
+    attributes = TrackedDict(first.get_attributes(user))
+    stopped = TrackedDict(second.get_attributes(user))
+    stopped["playback_settings"]["offset_in_milliseconds"] = 95000
+    second.save_attributes(user, stopped)
+    attributes["track_number"] = 2
+    attributes["playback_settings"]["token"] = encode_token(2)
+    first.save_attributes(user, attributes)
+    return adapter_on(resource).get_attributes(user)
+
+
+def with_delay(table, seconds):
+    for name in ("get_item", "put_item", "update_item", "delete_item"):
+        operation = getattr(table, name)
+
+        def delayed(*args, _operation=operation, **kwargs):
+            time.sleep(seconds)
+            return _operation(*args, **kwargs)
+        setattr(table, name, delayed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent attribute cache benchmark")
+    parser.add_argument("--dynamodb-ms", type=float, default=0.0)
+    parser.add_argument("--bursts", type=int, default=200)
+    args = parser.parse_args()
+
+    for cached in (False, True):
+        stored = two_containers(cached)
+        settings = stored["playback_settings"]
+        print("two containers, {:<14} track {} offset {}".format(
+            "with versions:" if cached else "no versions:", stored["track_number"], settings["offset_in_milliseconds"]))
+        if cached:
+            assert stored["track_number"] == 2 and settings["offset_in_milliseconds"] == 95000, stored
+
+    common.use_local_backends(lambda_function)
+    burst = [common.intent_request("AMAZON.NextIntent"), common.intent_request("AMAZON.NextIntent"),
+             common.intent_request("AMAZON.PauseIntent"), common.intent_request("AMAZON.ResumeIntent"),
+             common.intent_request("AMAZON.PreviousIntent"), common.intent_request("AMAZON.LoopOnIntent")]
+    print("\n{:<10} {:>12} {:>12} {:>12}".format("cache", "request us", "GetItem", "UpdateItem"))
+    for cached in (False, True):
+        resource = LocalDynamoDbResource()
+        table = resource.Table(lambda_function.persistence_adapter.table_name)
+        with_delay(table, args.dynamodb_ms / 1e3)
+        adapter = adapter_on(resource)
+        adapter.table_name = table.name
+        if cached:
+            adapter = CachingPersistenceAdapter(adapter)
+        lambda_function.persistence_adapter._adapter = adapter
+        start = time.perf_counter()
+        for _ in range(args.bursts):
+            for event in burst:
+                lambda_function.lambda_handler(event, None)
+        elapsed = time.perf_counter() - start
+        requests = args.bursts * len(burst)
+        operations = [operation[0] for operation in table.operations]
+        print("{:<10} {:>12.0f} {:>12.2f} {:>12.2f}".format(
+            "on" if cached else "off", elapsed / requests * 1e6,
+            operations.count("get_item") / float(requests), operations.count("update_item") / float(requests)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+# Cold start: each sample imports lambda_function in a fresh interpreter, the
+# way a new Lambda container does, then handles a first LaunchRequest against
+# an in-memory DynamoDB table (local_dynamodb.py), which includes whatever
+# init work was deferred to the first request.
+#
+# Reports import (init) time, first request time and process wall time per
+# sample, plus a python -X importtime breakdown of the slowest imports.
+# Compare the import time with the init budget with --budget-ms, the exit
+# status is 1 if the median is over it.
+#
+#   python benchmarks/bench_cold_start.py --samples 20 --budget-ms 250
+#   python benchmarks/bench_cold_start.py --json > cold_start.json
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import common  # sets up sys.path and dummy AWS settings
+
+SAMPLE = r"""
+import json, time
+start = time.perf_counter()
+import lambda_function
+imported = time.perf_counter()
+
+def local_adapter():
+    import persistence_backends
+    from local_dynamodb import LocalDynamoDbResource
+    return persistence_backends.create_dynamodb_adapter(LocalDynamoDbResource())
+
+lambda_function.persistence_adapter._factory = local_adapter
+import common
+event = common.envelope({"type": "LaunchRequest"})
+first = time.perf_counter()
+lambda_function.lambda_handler(event, None)
+done = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1e3, "first_request_ms": (done - first) * 1e3}))
+"""
+
+
+def run_sample():
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([common.PART2_DIR, os.path.dirname(__file__)]))
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable, "-c", SAMPLE], cwd=common.PART2_DIR, env=env)
+    wall = (time.perf_counter() - start) * 1e3
+    result = json.loads(output.decode("utf-8").splitlines()[-1])
+    result["process_ms"] = wall
+    return result
+
+
+def import_breakdown(top):
+    """Slowest imports of lambda_function from python -X importtime.
+
+    :return: (direct imports by cumulative time, all modules by self time), in ms
+    """
+    env = dict(os.environ, PYTHONPATH=common.PART2_DIR)
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import lambda_function"],
+                               cwd=common.PART2_DIR, env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE, check=True)
+    rows = []
+    for line in completed.stderr.decode("utf-8").splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), depth, int(self_us) / 1e3, int(cumulative_us) / 1e3))
+
+    # children are listed before their parent, so the depth 1 rows between the
+    # previous top level import (site etc.) and lambda_function are its imports
+    direct = []
+    for name, depth, self_ms, cumulative_ms in rows:
+        if depth == 0:
+            if name == "lambda_function":
+                break
+            direct = []
+        elif depth == 1:
+            direct.append((name, cumulative_ms))
+    direct.sort(key=lambda row: -row[1])
+    by_self = sorted(((name, self_ms) for name, _, self_ms, _ in rows), key=lambda row: -row[1])
+    return direct[:top], by_self[:top]
+
+
+def summary(values):
+    values = sorted(values)
+    return {
+        "min": values[0],
+        "p50": statistics.median(values),
+        "p95": values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))],
+        "max": values[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="lambda_function cold start benchmark")
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15, help="imports to list in the breakdown")
+    parser.add_argument("--budget-ms", type=float, default=None, help="init budget for the median import time")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    samples = [run_sample() for _ in range(args.samples)]
+    direct, by_self = import_breakdown(args.top)
+    results = {
+        "python": sys.version.split()[0],
+        "samples": args.samples,
+        "import_ms": summary([sample["import_ms"] for sample in samples]),
+        "first_request_ms": summary([sample["first_request_ms"] for sample in samples]),
+        "process_ms": summary([sample["process_ms"] for sample in samples]),
+        "direct_imports_ms": direct,
+        "slowest_modules_ms": by_self,
+        "budget_ms": args.budget_ms,
+    }
+    over_budget = args.budget_ms is not None and results["import_ms"]["p50"] > args.budget_ms
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("{} samples, Python {}\n".format(args.samples, results["python"]))
+        print("{:<20} {:>9} {:>9} {:>9} {:>9}".format("ms", "min", "p50", "p95", "max"))
+        for key in ("import_ms", "first_request_ms", "process_ms"):
+            row = results[key]
+            print("{:<20} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+                key[:-3], row["min"], row["p50"], row["p95"], row["max"]))
+        print("\nimports of lambda_function, cumulative ms")
+        for name, ms in direct:
+            print("  {:<50} {:>8.1f}".format(name, ms))
+        print("\nslowest modules, self ms")
+        for name, ms in by_self:
+            print("  {:<50} {:>8.1f}".format(name, ms))
+        if args.budget_ms is not None:
+            print("\ninit budget {:.0f} ms: {}".format(args.budget_ms, "OVER" if over_budget else "ok"))
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+# Request logging cost: logger.info(request_envelope) (what the handlers used
+# to do) against skill_logging.log_request, when the record is emitted, when
+# it is sampled out and when the logger level is above INFO. Records go to a
+# handler writing to os.devnull.
+#
+#   python benchmarks/bench_logging.py --iterations 20000
+
+import argparse
+import json
+import logging
+import os
+import time
+
+import common  # sets up sys.path and dummy AWS settings
+from ask_sdk_core.serialize import DefaultSerializer
+from ask_sdk_model import RequestEnvelope
+
+import skill_logging
+from stream_token import encode_token
+
+
+def per_call_us(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request logging benchmark")
+    parser.add_argument("--iterations", type=int, default=10000)
+    args = parser.parse_args()
+
+    logger = logging.getLogger("bench_logging")
+    logger.propagate = False
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    logger.addHandler(handler)
+
+    event = common.sample_requests(encode_token(1))["PlaybackStopped"]
+    request_envelope = DefaultSerializer().deserialize(json.dumps(event), RequestEnvelope)
+    request_type = event["request"]["type"]
+    full = lambda: logger.info(request_envelope)
+    summary = lambda: skill_logging.log_request(logger, "In PlaybackStoppedHandler", request_envelope)
+
+    print("full envelope: {} bytes, summary: {} bytes\n".format(
+        len(str(request_envelope)),
+        len(str(skill_logging.RequestSummary("In PlaybackStoppedHandler", request_envelope)))))
+    print("{:<36} {:>12} {:>12}".format("", "envelope us", "summary us"))
+    logger.setLevel(logging.INFO)
+    skill_logging.SAMPLE_RATES[request_type] = 1.0
+    print("{:<36} {:>12.2f} {:>12.2f}".format("emitted", per_call_us(full, args.iterations),
+                                              per_call_us(summary, args.iterations)))
+    skill_logging.SAMPLE_RATES[request_type] = 0.01
+    print("{:<36} {:>12} {:>12.2f}".format("sampled at 1%", "-", per_call_us(summary, args.iterations)))
+    logger.setLevel(logging.WARNING)
+    print("{:<36} {:>12.2f} {:>12.2f}".format("logger level WARNING", per_call_us(full, args.iterations),
+                                              per_call_us(summary, args.iterations)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+# Overhead of the metrics.py instrumentation: the replay corpus from
+# bench_replay.py with metrics turned off and on (lines written to
+# os.devnull), per request type, plus the cost of the individual pieces.
+#
+#   python benchmarks/bench_metrics.py --iterations 2000
+
+import argparse
+import time
+
+import common  # sets up sys.path and dummy AWS settings
+
+import lambda_function
+import metrics
+from bench_replay import load_corpus, replay
+
+
+def mean_us(values):
+    return sum(values) / len(values) * 1e6
+
+
+def per_call_us(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def timed_block():
+    with metrics.timed(metrics.PRESIGN_TIME):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Metrics instrumentation overhead")
+    parser.add_argument("--corpus", help="JSONL file of request envelopes, default: synthetic requests")
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    common.use_local_backends(lambda_function)
+    corpus = load_corpus(args.corpus)
+    replay(corpus, 10)
+
+    # alternate off/on runs so drift over time affects both alike
+    off = {name: [] for name in corpus}
+    on = {name: [] for name in corpus}
+    for _ in range(4):
+        for enabled, results in ((False, off), (True, on)):
+            metrics.ENABLED = enabled
+            for name, values in replay(corpus, args.iterations // 4).items():
+                results[name].extend(values)
+
+    print("{:<36} {:>10} {:>10} {:>10}".format("request", "off us", "on us", "overhead"))
+    for name in corpus:
+        print("{:<36} {:>10.1f} {:>10.1f} {:>+10.1f}".format(
+            name, mean_us(off[name]), mean_us(on[name]), mean_us(on[name]) - mean_us(off[name])))
+
+    iterations = args.iterations * 10
+    metrics.begin("benchmark")
+    print("\ntimed() block in an invocation  {:>8.2f} us".format(per_call_us(timed_block, iterations)))
+    metrics.discard()
+    print("timed() block outside           {:>8.2f} us".format(per_call_us(timed_block, iterations)))
+
+    def begin_end():
+        metrics.begin("AMAZON.NextIntent")
+        timed_block()
+        metrics.end()
+    print("begin + timed() + end           {:>8.2f} us".format(per_call_us(begin_end, iterations)))
+
+
+if __name__ == "__main__":
+    main()
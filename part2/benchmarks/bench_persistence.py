@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+# Latency and throughput of the persistence backends side by side (see
+# persistence_backends.py): a get, a save of one changed field as the
+# interceptors do it, a full save for a new user, get+save pairs from several
+# threads at once, and a whole AMAZON.NextIntent through lambda_handler.
+#
+# DynamoDB runs against local_dynamodb.py here, so its numbers are the
+# adapter's own cost (serializing, the packed state) without the network
+# round trip a real table adds, a few milliseconds per call.
+#
+#   python benchmarks/bench_persistence.py --threads 1 4 8
+
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+
+import common  # sets up sys.path and dummy AWS settings
+
+import lambda_function
+from check_persistence import ATTRIBUTES, check, copy_of, envelope, local_adapters
+from persistence import TrackedDict
+
+
+def percentiles_us(func, iterations):
+    timings = []
+    for number in range(iterations):
+        start = time.perf_counter()
+        func(number)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1e6, timings[int(len(timings) * 0.99)] * 1e6
+
+
+def throughput(adapter, threads, seconds):
+    """get+save pairs per second from threads threads, each with its own users."""
+    done = [0] * threads
+    stop = time.perf_counter() + seconds
+
+    def work(number):
+        users = [envelope("amzn1.ask.account.LOAD{}x{}".format(number, user)) for user in range(50)]
+        for user in users:
+            adapter.save_attributes(user, copy_of(ATTRIBUTES))
+        count = 0
+        while time.perf_counter() < stop:
+            user = users[count % len(users)]
+            attributes = TrackedDict(adapter.get_attributes(user))
+            attributes["playback_settings"]["offset_in_milliseconds"] = count
+            adapter.save_attributes(user, attributes)
+            count += 1
+        done[number] = count
+    workers = [threading.Thread(target=work, args=(number,)) for number in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(done) / float(seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistence backend benchmark")
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    common.use_local_backends(lambda_function)
+    directory = tempfile.mkdtemp()
+    try:
+        print("{:<20} {:>15} {:>15} {:>15} {:>11}  {}".format(
+            "backend", "get us p50/99", "save us p50/99", "new us p50/99", "request us",
+            "  ".join("{} thr/s".format(threads) for threads in args.threads)))
+        for label, adapter in local_adapters(directory):
+            check(adapter)
+            user = envelope(common.USER_ID)
+            adapter.save_attributes(user, copy_of(ATTRIBUTES))
+            get = percentiles_us(lambda number: adapter.get_attributes(user), args.iterations)
+            loaded = [TrackedDict(adapter.get_attributes(user)) for _ in range(args.iterations)]
+
+            def save(number):
+                loaded[number]["playback_settings"]["offset_in_milliseconds"] = number + 1
+                adapter.save_attributes(user, loaded[number])
+            changed = percentiles_us(save, args.iterations)
+            new_users = [envelope("amzn1.ask.account.NEW{}".format(number)) for number in range(args.iterations)]
+            new = percentiles_us(lambda number: adapter.save_attributes(new_users[number], copy_of(ATTRIBUTES)),
+                                 args.iterations)
+
+            lambda_function.persistence_adapter._adapter = adapter
+            event = common.intent_request("AMAZON.NextIntent")
+            request = percentiles_us(lambda number: lambda_function.lambda_handler(event, None),
+                                     args.iterations // 5)
+            rates = [throughput(adapter, threads, args.seconds) for threads in args.threads]
+            print("{:<20} {:>15} {:>15} {:>15} {:>11.0f}  {}".format(
+                label, "{:.0f}/{:.0f}".format(*get), "{:.0f}/{:.0f}".format(*changed),
+                "{:.0f}/{:.0f}".format(*new), request[0],
+                "  ".join("{:>{}.0f}".format(rate, len("{} thr/s".format(threads)))
+                          for rate, threads in zip(rates, args.threads))))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
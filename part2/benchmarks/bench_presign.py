@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+# Microbenchmark for presigned URL generation.
+# Compares building a new S3 client for every call (the old behaviour) with
+# the shared client from utils.get_s3_client(), the offline sigv4.py signer
+# and the URL cache on top.
+# Signing is local so no network access is needed, dummy credentials are
+# used when none are set.
+#
+#   python benchmarks/bench_presign.py --iterations 500
+
+import argparse
+import os
+import time
+
+import common  # sets up sys.path and dummy AWS settings
+import boto3
+import utils
+
+KEY = "Media/RemovalMen_TellMomma.mp3"
+
+
+def per_call_client(object_name):
+    # what create_presigned_url used to do on every call
+    s3_client = boto3.client('s3',
+                             region_name=os.environ.get('S3_PERSISTENCE_REGION'),
+                             config=boto3.session.Config(signature_version='s3v4',s3={'addressing_style': 'path'}))
+    return s3_client.generate_presigned_url('get_object',
+                                            Params={'Bucket': os.environ.get('S3_PERSISTENCE_BUCKET'),
+                                                    'Key': object_name},
+                                            ExpiresIn=utils.URL_EXPIRES_IN)
+
+
+def measure(name, func, iterations):
+    func(KEY)  # warm up, the first call pays for loading botocore data files
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(KEY)
+    elapsed = time.perf_counter() - start
+    print("{:<28} {:>10.1f} us/call".format(name, elapsed / iterations * 1e6))
+    return elapsed / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    before = measure("client per call", per_call_client, args.iterations)
+    after = measure("shared client", lambda key: utils.create_presigned_url(key, use_cache=False), args.iterations)
+    offline = measure("offline signer", lambda key: utils.create_presigned_url(key, use_cache=False, offline_signer=True), args.iterations)
+    utils.clear_url_cache()
+    measure("shared client + URL cache", utils.create_presigned_url, args.iterations)
+    print("shared client speed-up: {:.1f}x".format(before / after))
+    print("offline signer speed-up over shared client: {:.1f}x".format(after / offline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+# Next-track lookup for PlaybackNearlyFinished with play_queue.PlayQueue:
+# following(), playing through the queue, per catalog size and queue kind,
+# then the whole NearlyFinished request through lambda_handler.
+#
+#   python benchmarks/bench_queue.py --sizes 100 50000
+
+import argparse
+import time
+
+import common  # sets up sys.path and dummy AWS settings
+
+import lambda_function
+from catalog import Catalog
+from play_queue import PlayQueue, REPEAT_ALL, REPEAT_OFF, REPEAT_ONE
+from stream_token import encode_token
+
+
+def per_call_us(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def synthetic_catalog(size):
+    return Catalog([{"genre": "Rock", "title": "Track {}".format(index), "artist": "Artist",
+                     "url": "Media/track{}.mp3".format(index)} for index in range(size)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play queue next-track benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10000, 50000])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    kinds = [("catalog", None, REPEAT_ALL), ("shuffle", 12345, REPEAT_ALL),
+             ("shuffle, repeat off", 12345, REPEAT_OFF), ("repeat one", None, REPEAT_ONE)]
+    print("{:>8} {:<20} {:>12}".format("tracks", "queue", "following us"))
+    for size in args.sizes:
+        catalog = synthetic_catalog(size)
+        for name, seed, repeat in kinds:
+            queue = PlayQueue(catalog, seed, repeat)
+            # a playlist playing through: each lookup is for the track the last one returned
+            state = {"index": queue.first_index()}
+
+            def next_track():
+                entry = queue.following(state["index"])
+                state["index"] = entry.index if entry is not None else queue.first_index()
+            following_us = per_call_us(next_track, args.iterations)
+            print("{:>8} {:<20} {:>12.2f}".format(size, name, following_us))
+
+    common.use_local_backends(lambda_function)
+    handler = lambda_function.lambda_handler
+    events = [common.audio_player_request("PlaybackNearlyFinished", encode_token(index), 170000)
+              for index in range(len(lambda_function.catalog))]
+    position = iter(range(10 ** 9))
+    request_us = per_call_us(lambda: handler(events[next(position) % len(events)], None), args.iterations // 4)
+    print("\nPlaybackNearlyFinished through lambda_handler: {:.1f} us".format(request_us))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+# Offline replay of request envelopes through lambda_function.lambda_handler,
+# with S3 and DynamoDB replaced by the in-process stand-ins in local_s3.py and
+# local_dynamodb.py, so the skill's own latency can be measured without
+# deploying.
+#
+# The corpus is either the synthetic envelopes from common.sample_requests
+# (every request type part2 handles) or recorded envelopes, one JSON request
+# envelope per line. Requests are replayed round robin, so the stored state
+# moves on between them as it would for a real user.
+#
+# Per request type it reports p50/p95/p99 latency, throughput and memory
+# allocated per request (tracemalloc, measured in a separate pass because
+# tracing slows everything down). --json writes the results with stable keys
+# for diffing, --compare prints the p50 change against an earlier --json file.
+#
+#   python benchmarks/bench_replay.py --iterations 2000 --json replay.json
+#   python benchmarks/bench_replay.py --corpus recorded.jsonl --compare replay.json
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import common  # sets up sys.path and dummy AWS settings
+
+import lambda_function
+from manifest import iter_jsonl
+from stream_token import encode_token
+
+
+def request_name(event):
+    """Request type, with the intent name for IntentRequests."""
+    request = event["request"]
+    if request["type"] == "IntentRequest":
+        return "IntentRequest:" + request["intent"]["name"]
+    return request["type"]
+
+
+def load_corpus(path):
+    """OrderedDict of request name -> list of envelopes."""
+    if path is None:
+        events = common.sample_requests(encode_token(1)).values()
+    else:
+        with open(path, "rb") as corpus_file:
+            events = list(iter_jsonl(corpus_file))
+    corpus = OrderedDict()
+    for event in events:
+        corpus.setdefault(request_name(event), []).append(event)
+    return corpus
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def replay(corpus, iterations):
+    """Per request name, the latency of each call in seconds."""
+    handler = lambda_function.lambda_handler
+    clock = time.perf_counter
+    timings = OrderedDict((name, []) for name in corpus)
+    for iteration in range(iterations):
+        for name, events in corpus.items():
+            event = events[iteration % len(events)]
+            start = clock()
+            handler(event, None)
+            timings[name].append(clock() - start)
+    return timings
+
+
+def allocations(corpus, iterations):
+    """Per request name, (mean peak bytes, mean bytes still allocated after the call)."""
+    handler = lambda_function.lambda_handler
+    results = OrderedDict((name, [0, 0]) for name in corpus)
+    tracemalloc.start()
+    try:
+        for iteration in range(iterations):
+            for name, events in corpus.items():
+                event = events[iteration % len(events)]
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                handler(event, None)
+                current, peak = tracemalloc.get_traced_memory()
+                results[name][0] += peak - before
+                results[name][1] += current - before
+    finally:
+        tracemalloc.stop()
+    return OrderedDict((name, (peak / iterations, retained / iterations))
+                       for name, (peak, retained) in results.items())
+
+
+def summarize(timings, allocated):
+    results = OrderedDict()
+    for name, values in timings.items():
+        values = sorted(values)
+        total = sum(values)
+        results[name] = OrderedDict([
+            ("requests", len(values)),
+            ("p50_us", percentile(values, 0.50) * 1e6),
+            ("p95_us", percentile(values, 0.95) * 1e6),
+            ("p99_us", percentile(values, 0.99) * 1e6),
+            ("mean_us", total / len(values) * 1e6),
+            ("throughput_rps", len(values) / total),
+            ("alloc_peak_bytes", allocated[name][0]),
+            ("alloc_retained_bytes", allocated[name][1]),
+        ])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay request envelopes through lambda_handler")
+    parser.add_argument("--corpus", help="JSONL file of request envelopes, default: synthetic requests")
+    parser.add_argument("--iterations", type=int, default=1000, help="passes over the corpus")
+    parser.add_argument("--alloc-iterations", type=int, default=50, help="passes with tracemalloc on")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="earlier --json results to compare p50 against")
+    args = parser.parse_args()
+
+    s3_client, table = common.use_local_backends(lambda_function)
+    corpus = load_corpus(args.corpus)
+    replay(corpus, 10)  # warm up: lazy imports, catalog indexes, URL cache
+    timings = replay(corpus, args.iterations)
+    allocated = allocations(corpus, args.alloc_iterations)
+    results = summarize(timings, allocated)
+
+    total_requests = sum(row["requests"] for row in results.values())
+    total_seconds = sum(sum(values) for values in timings.values())
+    report = OrderedDict([
+        ("python", sys.version.split()[0]),
+        ("corpus", args.corpus or "synthetic"),
+        ("iterations", args.iterations),
+        ("throughput_rps", total_requests / total_seconds),
+        ("s3_calls", dict(s3_client.calls)),
+        ("dynamodb_calls", len(table.operations)),
+        ("requests", results),
+    ])
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)["requests"]
+
+    print("{:<36} {:>9} {:>9} {:>9} {:>10} {:>10} {:>8}".format(
+        "request", "p50 us", "p95 us", "p99 us", "req/s", "peak KiB", "vs base"))
+    for name, row in results.items():
+        change = ""
+        if baseline is not None and name in baseline:
+            change = "{:+.0%}".format(row["p50_us"] / baseline[name]["p50_us"] - 1)
+        print("{:<36} {:>9.1f} {:>9.1f} {:>9.1f} {:>10.0f} {:>10.1f} {:>8}".format(
+            name, row["p50_us"], row["p95_us"], row["p99_us"], row["throughput_rps"],
+            row["alloc_peak_bytes"] / 1024, change))
+    print("\noverall {:.0f} req/s".format(report["throughput_rps"]))
+
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(report, out, indent=2)
+            out.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+# Response build + serialize cost for the play responses: building the card
+# and Play directive from ask_sdk_model objects (as the handlers used to)
+# against response_templates. Both go through ResponseFactory and the SDK's
+# DefaultSerializer, and the script checks they produce the same JSON.
+#
+#   python benchmarks/bench_responses.py --iterations 20000
+
+import argparse
+import json
+import time
+
+import common  # sets up sys.path and dummy AWS settings
+from ask_sdk_core.response_helper import ResponseFactory
+from ask_sdk_core.serialize import DefaultSerializer
+from ask_sdk_model.interfaces.audioplayer import (
+    PlayDirective, PlayBehavior, AudioItem, Stream)
+from ask_sdk_model.ui import StandardCard, Image
+
+from catalog import get_catalog
+from response_templates import track_card, play_directive
+from stream_token import encode_token
+
+SMALL_IMAGE_URL = "https://benchmark-bucket.s3.amazonaws.com/Media/Note108.png"
+LARGE_IMAGE_URL = "https://benchmark-bucket.s3.amazonaws.com/Media/Note512.png"
+AUDIO_URL = "https://benchmark-bucket.s3.amazonaws.com/Media/track.mp3"
+
+# name -> (speech, play behaviour, offset, with expected_previous_token)
+CASES = {
+    "PlayAudio (REPLACE_ALL)": ("Playing track", PlayBehavior.REPLACE_ALL, 0, False),
+    "Resume (offset)": (None, PlayBehavior.REPLACE_ALL, 42000, False),
+    "NearlyFinished (ENQUEUE)": (None, PlayBehavior.ENQUEUE, 0, True),
+    "Next (REPLACE_ALL)": ("Playing next track", PlayBehavior.REPLACE_ALL, 0, False),
+}
+
+
+def build_with_models(track, speech, play_behavior, offset, previous_token):
+    builder = ResponseFactory()
+    if speech:
+        builder.speak(speech)
+    builder.set_card(StandardCard(title=track.title, text=track.artist,
+                                  image=Image(small_image_url=SMALL_IMAGE_URL,
+                                              large_image_url=LARGE_IMAGE_URL)))
+    builder.add_directive(PlayDirective(
+        play_behavior=play_behavior,
+        audio_item=AudioItem(stream=Stream(token=encode_token(track.index),
+                                           url=AUDIO_URL,
+                                           offset_in_milliseconds=offset,
+                                           expected_previous_token=previous_token))))
+    return builder.set_should_end_session(True).response
+
+
+def build_with_templates(track, speech, play_behavior, offset, previous_token):
+    builder = ResponseFactory()
+    if speech:
+        builder.speak(speech)
+    builder.set_card(track_card(track, SMALL_IMAGE_URL, LARGE_IMAGE_URL))
+    builder.add_directive(play_directive(play_behavior, encode_token(track.index), AUDIO_URL,
+                                         offset, expected_previous_token=previous_token))
+    return builder.set_should_end_session(True).response
+
+
+def per_call_us(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play response build + serialize benchmark")
+    parser.add_argument("--iterations", type=int, default=10000)
+    args = parser.parse_args()
+
+    serializer = DefaultSerializer()
+    track = get_catalog()[1]
+
+    print("{:<28} {:>12} {:>12} {:>8}".format("response", "models us", "templates us", "speedup"))
+    for name, (speech, play_behavior, offset, with_previous) in CASES.items():
+        previous_token = encode_token(0) if with_previous else None
+        arguments = (track, speech, play_behavior, offset, previous_token)
+        expected = json.dumps(serializer.serialize(build_with_models(*arguments)), sort_keys=True)
+        actual = json.dumps(serializer.serialize(build_with_templates(*arguments)), sort_keys=True)
+        assert actual == expected, name
+
+        models = per_call_us(lambda: serializer.serialize(build_with_models(*arguments)), args.iterations)
+        templates = per_call_us(lambda: serializer.serialize(build_with_templates(*arguments)), args.iterations)
+        print("{:<28} {:>12.2f} {:>12.2f} {:>7.1f}x".format(name, models, templates, models / templates))
+
+
+if __name__ == "__main__":
+    main()
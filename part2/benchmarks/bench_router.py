@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+# Dispatch cost per request type: the SkillBuilder's linear can_handle chain
+# (every handler in registration order until one matches) against
+# router.RequestRouter's dictionary lookup. Only handler selection is timed,
+# not the handlers themselves.
+#
+#   python benchmarks/bench_router.py --iterations 20000
+
+import argparse
+import json
+import time
+
+import common  # sets up sys.path and dummy AWS settings
+from ask_sdk_core.attributes_manager import AttributesManager
+from ask_sdk_core.handler_input import HandlerInput
+from ask_sdk_core.serialize import DefaultSerializer
+from ask_sdk_model import RequestEnvelope
+
+import lambda_function
+from stream_token import encode_token
+
+
+def linear_dispatch(handlers, handler_input):
+    for handler in handlers:
+        if handler.can_handle(handler_input):
+            return handler
+    return None
+
+
+def per_call_us(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request dispatch benchmark")
+    parser.add_argument("--iterations", type=int, default=10000)
+    args = parser.parse_args()
+
+    serializer = DefaultSerializer()
+    router = lambda_function.router
+    handlers = router.handlers
+
+    print("{:<24} {:>12} {:>12} {:>8}".format("request", "linear us", "router us", "speedup"))
+    for name, event in common.sample_requests(encode_token(1)).items():
+        request_envelope = serializer.deserialize(json.dumps(event), RequestEnvelope)
+        handler_input = HandlerInput(request_envelope=request_envelope,
+                                     attributes_manager=AttributesManager(request_envelope=request_envelope))
+        expected = linear_dispatch(handlers, handler_input)
+        assert router.route(handler_input) is expected, name
+
+        linear = per_call_us(lambda: linear_dispatch(handlers, handler_input), args.iterations)
+        routed = per_call_us(lambda: router.route(handler_input), args.iterations)
+        print("{:<24} {:>12.2f} {:>12.2f} {:>7.1f}x".format(name, linear, routed, linear / routed))
+
+
+if __name__ == "__main__":
+    main()
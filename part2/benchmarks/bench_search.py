@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+# Voice search cost against catalog size: building search.SearchIndex once
+# per container (time and memory) and the latency of exact, misheard
+# (one letter off) and missing lookups on synthetic catalogs with a few
+# thousand distinct words. "right" is the share of lookups that found the
+# genre/artist/title the query was made from.
+#
+#   python benchmarks/bench_search.py --sizes 1000 50000
+
+import argparse
+import random
+import time
+import tracemalloc
+
+import common  # sets up sys.path and dummy AWS settings
+from catalog import Catalog
+from search import SearchIndex, normalize
+
+
+def synthetic_catalog(size, rng):
+    syllables = ["ba", "do", "ki", "lu", "mo", "ne", "ra", "si", "tu", "vo", "ze", "ha", "pi", "go"]
+    words = sorted({"".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(4000)})
+    genres = words[:40]
+    artists = [" ".join(rng.sample(words, 2)) for _ in range(max(1, size // 10))]
+    tracks = [{"genre": rng.choice(genres), "artist": rng.choice(artists),
+               "title": " ".join(rng.sample(words, rng.randint(1, 4))),
+               "url": "Media/track{}.mp3".format(index)} for index in range(size)]
+    return Catalog(tracks), tracks
+
+
+def misheard(text, rng):
+    words = text.split()
+    position = rng.randrange(len(words))
+    word = words[position]
+    if len(word) >= 4:
+        letter = rng.randrange(len(word))
+        words[position] = word[:letter] + "x" + word[letter + 1:]
+    return " ".join(words)
+
+
+def percentiles_us(func, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2] * 1e6, timings[int(len(timings) * 0.99)] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Voice search benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    print("{:>8} {:>9} {:>9} {:<9} {:>9} {:>9} {:>8}".format(
+        "tracks", "build ms", "index MB", "lookup", "p50 us", "p99 us", "right"))
+    for size in args.sizes:
+        catalog, tracks = synthetic_catalog(size, rng)
+        start = time.perf_counter()
+        SearchIndex(catalog)
+        build_ms = (time.perf_counter() - start) * 1e3
+        # again with tracemalloc on, which slows the build down
+        tracemalloc.start()
+        index = SearchIndex(catalog)
+        index_mb = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        tracemalloc.stop()
+
+        sample = [rng.choice(tracks) for _ in range(args.queries)]
+        lookups = [
+            ("artist", [track["artist"] for track in sample], "artist", "artist"),
+            ("title", [track["title"] for track in sample], "title", "title"),
+            ("misheard", [misheard(track["artist"], rng) for track in sample], "artist", "artist"),
+            ("any", [track["title"] for track in sample], None, "title"),
+            ("missing", ["qqqq wwww" for _ in sample], None, None),
+        ]
+        for row, (name, queries, field, expected) in enumerate(lookups):
+            right = 0
+            for query, track in zip(queries, sample):
+                match = index.search(query, field)
+                if expected is None:
+                    right += match is None
+                else:
+                    right += match is not None and normalize(match.display) == normalize(track[expected])
+            p50, p99 = percentiles_us(lambda query: index.search(query, field), queries)
+            print("{:>8} {:>9} {:>9} {:<9} {:>9.1f} {:>9.1f} {:>7.0%}".format(
+                size if row == 0 else "", "{:.0f}".format(build_ms) if row == 0 else "",
+                "{:.1f}".format(index_mb) if row == 0 else "", name, p50, p99, right / len(queries)))
+
+
+if __name__ == "__main__":
+    main()
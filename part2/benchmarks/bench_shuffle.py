@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+# Shuffle order cost against catalog size: next/previous with shuffle.Shuffle
+# (seed only, nothing built per catalog) against shuffling a list of the
+# catalog indexes and storing it, and what each adds to the DynamoDB item.
+#
+#   python benchmarks/bench_shuffle.py --sizes 100 10000 50000
+
+import argparse
+import random
+import time
+
+import common  # sets up sys.path and dummy AWS settings
+from local_dynamodb import item_size
+from shuffle import Shuffle, new_seed
+
+
+def per_call_us(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shuffle order benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    print("{:>8} {:>12} {:>14} {:>14} {:>12} {:>14}".format(
+        "tracks", "next us", "new order us", "list order us", "seed bytes", "list bytes"))
+    for size in args.sizes:
+        seed = new_seed()
+        order = Shuffle(seed, size)
+        indexes = [random.randrange(size) for _ in range(1024)]
+        position = iter(range(10 ** 9))
+        next_us = per_call_us(lambda: order.next_index(indexes[next(position) & 1023]), args.iterations)
+        new_order_us = per_call_us(lambda: Shuffle(seed, size), args.iterations)
+
+        def shuffled_list():
+            permutation = list(range(size))
+            random.Random(seed).shuffle(permutation)
+            return permutation
+        list_us = per_call_us(shuffled_list, max(1, args.iterations // size))
+
+        seed_bytes = item_size({"shuffle_seed": seed})
+        list_bytes = item_size({"shuffle_order": shuffled_list(), "cursor": 0})
+        print("{:>8} {:>12.2f} {:>14.2f} {:>14.1f} {:>12} {:>14}".format(
+            size, next_us, new_order_us, list_us, seed_bytes, list_bytes))
+
+
+if __name__ == "__main__":
+    main()
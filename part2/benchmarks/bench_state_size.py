@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# Stored item size and DynamoDB capacity units for the playback state, in the
+# nested map layout older versions wrote (with the presigned URL) against the
+# packed layout of playback_state.py, plus the time to encode and decode it.
+#
+# Sizes follow DynamoDB's billing rules (local_dynamodb.item_size). A read
+# costs one RCU per started 4 KB (half for eventually consistent reads), a
+# write one WCU per started 1 KB; an UpdateItem is charged on the larger of
+# the item before and after, which for these items is the item itself.
+#
+# The presigned URL is made with a session token like the Lambda role's
+# (--session-token-length, the real ones are around a thousand characters),
+# and so is most of the old layout's size.
+#
+#   python benchmarks/bench_state_size.py
+
+import argparse
+import math
+import time
+
+import common  # sets up sys.path and dummy AWS settings
+
+import boto3
+
+from catalog import get_catalog
+from local_dynamodb import item_size
+from play_queue import PlayQueue, REPEAT_OFF
+from playback_state import decode_attributes, encode_attributes
+from search import get_search_index
+
+# a real one is "amzn1.ask.account." and about 200 more characters
+USER_ID = "amzn1.ask.account." + "A" * 207
+
+
+def presigned_url(key, session_token_length):
+    client = boto3.client("s3", region_name="eu-west-1", aws_access_key_id="ASIA" + "X" * 16,
+                          aws_secret_access_key="s" * 40, aws_session_token="t" * session_token_length)
+    return client.generate_presigned_url("get_object", Params={"Bucket": "skill-media-bucket", "Key": key},
+                                         ExpiresIn=60)
+
+
+def states(session_token_length):
+    catalog = get_catalog()
+    track = catalog[1]
+    url = presigned_url(track.url, session_token_length)
+    queue = PlayQueue(catalog)
+    yield "new user", {"track_number": 0, "playback_settings": {
+        "token": None, "offset_in_milliseconds": 0, "url": None, "next_stream_enqueued": False}}
+    yield "playing", {"track_number": 1, "playback_settings": {
+        "token": queue.token(1), "offset_in_milliseconds": 171234, "url": url, "next_stream_enqueued": True}}
+    genre = get_search_index(catalog).search(track.genre, "genre")
+    queue = PlayQueue(catalog, 0x5c3a91f2, REPEAT_OFF, up_next=[0, 2, 3], filter_key=genre.key)
+    attributes = {"track_number": 1, "shuffle_seed": queue.seed, "playback_settings": {
+        "token": queue.token(1), "offset_in_milliseconds": 171234, "url": url, "next_stream_enqueued": True}}
+    queue.save(attributes)
+    yield "shuffle, filter, queue", attributes
+
+
+def per_call_us(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Playback state item size benchmark")
+    parser.add_argument("--session-token-length", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    print("{:<24} {:<7} {:>7} {:>9} {:>9} {:>5} {:>10} {:>10}".format(
+        "state", "layout", "bytes", "RCU", "RCU ev.", "WCU", "encode us", "decode us"))
+    for name, attributes in states(args.session_token_length):
+        packed = encode_attributes(attributes)
+        # the same attributes back, less the URL
+        expected = dict(attributes, playback_settings=dict(attributes["playback_settings"], url=None))
+        assert decode_attributes(packed) == expected, name
+        layouts = [
+            ("map", attributes, None, None),
+            ("packed", packed,
+             per_call_us(lambda: encode_attributes(attributes), args.iterations),
+             per_call_us(lambda: decode_attributes(packed), args.iterations)),
+        ]
+        for row, (layout, stored, encode_us, decode_us) in enumerate(layouts):
+            size = item_size({"id": USER_ID, "attributes": stored})
+            print("{:<24} {:<7} {:>7} {:>9} {:>9} {:>5} {:>10} {:>10}".format(
+                name if row == 0 else "", layout, size, math.ceil(size / 4096.0),
+                math.ceil(size / 4096.0) / 2.0, math.ceil(size / 1024.0),
+                "" if encode_us is None else "{:.1f}".format(encode_us),
+                "" if decode_us is None else "{:.1f}".format(decode_us)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+# Conformance check for the persistence backends: what the skill needs from
+# an AbstractPersistenceAdapter, run against each of them.
+#
+#   - an unknown user gets {}
+#   - saved attributes come back equal, with ints (not Decimals) and nested
+#     maps and lists intact, and different users don't see each other's
+#   - what get_attributes returns is a copy: changing it changes nothing
+#     stored until it is saved
+#   - a TrackedDict as the interceptors save it (an UpdateItem for DynamoDB)
+#     and a full save of a plain dict both end up stored
+#   - delete removes the attributes, deleting an unknown user is fine
+#   - saves from several threads at once are all kept
+#   - an envelope without a user id raises PersistenceException
+#
+# Without arguments the DynamoDB adapters run against local_dynamodb.py and
+# SQLite against a temporary file. --backend checks a backend as
+# persistence_backends.py configures it from the environment instead.
+#
+#   python benchmarks/check_persistence.py
+#   PERSISTENCE_SQLITE_PATH=/tmp/t.sqlite3 python benchmarks/check_persistence.py --backend sqlite
+
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+
+import common  # sets up sys.path and dummy AWS settings
+
+from ask_sdk_core.exceptions import PersistenceException
+from ask_sdk_model import Context, RequestEnvelope
+from ask_sdk_model.interfaces.system import SystemState
+from ask_sdk_model.user import User
+
+import persistence_backends
+from local_dynamodb import LocalDynamoDbResource
+from persistence import TrackedDict
+
+ATTRIBUTES = {
+    "track_number": 3,
+    "shuffle_seed": 1548465650,
+    "playback_settings": {"token": "1.3.s5c4b8af2-r1.pLjwUqkZTOwX", "offset_in_milliseconds": 171234,
+                          "url": None, "next_stream_enqueued": True, "repeat": "one", "up_next": [2, 0]},
+    "preferences": {"volume": 7, "tags": ["rock", u"été", None, False]},
+}
+
+
+def envelope(user_id):
+    return RequestEnvelope(context=Context(system=SystemState(user=User(user_id=user_id))))
+
+
+def local_adapters(directory):
+    """(label, adapter) for every backend, without AWS."""
+    from attribute_cache import CachingPersistenceAdapter
+    from dynamodb_persistence import PackedStateDynamoDbAdapter, UpdateItemDynamoDbAdapter
+    from memory_persistence import InMemoryPersistenceAdapter
+    from sqlite_persistence import SqlitePersistenceAdapter
+    return [
+        ("memory", InMemoryPersistenceAdapter()),
+        ("sqlite", SqlitePersistenceAdapter(os.path.join(directory, "check.sqlite3"))),
+        ("dynamodb (packed)", PackedStateDynamoDbAdapter(
+            table_name="check", create_table=False, dynamodb_resource=LocalDynamoDbResource())),
+        ("dynamodb (map)", UpdateItemDynamoDbAdapter(
+            table_name="check", create_table=False, dynamodb_resource=LocalDynamoDbResource())),
+        ("dynamodb (cached)", CachingPersistenceAdapter(PackedStateDynamoDbAdapter(
+            table_name="check", create_table=False, dynamodb_resource=LocalDynamoDbResource()))),
+    ]
+
+
+def copy_of(attributes):
+    return TrackedDict(attributes).to_dict() if attributes else {}
+
+
+def check(adapter):
+    """Run the checks against adapter, AssertionError on the first that fails.
+
+    :return: number of checks run
+    """
+    alice, bob = envelope("amzn1.ask.account.ALICE"), envelope("amzn1.ask.account.BOB")
+    for user in (alice, bob):
+        adapter.delete_attributes(user)
+
+    assert adapter.get_attributes(alice) == {}, "unknown user"
+
+    adapter.save_attributes(alice, copy_of(ATTRIBUTES))
+    loaded = adapter.get_attributes(alice)
+    assert loaded == ATTRIBUTES, ("round trip", loaded)
+    assert type(loaded["track_number"]) is int, ("int", type(loaded["track_number"]))
+    assert adapter.get_attributes(bob) == {}, "other user"
+
+    loaded["playback_settings"]["offset_in_milliseconds"] = 0
+    loaded["preferences"]["tags"].append("changed")
+    assert adapter.get_attributes(alice) == ATTRIBUTES, "get returns a copy"
+
+    tracked = TrackedDict(adapter.get_attributes(alice))
+    tracked["playback_settings"]["offset_in_milliseconds"] = 5000
+    tracked["track_number"] = 4
+    adapter.save_attributes(alice, tracked)
+    expected = copy_of(ATTRIBUTES)
+    expected["playback_settings"]["offset_in_milliseconds"] = 5000
+    expected["track_number"] = 4
+    assert adapter.get_attributes(alice) == expected, "TrackedDict state change"
+
+    tracked = TrackedDict(adapter.get_attributes(alice))
+    tracked["preferences"]["volume"] = 3
+    del tracked["shuffle_seed"]
+    adapter.save_attributes(alice, tracked)
+    expected["preferences"]["volume"] = 3
+    del expected["shuffle_seed"]
+    assert adapter.get_attributes(alice) == expected, "TrackedDict other change and delete"
+
+    adapter.save_attributes(alice, {"preferences": {"volume": 1}})
+    assert adapter.get_attributes(alice) == {"preferences": {"volume": 1}}, "full save replaces"
+
+    adapter.save_attributes(bob, copy_of(ATTRIBUTES))
+    adapter.delete_attributes(alice)
+    assert adapter.get_attributes(alice) == {}, "delete"
+    assert adapter.get_attributes(bob) == ATTRIBUTES, "delete leaves other users"
+    adapter.delete_attributes(alice)
+
+    users = [envelope("amzn1.ask.account.THREAD{}".format(number)) for number in range(8)]
+    errors = []
+
+    def save_many(number):
+        try:
+            for offset in range(20):
+                attributes = copy_of(ATTRIBUTES)
+                attributes["playback_settings"]["offset_in_milliseconds"] = number * 1000 + offset
+                adapter.save_attributes(users[number], attributes)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=save_many, args=(number,)) for number in range(len(users))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, ("concurrent saves", errors)
+    for number, user in enumerate(users):
+        offset = adapter.get_attributes(user)["playback_settings"]["offset_in_milliseconds"]
+        assert offset == number * 1000 + 19, ("concurrent saves", number, offset)
+        adapter.delete_attributes(user)
+
+    try:
+        adapter.get_attributes(RequestEnvelope(context=Context(system=SystemState())))
+    except PersistenceException:
+        pass
+    else:
+        raise AssertionError("no user id")
+    adapter.delete_attributes(bob)
+    return 10
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistence backend conformance check")
+    parser.add_argument("--backend", choices=persistence_backends.backend_names(),
+                        help="check this backend as configured by the environment")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        if args.backend:
+            adapters = [(args.backend, persistence_backends.create_persistence_adapter(args.backend))]
+        else:
+            adapters = local_adapters(directory)
+        for label, adapter in adapters:
+            print("{:<20} {} checks passed".format(label, check(adapter)))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
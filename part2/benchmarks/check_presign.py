@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# Equivalence check for the offline signer (sigv4.py): presign_get_url gives
+# the same URL, character for character, as botocore's
+# generate_presigned_url('get_object', ...) with the client utils.py uses, at
+# the same clock and credentials, for
+#
+#   - a regional bucket (eu-west-1) and us-east-1, on the endpoint botocore
+#     picks for each
+#   - long-term credentials and temporary ones with a session token
+#   - plain keys, keys with reserved characters (space + & = ? # % ! ' ( ) *
+#     ~ and doubled slashes) and unicode keys
+#   - a time of day and the last second before midnight, so the date in the
+#     scope and the timestamp both come from the fixed clock
+#
+# botocore's clock is fixed by replacing botocore.auth.get_current_datetime. No
+# network access is needed: signing is local.
+#
+#   python benchmarks/check_presign.py
+
+import argparse
+import datetime
+from unittest import mock
+
+import common  # sets up sys.path and dummy AWS settings
+import boto3
+import botocore.auth
+
+import sigv4
+import utils
+
+REGIONS = ("eu-west-1", "us-east-1")
+CREDENTIALS = {
+    "long-term": ("AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY", None),
+    "session token": ("ASIAEXAMPLE", "je7MtGbClwBF/2Zp9Utk/h3yCo8nvbEXAMPLEKEY",
+                      "FwoGZXIvYXdzEBYaDH+/session=token&with/reserved+characters=="),
+}
+BUCKET = "alexa-hosted-audio-bucket"
+KEYS = (
+    "Media/RemovalMen_TellMomma.mp3",
+    "Media/Note108.png",
+    "Media/My Song (live) + more & less = 100% ?#!'*.mp3",
+    "Media//double~slash/track.mp3",
+    "Media/Sigur Rós/Hoppípolla.mp3",
+    "Media/日本語/曲.mp3",
+    "Media/emoji \U0001f3b5.mp3",
+)
+TIMES = (
+    datetime.datetime(2026, 4, 20, 12, 0, 0, tzinfo=datetime.timezone.utc),
+    datetime.datetime(2026, 12, 31, 23, 59, 59, tzinfo=datetime.timezone.utc),
+)
+
+
+def botocore_url(region, access_key, secret_key, token, key, now):
+    s3_client = boto3.client('s3', region_name=region, aws_access_key_id=access_key,
+                             aws_secret_access_key=secret_key, aws_session_token=token,
+                             config=boto3.session.Config(signature_version='s3v4',
+                                                         s3={'addressing_style': 'path'}))
+    with mock.patch.object(botocore.auth, "get_current_datetime", lambda: now.replace(tzinfo=None)):
+        url = s3_client.generate_presigned_url('get_object', Params={'Bucket': BUCKET, 'Key': key},
+                                               ExpiresIn=utils.URL_EXPIRES_IN)
+    return s3_client.meta.endpoint_url, url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline signer equivalence check")
+    parser.parse_args()
+
+    for region in REGIONS:
+        for label, (access_key, secret_key, token) in CREDENTIALS.items():
+            checks = 0
+            for key in KEYS:
+                for now in TIMES:
+                    endpoint_url, expected = botocore_url(region, access_key, secret_key, token, key, now)
+                    url = sigv4.presign_get_url(endpoint_url, region, BUCKET, key, access_key, secret_key,
+                                                token=token, expires_in=utils.URL_EXPIRES_IN, now=now)
+                    assert url == expected, "{} {} {!r}:\n  {}\n  {}".format(region, label, key, url, expected)
+                    checks += 1
+            print("{:<10} {:<14} {} URLs match".format(region, label, checks))
+
+
+if __name__ == "__main__":
+    main()
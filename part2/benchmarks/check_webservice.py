@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+# The web service (webservice.py) over HTTP on localhost, with requests
+# signed by local_alexa.py and the S3/DynamoDB stand-ins behind it:
+#
+#   - signed requests are answered like lambda_handler answers the event
+#   - requests with a changed body, a bad or missing signature, a certificate
+#     URL off s3.amazonaws.com/echo.api, a chain that doesn't lead to a
+#     trusted root, or an old timestamp get 400
+#   - the chain is downloaded once for all of them, and again after the
+#     cache's ttl
+#
+# then times the signature check with the validated key cached and without
+# (download and path validation each time, as ask_sdk_webservice_support
+# does bar the download), and requests over HTTP with --threads clients.
+#
+#   python benchmarks/check_webservice.py --requests 500 --threads 8
+
+import argparse
+import datetime
+import http.client
+import json
+import threading
+import time
+
+import common  # sets up sys.path and dummy AWS settings
+
+import lambda_function
+import webservice
+from local_alexa import LocalAlexa
+from request_verifier import RequestVerifier, VerificationError
+from stream_token import encode_token
+
+
+def post(port, headers, body):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        connection.request("POST", "/", body=body, headers=headers)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def rejected(verifier, headers, body):
+    try:
+        verifier.verify(headers.get("SignatureCertChainUrl"), headers.get("Signature-256"), body, json.loads(body))
+    except VerificationError:
+        return True
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Web service check")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    common.use_local_backends(lambda_function)
+    alexa, stranger = LocalAlexa(), LocalAlexa()
+    webservice.verifier = RequestVerifier(trust_roots=[alexa.root], fetch=alexa.fetch)
+    server = webservice.PooledWSGIServer(("127.0.0.1", 0), threads=args.threads)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    requests = common.sample_requests(encode_token(1))
+    for name in ("LaunchRequest", "PlayAudio", "Next", "PlaybackNearlyFinished", "PlaybackStopped"):
+        headers, body = alexa.sign(requests[name])
+        status, response = post(port, headers, body)
+        assert status == 200, (name, status)
+        assert json.loads(response)["response"] is not None, name
+
+    headers, body = alexa.sign(requests["PlayAudio"])
+    old_headers, old_body = alexa.sign(requests["PlayAudio"], datetime.datetime.now(
+        datetime.timezone.utc) - datetime.timedelta(minutes=10))
+    stranger_headers, stranger_body = stranger.sign(requests["PlayAudio"])
+    bad = {
+        "changed body": (headers, body.replace(b"PlayAudio", b"PlayAudjo")),
+        "other signature": (dict(headers, **{"Signature-256": stranger_headers["Signature-256"]}), body),
+        "no signature": ({"SignatureCertChainUrl": headers["SignatureCertChainUrl"]}, body),
+        "http URL": (dict(headers, SignatureCertChainUrl="http://s3.amazonaws.com/echo.api/cert.pem"), body),
+        "other host": (dict(headers, SignatureCertChainUrl="https://s3.example.com/echo.api/cert.pem"), body),
+        "path escape": (dict(headers, SignatureCertChainUrl="https://s3.amazonaws.com/echo.api/../cert.pem"), body),
+        "untrusted chain": (dict(stranger_headers, SignatureCertChainUrl=
+                                 "https://s3.amazonaws.com/echo.api/stranger.pem"), stranger_body),
+        "old timestamp": (old_headers, old_body),
+    }
+    webservice.verifier.fetch = lambda url: (stranger if "stranger" in url else alexa).fetch(url)
+    for label, (bad_headers, bad_body) in bad.items():
+        status, _ = post(port, bad_headers, bad_body)
+        assert status == 400, (label, status)
+    assert alexa.downloads == 1, alexa.downloads
+    print("{} signed requests answered, {} bad ones rejected, chain downloaded {} time".format(
+        5, len(bad), alexa.downloads))
+
+    now = [time.time()]
+    verifier = RequestVerifier(trust_roots=[alexa.root], fetch=alexa.fetch, ttl=60, clock=lambda: now[0])
+    downloads = alexa.downloads
+    for _ in range(3):
+        assert not rejected(verifier, headers, body)
+    now[0] += 61
+    headers, body = alexa.sign(requests["PlayAudio"], datetime.datetime.fromtimestamp(now[0], datetime.timezone.utc))
+    assert not rejected(verifier, headers, body)
+    assert alexa.downloads - downloads == 2, alexa.downloads - downloads
+    print("cache ttl 60 s: downloaded again after it")
+
+    headers, body = alexa.sign(requests["Next"])
+    event = json.loads(body)
+    samples = 200
+    start = time.perf_counter()
+    for _ in range(samples):
+        RequestVerifier(trust_roots=[alexa.root], fetch=alexa.fetch).verify(
+            headers["SignatureCertChainUrl"], headers["Signature-256"], body, event)
+    uncached = (time.perf_counter() - start) / samples
+    start = time.perf_counter()
+    for _ in range(samples * 10):
+        verifier.verify(headers["SignatureCertChainUrl"], headers["Signature-256"], body, event)
+    cached = (time.perf_counter() - start) / (samples * 10)
+    print("verify: {:.0f} us uncached (local download), {:.0f} us cached".format(uncached * 1e6, cached * 1e6))
+
+    signed = [alexa.sign(requests[name]) for name in ("Next", "Previous", "PlaybackStopped", "PlaybackStarted")]
+    elapsed = []
+    lock = threading.Lock()
+
+    def client(count):
+        for number in range(count):
+            request_start = time.perf_counter()
+            status, _ = post(port, *signed[number % len(signed)])
+            with lock:
+                elapsed.append(time.perf_counter() - request_start)
+            assert status == 200, status
+    clients = [threading.Thread(target=client, args=(args.requests // args.threads,)) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    wall = time.perf_counter() - start
+    elapsed.sort()
+    print("HTTP, {} clients: {:.0f} requests/s, p50 {:.1f} ms, p99 {:.1f} ms".format(
+        args.threads, len(elapsed) / wall, elapsed[len(elapsed) // 2] * 1e3, elapsed[len(elapsed) * 99 // 100] * 1e3))
+
+    server.shutdown()
+    alexa.close()
+    stranger.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+# Shared setup for the benchmark scripts: puts part2 on sys.path, sets dummy
+# AWS settings so lambda_function imports without a real environment, and
+# builds synthetic request envelopes for every request type the skill handles.
+
+import logging
+import os
+import sys
+
+PART2_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PART2_DIR not in sys.path:
+    sys.path.insert(0, PART2_DIR)
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-west-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'AKIDEXAMPLE')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY')
+os.environ.setdefault('S3_PERSISTENCE_REGION', 'eu-west-1')
+os.environ.setdefault('S3_PERSISTENCE_BUCKET', 'benchmark-bucket')
+os.environ.setdefault('DYNAMODB_PERSISTENCE_REGION', 'eu-west-1')
+os.environ.setdefault('DYNAMODB_PERSISTENCE_TABLE_NAME', 'benchmark-table')
+os.environ.setdefault('STREAM_TOKEN_SECRET', 'benchmark-stream-token-secret')
+
+# the skill's warnings (e.g. System.ExceptionEncountered) would otherwise go
+# to stderr through logging's last resort handler
+logging.getLogger().addHandler(logging.NullHandler())
+
+USER_ID = "amzn1.ask.account.BENCHMARK"
+
+
+def use_local_backends(lambda_function):
+    """Point an imported lambda_function at in-process S3 and DynamoDB stand-ins.
+
+    Call before the first request. Uses the private hooks of utils and
+    persistence.LazyPersistenceAdapter, nothing in the skill needs them.
+    The metrics lines go to os.devnull rather than flooding the output.
+
+    :return: (local_s3.LocalS3Client, local_dynamodb.LocalTable)
+    """
+    import metrics
+    import persistence_backends
+    import utils
+    from local_dynamodb import LocalDynamoDbResource
+    from local_s3 import LocalS3Client
+
+    region = os.environ['S3_PERSISTENCE_REGION']
+    s3_client = LocalS3Client(region_name=region)
+    utils.clear_url_cache()
+    utils._s3_client_entry = ((region, os.environ['S3_PERSISTENCE_BUCKET']), s3_client, None)
+    metrics.set_output(open(os.devnull, 'w'))
+
+    resource = LocalDynamoDbResource()
+    adapter = persistence_backends.create_dynamodb_adapter(resource)
+    lambda_function.persistence_adapter._adapter = adapter
+    return s3_client, resource.Table(adapter.table_name)
+
+
+def envelope(request, user_id=USER_ID, token=None, offset=0):
+    """Request envelope dict as sent by Alexa.
+
+    :param request: the "request" object, requestId/timestamp/locale are added
+    :param token: AudioPlayer token in the request context
+    """
+    return {
+        "version": "1.0",
+        "session": {
+            "new": True,
+            "sessionId": "amzn1.echo-api.session.benchmark",
+            "application": {"applicationId": "amzn1.ask.skill.benchmark"},
+            "user": {"userId": user_id},
+        },
+        "context": {
+            "System": {
+                "application": {"applicationId": "amzn1.ask.skill.benchmark"},
+                "user": {"userId": user_id},
+                "device": {"deviceId": "amzn1.ask.device.benchmark",
+                           "supportedInterfaces": {"AudioPlayer": {}}},
+                "apiEndpoint": "https://api.eu.amazonalexa.com",
+            },
+            "AudioPlayer": {"playerActivity": "PLAYING", "token": token, "offsetInMilliseconds": offset},
+        },
+        "request": dict({"requestId": "amzn1.echo-api.request.benchmark",
+                         "timestamp": "2021-04-20T12:00:00Z",
+                         "locale": "en-GB"}, **request),
+    }
+
+
+def intent_request(name, token=None, slots=None, user_id=USER_ID):
+    return envelope({"type": "IntentRequest",
+                     "intent": {"name": name, "confirmationStatus": "NONE", "slots": slots or {}}},
+                    user_id=user_id, token=token)
+
+
+def slot(name, value):
+    """Slots dict with one filled slot, for intent_request."""
+    return {name: {"name": name, "value": value, "confirmationStatus": "NONE"}}
+
+
+def audio_player_request(event, token, offset=0, user_id=USER_ID, **extra):
+    request = {"type": "AudioPlayer." + event, "token": token, "offsetInMilliseconds": offset}
+    request.update(extra)
+    return envelope(request, user_id=user_id, token=token, offset=offset)
+
+
+def sample_requests(token):
+    """One envelope per request type part2 handles, keyed by a short name.
+
+    :param token: stream token to use for AudioPlayer requests and context
+    """
+    return {
+        "LaunchRequest": envelope({"type": "LaunchRequest"}),
+        "PlayAudio": intent_request("PlayAudio"),
+        "Resume": intent_request("AMAZON.ResumeIntent", token),
+        "Next": intent_request("AMAZON.NextIntent", token),
+        "Previous": intent_request("AMAZON.PreviousIntent", token),
+        "StartOver": intent_request("AMAZON.StartOverIntent", token),
+        "Pause": intent_request("AMAZON.PauseIntent", token),
+        "ShuffleOn": intent_request("AMAZON.ShuffleOnIntent", token),
+        "ShuffleOff": intent_request("AMAZON.ShuffleOffIntent", token),
+        "LoopOn": intent_request("AMAZON.LoopOnIntent", token),
+        "LoopOff": intent_request("AMAZON.LoopOffIntent", token),
+        "Repeat": intent_request("AMAZON.RepeatIntent", token),
+        "PlayGenre": intent_request("PlayGenreIntent", token, slot("genre", "some blues")),
+        "PlayArtist": intent_request("PlayArtistIntent", token, slot("artist", "mandy montgomery")),
+        "PlayTitle": intent_request("PlayTitleIntent", token, slot("title", "tumbling dice")),
+        "PlayNext": intent_request("PlayNextIntent", token, slot("title", "tell momma")),
+        "Help": intent_request("AMAZON.HelpIntent"),
+        "Fallback": intent_request("AMAZON.FallbackIntent"),
+        "PlaybackStarted": audio_player_request("PlaybackStarted", token),
+        "PlaybackNearlyFinished": audio_player_request("PlaybackNearlyFinished", token, 170000),
+        "PlaybackFinished": audio_player_request("PlaybackFinished", token, 180000),
+        "PlaybackStopped": audio_player_request("PlaybackStopped", token, 42000),
+        "PlaybackFailed": audio_player_request(
+            "PlaybackFailed", token,
+            error={"type": "MEDIA_ERROR_SERVICE_UNAVAILABLE", "message": "benchmark"},
+            currentPlaybackState={"token": token, "offsetInMilliseconds": 0, "playerActivity": "PLAYING"}),
+        "ExceptionEncountered": envelope({"type": "System.ExceptionEncountered",
+                                          "error": {"type": "INVALID_RESPONSE", "message": "benchmark"},
+                                          "cause": {"requestId": "amzn1.echo-api.request.benchmark"}}),
+        "SessionEnded": envelope({"type": "SessionEndedRequest", "reason": "USER_INITIATED"}),
+    }
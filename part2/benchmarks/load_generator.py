@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+
+# Synthetic listeners for end-to-end throughput tests: thousands of virtual
+# devices, each a user of its own playing through the catalog the way an Echo
+# does, against lambda_handler in this process or the web service
+# (webservice.py) over HTTP, for a fixed time.
+#
+# A device follows the responses it gets: PlaybackStarted after a Play,
+# PlaybackStopped after a Stop or when a Play replaces the playing track,
+# and when it is playing it either
+#   - plays on: PlaybackNearlyFinished, the ENQUEUE'd track, PlaybackFinished,
+#     PlaybackStarted of the next one
+#   - pauses, and later resumes (or starts over with PlayAudio)
+#   - skips: a burst of 2-4 AMAZON.NextIntent or 1-2 AMAZON.PreviousIntent
+#   - stops
+# in the proportions of --mix. Between a request and its follow-ups there is
+# no pause; between scenarios a device waits --think-ms on average
+# (exponentially distributed), 0 for as fast as --concurrency allows.
+#
+# Targets:
+#   lambda       lambda_handler with the S3 and DynamoDB stand-ins
+#   http         without --url, webservice.py on localhost with the same
+#                stand-ins, requests signed by local_alexa.py (--no-verify to
+#                skip that); the server shares this process and its GIL, so
+#                this is a lower bound
+#   http --url   a running web service, requests unsigned (start it with
+#                ALEXA_VERIFY=0); for several cores, e.g.
+#                ALEXA_VERIFY=0 PERSISTENCE_BACKEND=sqlite python webservice.py --workers 4
+#
+# Requests are sent by --concurrency threads, or with --asyncio by that many
+# coroutines (HTTP with asyncio streams; lambda_handler in a thread pool).
+# The first --warmup seconds are not counted. Reports sustained requests/s,
+# errors (exceptions, HTTP errors, the skill's "Sorry, I had trouble"
+# answer), unexpected responses (no Play for PlayAudio/Resume, no Stop for
+# Pause/Stop) and latency percentiles per request.
+#
+#   python benchmarks/load_generator.py --devices 2000 --concurrency 8 --duration 30
+#   python benchmarks/load_generator.py --target http --asyncio --concurrency 64 --think-ms 500
+#   python benchmarks/load_generator.py --target http --url http://127.0.0.1:8080/ --json load.json
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import heapq
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+
+import common  # sets up sys.path and dummy AWS settings
+
+import lambda_function
+from bench_replay import percentile
+
+IDLE, PLAYING, PAUSED = "idle", "playing", "paused"
+PLAY, STOP = "AudioPlayer.Play", "AudioPlayer.Stop"
+
+INTENTS = {"PlayAudio": "PlayAudio", "Resume": "AMAZON.ResumeIntent", "Next": "AMAZON.NextIntent",
+           "Previous": "AMAZON.PreviousIntent", "Pause": "AMAZON.PauseIntent", "Stop": "AMAZON.StopIntent"}
+EVENTS = {"Started": "PlaybackStarted", "Stopped": "PlaybackStopped",
+          "NearlyFinished": "PlaybackNearlyFinished", "Finished": "PlaybackFinished"}
+EXPECTED = {"PlayAudio": PLAY, "Resume": PLAY, "Pause": STOP, "Stop": STOP}
+ERROR_SPEECH = "Sorry, I had trouble"
+TRACK_MS = 180000
+DEFAULT_MIX = "play=6,pause=2,skip=1,stop=1"
+
+
+class VirtualDevice(object):
+    """One listener's device: its AudioPlayer state and the requests it sends next.
+
+    :param number: makes the user id
+    :param mix: scenario -> weight, for a playing device
+    :param rng: random.Random of its own
+    """
+
+    def __init__(self, number, mix, rng):
+        self.user_id = "amzn1.ask.account.LOAD{:06d}".format(number)
+        self.mix = mix
+        self.rng = rng
+        self.state = IDLE
+        self.token = None
+        self.offset = 0
+        self.pending = collections.deque()   # (action, token, offset) to send next
+        self._sent_token = None
+
+    def next_request(self):
+        # type: () -> Tuple[str, Dict[str, Any]]
+        """(action, envelope) of the next request."""
+        if not self.pending:
+            self._plan()
+        action, token, offset = self.pending.popleft()
+        self._sent_token = token
+        if action in INTENTS:
+            event = common.intent_request(INTENTS[action], token, user_id=self.user_id)
+            event["context"]["AudioPlayer"]["offsetInMilliseconds"] = offset
+        else:
+            event = common.audio_player_request(EVENTS[action], token, offset, user_id=self.user_id)
+        return action, event
+
+    def _plan(self):
+        if self.state == IDLE:
+            self.pending.append(("PlayAudio", self.token, 0))
+            return
+        if self.state == PAUSED:
+            self.pending.append(("Resume" if self.rng.random() < 0.8 else "PlayAudio", self.token, self.offset))
+            return
+        self.offset = self.rng.randint(1000, TRACK_MS - 15000)
+        scenario = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        if scenario == "play":
+            self.pending.append(("NearlyFinished", self.token, TRACK_MS - 10000))
+        elif scenario == "skip":
+            action, count = ("Next", self.rng.randint(2, 4)) if self.rng.random() < 0.7 else \
+                ("Previous", self.rng.randint(1, 2))
+            self.pending.extend((action, self.token, self.offset) for _ in range(count))
+        else:
+            self.pending.append(("Pause" if scenario == "pause" else "Stop", self.token, self.offset))
+
+    def handle(self, action, response):
+        # type: (str, Dict[str, Any]) -> Optional[str]
+        """Follow the response to action; a description if it isn't what Alexa would expect, else None."""
+        body = (response or {}).get("response") or {}
+        speech = (body.get("outputSpeech") or {}).get("ssml", "")
+        if ERROR_SPEECH in speech:
+            raise RuntimeError("skill error response")
+        directives = {directive.get("type"): directive for directive in body.get("directives") or []}
+        play = directives.get(PLAY)
+        if action in EXPECTED and EXPECTED[action] not in directives:
+            return "{} without {}".format(action, EXPECTED[action])
+        if play is not None:
+            token = play["audioItem"]["stream"]["token"]
+            if play.get("playBehavior") == "ENQUEUE":
+                # the queued track starts when this one finishes
+                self.pending.appendleft(("Started", token, 0))
+                self.pending.appendleft(("Finished", self.token, TRACK_MS))
+            else:
+                # the new track replaces the playing one; the rest of a burst
+                # is said while it plays
+                self.pending = collections.deque((queued[0], token, 0) if queued[0] in INTENTS else queued
+                                                 for queued in self.pending)
+                self.pending.appendleft(("Started", token, play["audioItem"]["stream"]["offsetInMilliseconds"]))
+                if self.state == PLAYING:
+                    self.pending.appendleft(("Stopped", self.token, self.offset))
+                self.state = PAUSED
+            return None
+        if STOP in directives:
+            if self.state == PLAYING:
+                self.pending.appendleft(("Stopped", self.token, self.offset))
+            self.state = PAUSED
+        elif action == "NearlyFinished":
+            # end of the queue: it plays out and stops
+            self.pending.appendleft(("Finished", self.token, TRACK_MS))
+        elif action == "Started":
+            self.state = PLAYING
+            self.token = self._sent_token
+            self.offset = 0
+        elif action == "Finished" and not any(queued[0] == "Started" for queued in self.pending):
+            self.state = IDLE
+        return None
+
+
+class LambdaTarget(object):
+    """lambda_handler in this process."""
+
+    def send(self, event):
+        return lambda_function.lambda_handler(event, None)
+
+
+class HttpTarget(object):
+    """POSTs to a web service, signing the requests with sign(event) -> (headers, body) if given."""
+
+    def __init__(self, url, sign=None):
+        parsed = urllib.parse.urlparse(url)
+        self.host, self.port, self.path = parsed.hostname, parsed.port or 80, parsed.path or "/"
+        self.sign = sign
+
+    def _request(self, event):
+        if self.sign is not None:
+            return self.sign(event)
+        return {"Content-Type": "application/json"}, json.dumps(event).encode("utf-8")
+
+    def send(self, event):
+        headers, body = self._request(event)
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        try:
+            connection.request("POST", self.path, body=body, headers=headers)
+            response = connection.getresponse()
+            return self._parse(response.status, response.read())
+        finally:
+            connection.close()
+
+    async def send_async(self, event):
+        headers, body = self._request(event)
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            lines = ["POST {} HTTP/1.1".format(self.path), "Host: {}:{}".format(self.host, self.port),
+                     "Connection: close", "Content-Length: {}".format(len(body))]
+            lines += ["{}: {}".format(name, value) for name, value in headers.items()]
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+            status_line = await reader.readline()
+            data = await reader.read()
+        finally:
+            writer.close()
+        status = int(status_line.split()[1])
+        return self._parse(status, data.split(b"\r\n\r\n", 1)[1])
+
+    def _parse(self, status, data):
+        if status != 200:
+            raise RuntimeError("HTTP {}".format(status))
+        return json.loads(data)
+
+
+class Recorder(object):
+    """Latencies and failures per action, counted from start on."""
+
+    def __init__(self, start):
+        self.start = start
+        self.latencies = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.unexpected = collections.Counter()
+        self.samples = OrderedDict()      # failure description -> count, the first few kinds
+        self._lock = threading.Lock()
+
+    def add(self, action, started, elapsed, error=None, unexpected=None):
+        if started < self.start:
+            return
+        with self._lock:
+            self.latencies[action].append(elapsed)
+            if error is not None:
+                self.errors[action] += 1
+            if unexpected is not None:
+                self.unexpected[action] += 1
+            problem = error or unexpected
+            if problem is not None and (problem in self.samples or len(self.samples) < 10):
+                self.samples[problem] = self.samples.get(problem, 0) + 1
+
+
+def step(device, target, recorder, clock=time.perf_counter):
+    """Send the device's next request and follow the response."""
+    action, event = device.next_request()
+    started = clock()
+    try:
+        response = target.send(event)
+    except Exception as e:
+        recorder.add(action, started, clock() - started, error="{}: {}".format(type(e).__name__, e))
+        return
+    finish(device, action, response, started, clock() - started, recorder)
+
+
+def finish(device, action, response, started, elapsed, recorder):
+    try:
+        unexpected = device.handle(action, response)
+    except Exception as e:
+        recorder.add(action, started, elapsed, error="{}: {}".format(type(e).__name__, e))
+        return
+    recorder.add(action, started, elapsed, unexpected=unexpected)
+
+
+def think_time(device, think):
+    # follow-ups (lifecycle events, the rest of a burst) go straight away
+    if device.pending or not think:
+        return 0.0
+    return device.rng.expovariate(1.0 / think)
+
+
+def run_threads(devices, target, concurrency, deadline, think, recorder, clock=time.perf_counter):
+    due = [(0.0, number) for number in range(len(devices))]   # heap of (when, device number)
+    ready = threading.Condition()
+
+    def worker():
+        while True:
+            with ready:
+                while True:
+                    now = clock()
+                    if now >= deadline:
+                        return
+                    if due and due[0][0] <= now:
+                        number = heapq.heappop(due)[1]
+                        break
+                    ready.wait(min(due[0][0] if due else deadline, deadline) - now)
+            device = devices[number]
+            step(device, target, recorder)
+            with ready:
+                heapq.heappush(due, (clock() + think_time(device, think), number))
+                ready.notify()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+async def run_asyncio(devices, target, concurrency, deadline, think, recorder, clock=time.perf_counter):
+    due = [(0.0, number) for number in range(len(devices))]   # heap of (when, device number)
+    ready = asyncio.Condition()
+    executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+    loop = asyncio.get_running_loop()
+
+    async def worker():
+        while True:
+            async with ready:
+                while True:
+                    now = clock()
+                    if now >= deadline:
+                        return
+                    if due and due[0][0] <= now:
+                        number = heapq.heappop(due)[1]
+                        break
+                    try:
+                        await asyncio.wait_for(ready.wait(), min(due[0][0] if due else deadline, deadline) - now)
+                    except asyncio.TimeoutError:
+                        pass
+            device = devices[number]
+            action, event = device.next_request()
+            started = clock()
+            try:
+                if hasattr(target, "send_async"):
+                    response = await target.send_async(event)
+                else:
+                    response = await loop.run_in_executor(executor, target.send, event)
+            except Exception as e:
+                recorder.add(action, started, clock() - started, error="{}: {}".format(type(e).__name__, e))
+            else:
+                finish(device, action, response, started, clock() - started, recorder)
+            async with ready:
+                heapq.heappush(due, (clock() + think_time(device, think), number))
+                ready.notify()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    executor.shutdown()
+
+
+def summarize(recorder, seconds):
+    rows = OrderedDict()
+    everything = []
+    for action in sorted(recorder.latencies, key=lambda name: -len(recorder.latencies[name])):
+        values = sorted(recorder.latencies[action])
+        everything += values
+        rows[action] = values
+    rows["all"] = sorted(everything)
+    results = OrderedDict()
+    for action, values in rows.items():
+        errors = sum(recorder.errors.values()) if action == "all" else recorder.errors[action]
+        unexpected = sum(recorder.unexpected.values()) if action == "all" else recorder.unexpected[action]
+        results[action] = OrderedDict([
+            ("requests", len(values)),
+            ("rps", len(values) / seconds),
+            ("errors", errors),
+            ("unexpected", unexpected),
+            ("p50_ms", percentile(values, 0.50) * 1e3),
+            ("p90_ms", percentile(values, 0.90) * 1e3),
+            ("p99_ms", percentile(values, 0.99) * 1e3),
+            ("max_ms", values[-1] * 1e3),
+        ])
+    return results
+
+
+def parse_mix(text):
+    mix = OrderedDict()
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name not in ("play", "pause", "skip", "stop"):
+            raise argparse.ArgumentTypeError("unknown scenario {}".format(name))
+        mix[name] = float(weight)
+    return mix
+
+
+def local_web_service(threads, verify):
+    """Start webservice.py on localhost with the stand-ins, (url, sign, close)."""
+    import webservice
+    from local_alexa import LocalAlexa
+    from request_verifier import RequestVerifier
+    alexa = LocalAlexa() if verify else None
+    webservice.verifier = RequestVerifier(trust_roots=[alexa.root], fetch=alexa.fetch) if verify else None
+    server = webservice.PooledWSGIServer(("127.0.0.1", 0), threads=threads)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def close():
+        server.shutdown()
+        server.server_close()
+        if alexa is not None:
+            alexa.close()
+    return "http://127.0.0.1:{}/".format(server.server_port), alexa.sign if verify else None, close
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic listener load generator")
+    parser.add_argument("--target", choices=("lambda", "http"), default="lambda")
+    parser.add_argument("--url", help="web service to load, default: one started here")
+    parser.add_argument("--no-verify", action="store_true", help="local web service without signature checks")
+    parser.add_argument("--server-threads", type=int, default=16, help="threads of the local web service")
+    parser.add_argument("--devices", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight")
+    parser.add_argument("--asyncio", action="store_true", help="coroutines instead of threads")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds counted")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds before counting")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between a device's scenarios")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help="default " + DEFAULT_MIX)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    close = None
+    if args.target == "lambda" or args.url is None:
+        common.use_local_backends(lambda_function)
+    if args.target == "lambda":
+        target = LambdaTarget()
+    elif args.url is None:
+        url, sign, close = local_web_service(args.server_threads, not args.no_verify)
+        target = HttpTarget(url, sign)
+    else:
+        target = HttpTarget(args.url)
+
+    devices = [VirtualDevice(number, args.mix, random.Random(args.seed * 1000003 + number))
+               for number in range(args.devices)]
+    start = time.perf_counter()
+    recorder = Recorder(start + args.warmup)
+    deadline = start + args.warmup + args.duration
+    if args.asyncio:
+        asyncio.run(run_asyncio(devices, target, args.concurrency, deadline, args.think_ms / 1e3, recorder))
+    else:
+        run_threads(devices, target, args.concurrency, deadline, args.think_ms / 1e3, recorder)
+    if close is not None:
+        close()
+
+    results = summarize(recorder, args.duration)
+    total = results["all"]
+    print("{} target, {} {}, {} devices, {:.0f} s after {:.0f} s warm-up".format(
+        args.url or args.target, args.concurrency, "coroutines" if args.asyncio else "threads",
+        args.devices, args.duration, args.warmup))
+    print("{:.0f} requests/s sustained, errors {} ({:.2%}), unexpected {} ({:.2%})\n".format(
+        total["rps"], total["errors"], total["errors"] / max(total["requests"], 1),
+        total["unexpected"], total["unexpected"] / max(total["requests"], 1)))
+    print("{:<16} {:>9} {:>8} {:>7} {:>7} {:>8} {:>8} {:>8} {:>8}".format(
+        "request", "requests", "req/s", "errors", "unexp", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+    for action, row in results.items():
+        print("{:<16} {:>9} {:>8.0f} {:>7} {:>7} {:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f}".format(
+            action, row["requests"], row["rps"], row["errors"], row["unexpected"],
+            row["p50_ms"], row["p90_ms"], row["p99_ms"], row["max_ms"]))
+    for problem, count in recorder.samples.items():
+        print("  {} x {}".format(count, problem))
+
+    if args.json:
+        report = OrderedDict([
+            ("python", sys.version.split()[0]),
+            ("target", args.url or args.target),
+            ("concurrency", args.concurrency),
+            ("asyncio", args.asyncio),
+            ("devices", args.devices),
+            ("duration_s", args.duration),
+            ("think_ms", args.think_ms),
+            ("mix", args.mix),
+            ("requests", results),
+        ])
+        with open(args.json, "w") as out:
+            json.dump(report, out, indent=2)
+            out.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+# Indexed track catalog.
+#
+# Wraps the track list (track_info.py or an S3 manifest, see manifest.py) so
+# handlers can go from an index, an S3 key or a stream token to a track in
+# O(1), find tracks by genre or artist without scanning, and follow
+# precomputed next/previous links.
+#
+#   catalog = get_catalog()        # or LazyCatalog(), loaded on first use
+#   track = catalog[track_number]
+#   catalog[track.next_index].url
+
+import os
+import threading
+
+import track_info as trackInfo
+from manifest import load_manifest
+from stream_token import decode_token
+from utils import get_s3_client
+
+
+class Track(object):
+    """One catalog entry. __slots__ keeps large catalogs small in memory."""
+    __slots__ = ('index', 'genre', 'title', 'artist', 'url', 'next_index', 'previous_index')
+
+    def __init__(self, index, genre, title, artist, url, next_index, previous_index):
+        self.index = index
+        self.genre = genre
+        self.title = title
+        self.artist = artist
+        self.url = url
+        self.next_index = next_index
+        self.previous_index = previous_index
+
+    def __repr__(self):
+        return "Track({!r}, {!r}, {!r})".format(self.index, self.title, self.artist)
+
+
+def _normalize(text):
+    return " ".join(text.lower().split()) if text else ""
+
+
+class Catalog(object):
+    """Tracks in play order with lookup indexes.
+
+    next wraps round to the first track at the end of the catalog, previous
+    stays on the first track (same as NextPlaybackHandler/PreviousPlaybackHandler).
+
+    Tracks are created from the source the first time they are accessed, and
+    the key/genre/artist indexes are built by one pass over the source on the
+    first lookup that needs them, so a large memory-mapped manifest is not
+    decoded up front.
+
+    :param tracks: sequence (e.g. a list or manifest.TrackIndexFile) or iterable
+        of dicts with genre, title, artist and url keys
+    """
+
+    def __init__(self, tracks):
+        if not (hasattr(tracks, "__getitem__") and hasattr(tracks, "__len__")):
+            tracks = list(tracks)
+        self._source = tracks
+        self._count = len(tracks)
+        self._tracks = [None] * self._count
+        self._by_key = None
+        self._by_genre = None
+        self._by_artist = None
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        track = self._tracks[index]
+        if track is None:
+            if index < 0:
+                index += self._count
+            entry = self._source[index]
+            track = Track(index,
+                          entry.get("genre"),
+                          entry.get("title"),
+                          entry.get("artist"),
+                          entry["url"],
+                          (index + 1) % self._count,
+                          max(index - 1, 0))
+            self._tracks[index] = track
+        return track
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+    def entries(self):
+        """(index, entry dict) for every track, read from the source without creating Tracks."""
+        for index in range(self._count):
+            yield index, self._source[index]
+
+    def __contains__(self, index):
+        return isinstance(index, int) and 0 <= index < self._count
+
+    def _build_indexes(self):
+        by_key = {}
+        by_genre = {}
+        by_artist = {}
+        for index in range(self._count):
+            entry = self._source[index]
+            by_key.setdefault(entry["url"], index)
+            by_genre.setdefault(_normalize(entry.get("genre")), []).append(index)
+            by_artist.setdefault(_normalize(entry.get("artist")), []).append(index)
+        self._by_genre = by_genre
+        self._by_artist = by_artist
+        self._by_key = by_key
+
+    def by_key(self, key):
+        """Track for an S3 key (e.g. Media/RemovalMen_TellMomma.mp3), or None."""
+        if self._by_key is None:
+            self._build_indexes()
+        index = self._by_key.get(key)
+        return None if index is None else self[index]
+
+    def by_token(self, token):
+        """Track for a stream token, either a structured token or an old-style S3 key, or None."""
+        current = decode_token(token)
+        if current is not None:
+            return self[current.index] if current.index in self else None
+        return self.by_key(token) if token else None
+
+    def by_genre(self, genre):
+        """Tracks in the genre (case-insensitive), in catalog order."""
+        if self._by_key is None:
+            self._build_indexes()
+        return [self[index] for index in self._by_genre.get(_normalize(genre), ())]
+
+    def by_artist(self, artist):
+        """Tracks by the artist (case-insensitive), in catalog order."""
+        if self._by_key is None:
+            self._build_indexes()
+        return [self[index] for index in self._by_artist.get(_normalize(artist), ())]
+
+    def genres(self):
+        if self._by_key is None:
+            self._build_indexes()
+        return list(self._by_genre)
+
+    def artists(self):
+        if self._by_key is None:
+            self._build_indexes()
+        return list(self._by_artist)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Return the catalog, built once per container.
+
+    Uses the S3 manifest named by CATALOG_MANIFEST_KEY when it is set (see
+    manifest.py), otherwise the tracks in track_info.py.
+    """
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                manifest_key = os.environ.get('CATALOG_MANIFEST_KEY')
+                if manifest_key:
+                    s3_client, bucket_name = get_s3_client()
+                    _catalog = Catalog(load_manifest(s3_client, bucket_name, manifest_key))
+                else:
+                    _catalog = Catalog(trackInfo.track_info)
+    return _catalog
+
+
+class LazyCatalog(object):
+    """Catalog that is built on first use, with get_catalog().
+
+    With CATALOG_MANIFEST_KEY set, building it imports boto3 and reads the
+    manifest from S3, so doing that at import would put it back into the
+    Lambda init time (and before the web service forks its workers).
+    Everything else is passed on to the catalog.
+
+    :param factory: callable returning the real catalog
+    """
+
+    def __init__(self, factory=get_catalog):
+        self._factory = factory
+        self._catalog = None
+
+    @property
+    def catalog(self):
+        """The real catalog, built on first access."""
+        if self._catalog is None:
+            self._catalog = self._factory()
+        return self._catalog
+
+    def __len__(self):
+        return len(self.catalog)
+
+    def __getitem__(self, index):
+        return self.catalog[index]
+
+    def __iter__(self):
+        return iter(self.catalog)
+
+    def __contains__(self, index):
+        return index in self.catalog
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.catalog, name)
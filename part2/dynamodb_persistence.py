@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+# DynamoDB persistence adapter that writes only the changed attributes.
+#
+# Kept apart from persistence.py because importing ask_sdk_dynamodb.adapter
+# imports boto3, see persistence.LazyPersistenceAdapter.
+#
+# Every write also adds one to the item's top level "version" number (the
+# PlaybackStopped fast path's too), so a reader can tell whether the item
+# changed since it read it: get_versioned() returns the attributes with their
+# version, and save_versioned() only writes if the version is still the same
+# (see attribute_cache.py). Items written before versions have none, which
+# counts as version 0.
+
+from ask_sdk_core.exceptions import PersistenceException
+from ask_sdk_dynamodb.adapter import DynamoDbAdapter
+from botocore.exceptions import ClientError
+
+from persistence import VERSION_NAME, StaleAttributesError, TrackedDict, build_update_expression
+from playback_state import POSITION, SETTINGS, STATE_KEYS, decode_attributes, encode_attributes, plain_numbers
+
+
+class UpdateItemDynamoDbAdapter(DynamoDbAdapter):
+    """DynamoDbAdapter that writes only the changed fields with UpdateItem.
+
+    When the attributes are a TrackedDict for an existing item, save_attributes
+    sends SET/REMOVE actions for the changed paths, so e.g. PlaybackStopped
+    only writes playback_settings.offset_in_milliseconds and two concurrent
+    AudioPlayer events touching different fields don't overwrite each other.
+    Anything else (first save for a new user, plain dicts) replaces the whole
+    attribute map, also with UpdateItem so the version carries on.
+    """
+
+    def get_attributes(self, request_envelope):
+        # type: (RequestEnvelope) -> Dict[str, object]
+        return self.get_versioned(request_envelope)[0]
+
+    def get_versioned(self, request_envelope):
+        # type: (RequestEnvelope) -> Tuple[Dict[str, object], int]
+        """The attributes and the item's version, ({}, 0) for a new user."""
+        try:
+            table = self.dynamodb.Table(self.table_name)
+            partition_key_val = self.partition_keygen(request_envelope)
+            item = table.get_item(
+                Key={self.partition_key_name: partition_key_val}, ConsistentRead=True).get("Item")
+        except PersistenceException:
+            raise
+        except Exception as e:
+            raise PersistenceException(
+                "Failed to retrieve attributes from DynamoDb table. Exception of "
+                "type {} occurred: {}".format(type(e).__name__, str(e)))
+        if item is None:
+            return {}, 0
+        return self._decode(item.get(self.attribute_name) or {}), int(item.get(VERSION_NAME, 0))
+
+    def save_attributes(self, request_envelope, attributes):
+        # type: (RequestEnvelope, Dict[str, object]) -> None
+        self._save(request_envelope, attributes, None)
+
+    def save_versioned(self, request_envelope, attributes, version):
+        # type: (RequestEnvelope, Dict[str, object], int) -> int
+        """Save if the item is still at version, as returned by get_versioned().
+
+        :return: the item's new version (version itself when nothing changed)
+        :raises: StaleAttributesError when the item has been written since
+        """
+        return self._save(request_envelope, attributes, version)
+
+    def _decode(self, stored):
+        # DynamoDB returns numbers as Decimal (https://github.com/boto/boto3/issues/369)
+        return plain_numbers(stored)
+
+    def _update_expression(self, attributes):
+        # (expression, names, values) writing the attributes, None when nothing changed
+        if isinstance(attributes, TrackedDict) and not attributes.new:
+            return build_update_expression(self.attribute_name, attributes)
+        if isinstance(attributes, TrackedDict):
+            attributes = attributes.to_dict()
+        return "SET #attr = :attributes", {"#attr": self.attribute_name}, {":attributes": attributes}
+
+    def _save(self, request_envelope, attributes, version):
+        update = self._update_expression(attributes)
+        if update is None:
+            return version
+        expression, names, values = update
+        names["#version"] = VERSION_NAME
+        values[":one"] = 1
+        kwargs = {"UpdateExpression": expression + " ADD #version :one"}
+        if version is not None:
+            if version:
+                kwargs["ConditionExpression"] = "#version = :version"
+                values[":version"] = version
+            else:
+                kwargs["ConditionExpression"] = "attribute_not_exists(#version)"
+        try:
+            table = self.dynamodb.Table(self.table_name)
+            partition_key_val = self.partition_keygen(request_envelope)
+            table.update_item(
+                Key={self.partition_key_name: partition_key_val},
+                ExpressionAttributeNames=names,
+                ExpressionAttributeValues=values,
+                **kwargs)
+        except PersistenceException:
+            raise
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+                raise StaleAttributesError(
+                    "Attributes in DynamoDb table changed since version {}".format(version))
+            raise PersistenceException(
+                "Failed to update attributes in DynamoDb table. Exception of "
+                "type {} occurred: {}".format(type(e).__name__, str(e)))
+        except Exception as e:
+            raise PersistenceException(
+                "Failed to update attributes in DynamoDb table. Exception of "
+                "type {} occurred: {}".format(type(e).__name__, str(e)))
+        return None if version is None else version + 1
+
+
+class PackedStateDynamoDbAdapter(UpdateItemDynamoDbAdapter):
+    """UpdateItemDynamoDbAdapter that stores the playback state packed, see playback_state.py.
+
+    The handlers still get and change the usual attribute dict. A save with
+    changes to the playback state SETs both packed strings (and REMOVEs the
+    old layout's fields, a no-op once they are gone) with one UpdateItem.
+    Changes to any other attribute, or a new user, write the whole map.
+    """
+    packed_state = True
+
+    def _decode(self, stored):
+        return decode_attributes(stored)
+
+    def _update_expression(self, attributes):
+        if isinstance(attributes, TrackedDict) and not attributes.new:
+            changed = {path[0] for path in attributes.changed_paths}
+            if not changed:
+                return None
+            stored = encode_attributes(attributes.to_dict())
+            if changed.issubset(STATE_KEYS) and POSITION in stored:
+                names = {"#attr": self.attribute_name, "#p": POSITION, "#s": SETTINGS}
+                names.update(("#old{}".format(number), key) for number, key in enumerate(STATE_KEYS))
+                expression = "SET #attr.#p = :p, #attr.#s = :s REMOVE " + ", ".join(
+                    "#attr.#old{}".format(number) for number in range(len(STATE_KEYS)))
+                return expression, names, {":p": stored[POSITION], ":s": stored[SETTINGS]}
+        else:
+            if isinstance(attributes, TrackedDict):
+                attributes = attributes.to_dict()
+            stored = encode_attributes(attributes)
+        return "SET #attr = :attributes", {"#attr": self.attribute_name}, {":attributes": stored}
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+# Fast path for AudioPlayer lifecycle events.
+#
+# PlaybackStarted, PlaybackFinished, PlaybackStopped and PlaybackFailed are
+# most of the skill's traffic and all of them get an empty response. Going
+# through the SDK for them means deserializing the whole RequestEnvelope into
+# model objects, running the interceptors (a DynamoDB GetItem) and the
+# handlers, then serializing the envelope again. LifecycleFastPath looks at
+# the raw event dict instead and builds the same response envelope directly:
+#
+#   fast_path = LifecycleFastPath(sb, persistence_adapter, catalog)
+#   response = fast_path.handle(event)
+#   if response is None:
+#       response = sdk_lambda_handler(event, context)
+#
+# handle() returns None for anything it does not handle the same way the SDK
+# handlers would, and the caller falls back to the SDK:
+#   - every other request type
+#   - PlaybackFinished with an old-style token, or one for a track no longer
+#     in the catalog (the stored state is updated)
+#   - PlaybackStopped for a user with no stored playback_settings yet (the
+#     SDK path creates the defaults first), or with an old-style token when
+#     the playback state is packed, or with a persistence backend other than
+#     DynamoDB (see persistence_backends.py)
+#   - a skill id is configured and does not match, so the SDK raises as usual
+#
+# PlaybackStopped writes the same fields as PlaybackStoppedHandler with one
+# UpdateItem, without reading the item first. It adds to the item's version
+# like every other write (see dynamodb_persistence.py) and drops this
+# container's cached copy (see attribute_cache.py). With the packed playback state
+# (see playback_state.py) that is the whole position string, so only tokens
+# made by stream_token are handled: the track and token come from it.
+
+import logging
+
+from ask_sdk_core.__version__ import __version__
+from ask_sdk_core.utils import RESPONSE_FORMAT_VERSION, user_agent_info
+from ask_sdk_dynamodb.partition_keygen import user_id_partition_keygen
+
+import metrics
+from persistence import VERSION_NAME
+from playback_state import POSITION, PlaybackState
+from skill_logging import log_request
+from stream_token import decode_token
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+STARTED = "AudioPlayer.PlaybackStarted"
+FINISHED = "AudioPlayer.PlaybackFinished"
+STOPPED = "AudioPlayer.PlaybackStopped"
+FAILED = "AudioPlayer.PlaybackFailed"
+
+
+class LifecycleFastPath(object):
+    """Handles AudioPlayer lifecycle events from the raw event dict.
+
+    :param skill_builder: the SkillBuilder, for its skill_id and custom user agent
+    :param persistence_adapter: adapter the SDK path saves with, PlaybackStopped is only
+        handled here when it is a DynamoDbAdapter
+    :param catalog: catalog.Catalog, to check the track in a PlaybackStopped token
+    """
+
+    def __init__(self, skill_builder, persistence_adapter, catalog):
+        self.skill_builder = skill_builder
+        self.persistence_adapter = persistence_adapter
+        self.catalog = catalog
+        self._handlers = {
+            STARTED: self._playback_started,
+            FINISHED: self._playback_finished,
+            STOPPED: self._playback_stopped,
+            FAILED: self._playback_failed,
+        }
+
+    def handle(self, event):
+        # type: (Dict[str, Any]) -> Optional[Dict[str, Any]]
+        """Response envelope dict for the event, or None to use the SDK."""
+        try:
+            request = event["request"]
+            handler = self._handlers.get(request["type"])
+        except (KeyError, TypeError):
+            return None
+        if handler is None:
+            return None
+
+        skill_id = self.skill_builder.skill_id
+        if skill_id is not None and skill_id != _system(event).get("application", {}).get("applicationId"):
+            return None
+
+        metrics.begin(request["type"])
+        if not handler(event, request):
+            # the SDK path times the request again from the start
+            metrics.discard()
+            return None
+        response = self._response_envelope(event)
+        metrics.end()
+        return response
+
+    def _response_envelope(self, event):
+        # same as CustomSkill.invoke + DefaultSerializer for an empty response
+        envelope = {"version": RESPONSE_FORMAT_VERSION}
+        session = event.get("session")
+        if session is not None:
+            envelope["sessionAttributes"] = session.get("attributes") or {}
+        envelope["userAgent"] = user_agent_info(
+            sdk_version=__version__, custom_user_agent=self.skill_builder.custom_user_agent)
+        envelope["response"] = {}
+        return envelope
+
+    def _playback_started(self, event, request):
+        logger.info("In PlaybackStartedHandler (fast path)")
+        return True
+
+    def _playback_finished(self, event, request):
+        # with one of our tokens there is nothing to record, see PlaybackFinishedHandler
+        current = decode_token(request.get("token"))
+        if current is None or current.index not in self.catalog:
+            return False
+        logger.info("In PlaybackFinishedHandler (fast path)")
+        return True
+
+    def _playback_failed(self, event, request):
+        log_request(logger, "Playback failed", event)
+        return True
+
+    def _playback_stopped(self, event, request):
+        adapter = self.persistence_adapter
+        if getattr(adapter, "dynamodb", None) is None or adapter.partition_keygen is not user_id_partition_keygen:
+            return False
+        user_id = _system(event).get("user", {}).get("userId")
+        if not user_id:
+            return False
+
+        token = request.get("token")
+        offset = int(request.get("offsetInMilliseconds") or 0)
+        current = decode_token(token)
+        in_catalog = current is not None and current.index in self.catalog
+        if getattr(adapter, "packed_state", False):
+            if not in_catalog:
+                return False
+            names = {"#attr": adapter.attribute_name, "#p": POSITION}
+            values = {":p": PlaybackState(current.index, offset, token).pack_position()}
+            actions = ["#attr.#p = :p"]
+        else:
+            names = {"#attr": adapter.attribute_name, "#ps": "playback_settings",
+                     "#offset": "offset_in_milliseconds"}
+            values = {":offset": offset}
+            actions = ["#attr.#ps.#offset = :offset"]
+            if in_catalog:
+                names.update({"#track": "track_number", "#token": "token", "#enqueued": "next_stream_enqueued"})
+                values.update({":track": current.index, ":token": token, ":enqueued": False})
+                actions += ["#attr.#track = :track", "#attr.#ps.#token = :token",
+                            "#attr.#ps.#enqueued = :enqueued"]
+        names["#version"] = VERSION_NAME
+        values[":one"] = 1
+        logger.info("In PlaybackStoppedHandler (fast path)")
+        try:
+            with metrics.timed(metrics.DYNAMODB_SAVE_TIME):
+                adapter.dynamodb.Table(adapter.table_name).update_item(
+                    Key={adapter.partition_key_name: user_id},
+                    UpdateExpression="SET " + ", ".join(actions) + " ADD #version :one",
+                    ExpressionAttributeNames=names,
+                    ExpressionAttributeValues=values)
+        except Exception as e:
+            # e.g. no playback_settings stored yet, the SDK path creates them
+            logger.info("PlaybackStopped fast path failed, using the SDK: {}".format(e))
+            return False
+        invalidate = getattr(adapter, "invalidate", None)
+        if invalidate is not None:
+            invalidate(user_id)
+        return True
+
+
+def _system(event):
+    return (event.get("context") or {}).get("System") or {}
@@ -21,20 +21,32 @@
 #   leave to end of music - start from beginning?
 
 import os
-import boto3
-import track_info as trackInfo
-
-from ask_sdk_dynamodb.adapter import DynamoDbAdapter
+from xml.sax.saxutils import escape
+from catalog import LazyCatalog
 
 import logging
 import ask_sdk_core.utils as ask_utils
 
-from utils import create_presigned_url
+from utils import create_presigned_url, card_image_urls
+from persistence import TrackedDict, LazyPersistenceAdapter
+import persistence_backends
+from stream_token import decode_token
+from shuffle import new_seed
+from play_queue import PlayQueue, needs_stored_state, REPEAT_ALL, REPEAT_ONE, REPEAT_OFF
+from search import get_search_index
+from router import RequestRouter
+from fast_path import LifecycleFastPath
+import metrics
+from skill_logging import log_request
+import response_templates
+from response_templates import play_directive
+
+# built on first use: with an S3 manifest that is a boto3 import and a GetObject, see catalog.py
+catalog = LazyCatalog()
 
 from ask_sdk_core.dispatch_components import AbstractRequestInterceptor
 from ask_sdk_core.dispatch_components import AbstractResponseInterceptor
 
-from ask_sdk_core.skill_builder import SkillBuilder
 from ask_sdk_core.dispatch_components import AbstractRequestHandler
 from ask_sdk_core.dispatch_components import AbstractExceptionHandler
 from ask_sdk_core.handler_input import HandlerInput
@@ -45,41 +57,119 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 from ask_sdk_core.utils import is_intent_name
-from ask_sdk_core.utils import get_intent_name
 from ask_sdk_core.utils import is_request_type
-from ask_sdk_model.ui import StandardCard, Image, SimpleCard
-from ask_sdk_model.interfaces.audioplayer import (
-    PlayDirective, PlayBehavior, AudioItem, Stream, AudioItemMetadata,
-    StopDirective)
-from ask_sdk_model.interfaces import display
+from ask_sdk_model.interfaces.audioplayer import PlayBehavior, StopDirective
+
+# the stream tokens are signed with a secret kept in the S3 bucket, or STREAM_TOKEN_SECRET
+# when it is set, see stream_token.py
+
+# where the persistent attributes are kept: "dynamodb" (the Alexa-hosted table),
+# "memory" or "sqlite" to run without AWS, see persistence_backends.py
+persistence_backend = os.environ.get('PERSISTENCE_BACKEND', 'dynamodb')
 
-ddb_region = os.environ.get('DYNAMODB_PERSISTENCE_REGION')
-ddb_table_name = os.environ.get('DYNAMODB_PERSISTENCE_TABLE_NAME')
+def create_persistence_adapter():
+    # the backend (for DynamoDB boto3 and the adapter) is imported here, on the first
+    # request that needs the persistent attributes, rather than during Lambda init
+    return persistence_backends.create_persistence_adapter(persistence_backend)
 
-ddb_resource = boto3.resource('dynamodb', region_name=ddb_region)
-dynamodb_adapter = DynamoDbAdapter(table_name=ddb_table_name, create_table=False, dynamodb_resource=ddb_resource)
+persistence_adapter = LazyPersistenceAdapter(create_persistence_adapter)
 
 from ask_sdk_core.skill_builder import CustomSkillBuilder
-from ask_sdk_dynamodb.adapter import DynamoDbAdapter
 
-small_image_url = create_presigned_url("Media/Note108.png")
-large_image_url = create_presigned_url("Media/Note512.png")
 
+def track_card(track_number):
+    # type: (int) -> dict
+    """Build the card for a track. Image URLs are signed (or taken from the
+    URL cache) now, so the card never points at an expired URL.
+    """
+    small_image_url, large_image_url = card_image_urls()
+    return response_templates.track_card(catalog[track_number], small_image_url, large_image_url)
+
+def current_track_number(handler_input, persistence_attr):
+    # type: (HandlerInput, dict) -> int
+    """Track that is playing (or was last played) on the device.
+    Taken from the AudioPlayer token in the request context when it is in the catalog,
+    otherwise from the stored track_number.
+    """
+    audio_player = handler_input.request_envelope.context.audio_player
+    track = catalog.by_token(audio_player.token) if audio_player else None
+    if track is not None:
+        return track.index
+    return int(persistence_attr["track_number"])
+
+def stored_queue(persistence_attr):
+    # type: (dict) -> PlayQueue
+    """Play queue the user chose: shuffle seed, repeat mode and up_next list (see play_queue.py)."""
+    return PlayQueue.from_attributes(persistence_attr, catalog)
+
+def clamp_to_catalog(persistence_attr):
+    # type: (dict) -> None
+    """Forget stored tracks past the end of the catalog, which may have shrunk
+    since they were stored: the stored track goes back to the first one, and
+    tracks queued with play next are dropped.
+    """
+    settings = persistence_attr["playback_settings"]
+    if int(persistence_attr.get("track_number", 0)) not in catalog:
+        persistence_attr["track_number"] = 0
+        settings["offset_in_milliseconds"] = 0
+        settings["next_stream_enqueued"] = False
+    stored = decode_token(settings.get("token"))
+    if stored is not None and stored.index not in catalog:
+        settings["token"] = None
+    up_next = settings.get("up_next")
+    if up_next and any(int(index) not in catalog for index in up_next):
+        up_next = [int(index) for index in up_next if int(index) in catalog]
+        if up_next:
+            settings["up_next"] = up_next
+        else:
+            del settings["up_next"]
 
-audio_data = {
-    "card": {
-        "title": 'My music',
-        "text": 'I like music',
-    }
-}
-card = StandardCard(
-    title=audio_data["card"]["title"],
-    text=audio_data["card"]["text"],
-    image=Image(
-        small_image_url=small_image_url,
-        large_image_url=large_image_url
-    )
-)
+def catalog_token(token):
+    # type: (Optional[str]) -> Optional[StreamToken]
+    """The decoded stream token when its track is in the catalog, None otherwise:
+    an old-style token, or a track past the end of a catalog that has shrunk since.
+    """
+    current = decode_token(token)
+    return current if current is not None and current.index in catalog else None
+
+def is_stateless_request(handler_input):
+    # type: (HandlerInput) -> bool
+    """Playlist progression events whose token tells us which track is playing
+    (and, for NearlyFinished, which one comes next).
+    These are handled without reading or writing the persistent attributes.
+    """
+    if is_request_type("AudioPlayer.PlaybackFinished")(handler_input):
+        return catalog_token(handler_input.request_envelope.request.token) is not None
+    if is_request_type("AudioPlayer.PlaybackNearlyFinished")(handler_input):
+        current = catalog_token(handler_input.request_envelope.request.token)
+        # tracks queued with play next are only in the stored up_next list
+        return current is not None and not needs_stored_state(current.queue_id)
+    return False
+
+def restart_playing_track(handler_input, persistence_attr, queue):
+    # type: (HandlerInput, dict, PlayQueue) -> None
+    """Restart the track that is playing where it is, with a token for the queue.
+    The next track is picked from the token of the one playing, so a change to
+    the queue only reaches the playing track with a new token. A paused track
+    stays paused: the new token is only stored, and resume plays from it.
+    """
+    audio_player = handler_input.request_envelope.context.audio_player
+    track = catalog.by_token(audio_player.token) if audio_player else None
+    activity = audio_player.player_activity.value if track is not None and audio_player.player_activity else None
+    if activity in ("PLAYING", "PAUSED", "BUFFER_UNDERRUN"):
+        track_number = track.index
+        offset = audio_player.offset_in_milliseconds or 0
+        persistence_attr["track_number"] = track_number
+        persistence_attr["playback_settings"]["offset_in_milliseconds"] = offset
+        persistence_attr["playback_settings"]["token"] = queue.token(track_number)
+        persistence_attr["playback_settings"]["next_stream_enqueued"] = False
+        if activity == "PAUSED":
+            return
+
+        audio_url = create_presigned_url(track.url)
+        persistence_attr["playback_settings"]["url"] = audio_url
+        directive = play_directive(PlayBehavior.REPLACE_ALL, queue.token(track_number), audio_url, offset)
+        handler_input.response_builder.add_directive(directive)
 
 class LaunchRequestHandler(AbstractRequestHandler):
     """Handler for Skill Launch."""
@@ -123,7 +213,7 @@ class AudioPlayIntentHandler(AbstractRequestHandler):
         return (is_intent_name("PlayAudio")(handler_input) or
                 is_intent_name("AMAZON.ResumeIntent")(handler_input))
 
-        
+   
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
         logger.info("in AudioPlayIntent")
@@ -131,72 +221,127 @@ class AudioPlayIntentHandler(AbstractRequestHandler):
 
         if (is_intent_name("PlayAudio")(handler_input)):
             logger.info("play Audio")
-            # first time - set track to zero
-            track_number = 0
+            # first time - start from the first track (track zero unless shuffled)
+            queue = stored_queue(persistence_attr)
+            queue.set_filter(None) # the whole catalog, not the last search
+            queue.save(persistence_attr)
+            track_number = queue.first_index()
             persistence_attr["track_number"] = track_number
-            
-            card = StandardCard(
-                title=trackInfo.track_info[track_number]["title"],
-                text=trackInfo.track_info[track_number]["artist"],
-                image=Image(
-                    small_image_url=small_image_url,
-                    large_image_url=large_image_url
-                    )
-                )
-
-            audio_key = trackInfo.track_info[track_number]["url"]
+       
+            card = track_card(track_number)
+
+            audio_key = catalog[track_number].url
             audio_url = create_presigned_url(audio_key)
             persistence_attr["playback_settings"]["url"] = audio_url
-            persistence_attr["playback_settings"]["token"] = audio_key
+            persistence_attr["playback_settings"]["token"] = queue.token(track_number)
             persistence_attr["playback_settings"]["offset_in_milliseconds"] = 0
             persistence_attr["playback_settings"]["next_stream_enqueued"] = False
-            
+       
             speech_text = "Playing your music"
-            directive = PlayDirective(
-                play_behavior=PlayBehavior.REPLACE_ALL,
-                audio_item=AudioItem(
-                    stream=Stream(
-                        token=audio_key,
-                        url=audio_url,
-                        offset_in_milliseconds=0,
-                        expected_previous_token=None),
-                    metadata=None))
-            handler_input.response_builder.speak(speech_text).set_card(card).add_directive(directive).set_should_end_session(True)        
-        
+            directive = play_directive(PlayBehavior.REPLACE_ALL, queue.token(track_number), audio_url)
+            handler_input.response_builder.speak(speech_text).set_card(card).add_directive(directive).set_should_end_session(True)   
+   
         else:
             # resume
             logger.info("Resume")
             track_number = int(persistence_attr["track_number"])
-            
-            audio_key = trackInfo.track_info[track_number]["url"]
+            queue = stored_queue(persistence_attr)
+       
+            audio_key = catalog[track_number].url
             audio_url = create_presigned_url(audio_key)
             persistence_attr["playback_settings"]["url"] = audio_url
-            persistence_attr["playback_settings"]["token"] = audio_key
-            
-            card = StandardCard(
-                title=trackInfo.track_info[track_number]["title"],
-                text=trackInfo.track_info[track_number]["artist"],
-                image=Image(
-                    small_image_url=small_image_url,
-                    large_image_url=large_image_url
-                    )
-                )
-
-            directive = PlayDirective(
-                play_behavior=PlayBehavior.REPLACE_ALL,
-                audio_item=AudioItem(
-                    stream=Stream(
-                        token=audio_key,
-                        url=audio_url,
-                        offset_in_milliseconds=persistence_attr["playback_settings"]["offset_in_milliseconds"],
-                        expected_previous_token=None),
-                    metadata=None))
+            persistence_attr["playback_settings"]["token"] = queue.token(track_number)
+       
+            card = track_card(track_number)
+
+            directive = play_directive(PlayBehavior.REPLACE_ALL, queue.token(track_number), audio_url, persistence_attr["playback_settings"]["offset_in_milliseconds"])
 
             handler_input.response_builder.set_card(card).add_directive(directive).set_should_end_session(True)
-            
+       
+        handler_input.attributes_manager.persistent_attributes = persistence_attr
+        return handler_input.response_builder.response
+
+
+class SearchPlayHandler(AbstractRequestHandler):
+    """Handler for play <genre> / play <artist> / play <title>.
+    Genres and artists are played as a queue of just their tracks, a title
+    starts that track in the whole catalog (see search.py).
+    """
+    slots = {
+        "PlayGenreIntent": "genre",
+        "PlayArtistIntent": "artist",
+        "PlayTitleIntent": "title",
+    }
+
+    def can_handle(self, handler_input):
+        # type: (HandlerInput) -> bool
+        return any(is_intent_name(name)(handler_input) for name in self.slots)
+
+    def handle(self, handler_input):
+        # type: (HandlerInput) -> Response
+        logger.info("In SearchPlayHandler")
+        field = self.slots[handler_input.request_envelope.request.intent.name]
+        query = ask_utils.get_slot_value(handler_input, field)
+        search_index = get_search_index(catalog)
+        # "play <artist>" and "play <title>" sound alike, so try the other fields too
+        match = (search_index.search(query, field) or search_index.search(query)) if query else None
+        if match is None:
+            speak_output = "Sorry, I couldn't find {}. What would you like to play?".format(escape(query or "that"))
+            return handler_input.response_builder.speak(speak_output).ask("What would you like to play?").response
+
+        persistence_attr = handler_input.attributes_manager.persistent_attributes
+        queue = stored_queue(persistence_attr)
+        if match.field == "title":
+            queue.set_filter(None)
+            track_number = match.indexes[0]
+            speech_text = "Playing {} by {}".format(match.display, catalog[track_number].artist)
+        else:
+            queue.set_filter(match.key)
+            track_number = queue.first_index()
+            speech_text = ("Playing some {}" if match.field == "genre" else "Playing music by {}").format(match.display)
+        queue.save(persistence_attr)
+
+        audio_url = create_presigned_url(catalog[track_number].url)
+        persistence_attr["track_number"] = track_number
+        persistence_attr["playback_settings"]["url"] = audio_url
+        persistence_attr["playback_settings"]["token"] = queue.token(track_number)
+        persistence_attr["playback_settings"]["offset_in_milliseconds"] = 0
+        persistence_attr["playback_settings"]["next_stream_enqueued"] = False
+
+        card = track_card(track_number)
+        directive = play_directive(PlayBehavior.REPLACE_ALL, queue.token(track_number), audio_url)
+        handler_input.response_builder.speak(escape(speech_text)).set_card(card).add_directive(directive).set_should_end_session(True)
+
         handler_input.attributes_manager.persistent_attributes = persistence_attr
         return handler_input.response_builder.response
 
+class PlayNextHandler(AbstractRequestHandler):
+    """Handler for play <title> next.
+    Adds the track to the up_next list (see play_queue.py) and restarts the
+    playing track with a token that says there is one.
+    """
+    def can_handle(self, handler_input):
+        # type: (HandlerInput) -> bool
+        return is_intent_name("PlayNextIntent")(handler_input)
+
+    def handle(self, handler_input):
+        # type: (HandlerInput) -> Response
+        logger.info("In PlayNextHandler")
+        query = ask_utils.get_slot_value(handler_input, "title")
+        match = get_search_index(catalog).search(query, "title") if query else None
+        if match is None:
+            speak_output = "Sorry, I couldn't find {}.".format(escape(query or "that"))
+            return handler_input.response_builder.speak(speak_output).set_should_end_session(True).response
+
+        persistence_attr = handler_input.attributes_manager.persistent_attributes
+        queue = stored_queue(persistence_attr)
+        queue.play_next(match.indexes[0])
+        queue.save(persistence_attr)
+        handler_input.response_builder.speak(escape("{} will play next".format(match.display))).set_should_end_session(True)
+        restart_playing_track(handler_input, persistence_attr, queue)
+
+        handler_input.attributes_manager.persistent_attributes = persistence_attr
+        return handler_input.response_builder.response
 
 class AudioStopIntentHandler(AbstractRequestHandler):
     # Handler for Stop – come here on pause or cancel too
@@ -205,14 +350,14 @@ class AudioStopIntentHandler(AbstractRequestHandler):
         return (is_intent_name("AMAZON.CancelIntent")(handler_input) or
                 is_intent_name("AMAZON.StopIntent")(handler_input) or
                 is_intent_name("AMAZON.PauseIntent")(handler_input))
-                
+           
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
         logger.info("in AudioStopIntent")
         speech_text = "Paused"
         # Note when your skill is playing audio, utterances such as 'stop' send your skill an AMAZON.PauseIntent instead of an AMAZON.StopIntent
         # so you can't easily just say goodbye when user says 'stop'
-        
+   
         directive = StopDirective()
         # this causes PlaybackStopped request which saves current offset
 
@@ -235,7 +380,7 @@ class PlaybackStartedHandler(AbstractRequestHandler):
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
         logger.info("In PlaybackStartedHandler")
-        
+   
 
         return handler_input.response_builder.response
 
@@ -253,15 +398,24 @@ class PlaybackFinishedHandler(AbstractRequestHandler):
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
         logger.info("In PlaybackFinishedHandler")
-        # reset any attributes? e.g.
+        if is_stateless_request(handler_input):
+            # the enqueued track carries its own token, so there is nothing to record:
+            # PlaybackStopped and the AudioPlayer context on intents tell us where we are
+            return handler_input.response_builder.response
+
+        # token from before structured tokens - use the stored state
         persistence_attr = handler_input.attributes_manager.persistent_attributes
         if persistence_attr["playback_settings"]["next_stream_enqueued"] == True:
             # track ended naturally, enqueued so stored track_number is wrong.
             persistence_attr["playback_settings"]["next_stream_enqueued"] = False
-            track_number = int(persistence_attr["track_number"])
-            next_track = (track_number  + 1) % len(trackInfo.track_info)
-            persistence_attr["track_number"] = next_track
-            
+            # the stored token is the enqueued track's
+            enqueued = catalog_token(persistence_attr["playback_settings"]["token"])
+            if enqueued is not None:
+                persistence_attr["track_number"] = enqueued.index
+            else:
+                track_number = int(persistence_attr["track_number"])
+                persistence_attr["track_number"] = stored_queue(persistence_attr).order.next_index(track_number)
+       
         handler_input.attributes_manager.persistent_attributes = persistence_attr
 
         return handler_input.response_builder.response
@@ -293,11 +447,17 @@ class PlaybackStoppedHandler(AbstractRequestHandler):
         persistence_attr = handler_input.attributes_manager.persistent_attributes
         #track_number = int(persistence_attr["track_number"])
         persistence_attr["playback_settings"]["offset_in_milliseconds"] = handler_input.request_envelope.request.offset_in_milliseconds
-        #persistence_attr["playback_settings"]["token"] = trackInfo.track_info[track_number]["url"]
-        #persistence_attr["playback_settings"]["url"] = trackInfo.track_info[track_number]["url"]
+        current = decode_token(handler_input.request_envelope.request.token)
+        if current is not None and current.index in catalog:
+            # the stopped track may have been reached by ENQUEUE, the token says which one it is
+            persistence_attr["track_number"] = current.index
+            persistence_attr["playback_settings"]["token"] = handler_input.request_envelope.request.token
+            persistence_attr["playback_settings"]["next_stream_enqueued"] = False
+        #persistence_attr["playback_settings"]["token"] = catalog[track_number].url
+        #persistence_attr["playback_settings"]["url"] = catalog[track_number].url
         # track_number already saved
         handler_input.attributes_manager.persistent_attributes = persistence_attr
-        
+   
         return handler_input.response_builder.response
 
 
@@ -313,42 +473,48 @@ class PlaybackNearlyFinishedHandler(AbstractRequestHandler):
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
         logger.info("In PlaybackNearlyFinishedHandler")
-        persistence_attr = handler_input.attributes_manager.persistent_attributes
-        track_number = int(persistence_attr["track_number"])
-        next_track = (track_number  + 1) % len(trackInfo.track_info)
-        previous_token = persistence_attr["playback_settings"]["token"] 
-        # this the previous token for the next track, i.e. at the moment - it's the current one
+        request = handler_input.request_envelope.request
+        current = catalog_token(request.token)
+        # previous_token is the previous token for the next track, i.e. at the moment - it's the current one
         # see https://developer.amazon.com/en-US/docs/alexa/custom-skills/audioplayer-interface-reference.html#playlist-progression
-        
-        track_number = next_track # for consistency
-
-        audio_key = trackInfo.track_info[track_number]["url"]
-        audio_url = create_presigned_url(audio_key)
-
-        persistence_attr["playback_settings"]["offset_in_milliseconds"] = 0
-        persistence_attr["playback_settings"]["token"] = audio_key
-        persistence_attr["playback_settings"]["url"] = audio_url
-        # if i update persistence_attr["track_number"] here, then start over (and resume and play?) picks up wrong track (the next one)
-        # if not how does the next track know what to play after automatically playing next track from enqueue?        
-        # persistence_attr["track_number"] = track_number
-        persistence_attr["playback_settings"]["next_stream_enqueued"] = True
-        # check this in playbackfinished. If true, then increment next track
-        
-        handler_input.attributes_manager.persistent_attributes = persistence_attr
-        
-        directive = PlayDirective(
-            play_behavior=PlayBehavior.ENQUEUE,
-            audio_item=AudioItem(
-                stream=Stream(
-                    token=audio_key,
-                    url=audio_url,
-                    offset_in_milliseconds=0,
-                    expected_previous_token=previous_token),
-                metadata=None))     
-        # but next track will have new url, but track_number will be wrong
-        
+        if current is not None and not needs_stored_state(current.queue_id):
+            # the token says which track is playing and the queue it is played from -
+            # the next track comes from the queue id, no DynamoDB read or write needed
+            entry = PlayQueue.from_queue_id(current.queue_id, catalog).following(current.index)
+            previous_token = request.token
+        else:
+            # tracks queued with play next, or a token from before structured tokens - use the stored state
+            persistence_attr = handler_input.attributes_manager.persistent_attributes
+            queue = stored_queue(persistence_attr)
+            if current is not None:
+                track_number = current.index
+                previous_token = request.token
+            else:
+                track_number = int(persistence_attr["track_number"])
+                # a structured token for a track no longer in the catalog is still the one playing
+                previous_token = request.token if decode_token(request.token) is not None \
+                    else persistence_attr["playback_settings"]["token"]
+            entry = queue.following(track_number)
+            queue.save(persistence_attr)
+            if current is None and entry is not None:
+                persistence_attr["playback_settings"]["offset_in_milliseconds"] = 0
+                persistence_attr["playback_settings"]["token"] = entry.token
+                # track_number is not updated here, start over (and resume and play) would pick up the next track
+                persistence_attr["playback_settings"]["next_stream_enqueued"] = True
+                # check this in playbackfinished. If true, then increment next track
+            handler_input.attributes_manager.persistent_attributes = persistence_attr
+
+        if entry is None:
+            # repeat is off and this is the last track, nothing to enqueue
+            return handler_input.response_builder.response
+
+        audio_url = create_presigned_url(entry.track.url)
+        if current is None:
+            persistence_attr["playback_settings"]["url"] = audio_url
+        directive = play_directive(PlayBehavior.ENQUEUE, entry.token, audio_url, 0, expected_previous_token=previous_token)
+   
         handler_input.response_builder.add_directive(directive).set_should_end_session(True)
-        
+   
         return handler_input.response_builder.response
 
 class PlaybackFailedHandler(AbstractRequestHandler):
@@ -361,8 +527,7 @@ class PlaybackFailedHandler(AbstractRequestHandler):
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        request = handler_input.request_envelope.request
-        logger.info("Playback failed: {}".format(request.error))
+        log_request(logger, "Playback failed", handler_input.request_envelope)
 
         return handler_input.response_builder.response
 
@@ -376,8 +541,7 @@ class ExceptionEncounteredHandler(AbstractRequestHandler):
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-        logger.info("\n**************** EXCEPTION *******************")
-        logger.info(handler_input.request_envelope)
+        log_request(logger, "EXCEPTION encountered", handler_input.request_envelope, level=logging.WARNING)
         return handler_input.response_builder.response
 
 class NextPlaybackHandler(AbstractRequestHandler):
@@ -392,39 +556,26 @@ class NextPlaybackHandler(AbstractRequestHandler):
         # type: (HandlerInput) -> Response
         logger.info("In NextPlaybackHandler, track number")
         persistence_attr = handler_input.attributes_manager.persistent_attributes
-        track_number = int(persistence_attr["track_number"])
+        track_number = current_track_number(handler_input, persistence_attr)
         logger.info(track_number)
-        next_track = (track_number  + 1) % len(trackInfo.track_info)
+        queue = stored_queue(persistence_attr)
+        next_track = queue.next_index(track_number) # tracks queued with play next first
+        queue.save(persistence_attr)
         persistence_attr["track_number"] = next_track
         track_number = next_track # for consistency below
-        
-        audio_key = trackInfo.track_info[track_number]["url"]
+   
+        audio_key = catalog[track_number].url
         audio_url = create_presigned_url(audio_key) 
         persistence_attr["playback_settings"]["offset_in_milliseconds"] = 0
         persistence_attr["playback_settings"]["url"] = audio_url
-        persistence_attr["playback_settings"]["token"] = audio_key
+        persistence_attr["playback_settings"]["token"] = queue.token(track_number)
         persistence_attr["playback_settings"]["next_stream_enqueued"] = False
-        
+   
         handler_input.attributes_manager.persistent_attributes = persistence_attr
-        
-        card = StandardCard(
-            title=trackInfo.track_info[track_number]["title"],
-            text=trackInfo.track_info[track_number]["artist"],
-            image=Image(
-                small_image_url=small_image_url,
-                large_image_url=large_image_url
-                )
-            )
-        
-        directive = PlayDirective(
-            play_behavior=PlayBehavior.REPLACE_ALL,
-            audio_item=AudioItem(
-                stream=Stream(
-                    token=audio_key,
-                    url=audio_url,
-                    offset_in_milliseconds=0,
-                    expected_previous_token=None),
-                metadata=None))
+   
+        card = track_card(track_number)
+   
+        directive = play_directive(PlayBehavior.REPLACE_ALL, queue.token(track_number), audio_url)
 
         handler_input.response_builder.set_card(card).add_directive(directive).set_should_end_session(True)
         return handler_input.response_builder.response
@@ -442,45 +593,29 @@ class PreviousPlaybackHandler(AbstractRequestHandler):
         # type: (HandlerInput) -> Response
         logger.info("In PreviousPlaybackHandler")
         persistence_attr = handler_input.attributes_manager.persistent_attributes
-        track_number = int(persistence_attr["track_number"])
-        next_track = track_number -1
-        if (next_track) <0:
-            next_track = 0
+        track_number = current_track_number(handler_input, persistence_attr)
+        queue = stored_queue(persistence_attr)
+        next_track = queue.previous_index(track_number) # stays on the first track
 
         persistence_attr["track_number"] = next_track
         track_number = next_track # for consistency below
-        audio_key = trackInfo.track_info[track_number]["url"]
+        audio_key = catalog[track_number].url
         audio_url = create_presigned_url(audio_key) 
         persistence_attr["playback_settings"]["offset_in_milliseconds"] = 0
         persistence_attr["playback_settings"]["url"] = audio_url
-        persistence_attr["playback_settings"]["token"] = audio_key
-        
+        persistence_attr["playback_settings"]["token"] = queue.token(track_number)
+   
         persistence_attr["playback_settings"]["next_stream_enqueued"] = False
         # REPLACE_ALL - replace current and enqueued streams
 
-        card = StandardCard(
-            title=trackInfo.track_info[track_number]["title"],
-            text=trackInfo.track_info[track_number]["artist"],
-            image=Image(
-                small_image_url=small_image_url,
-                large_image_url=large_image_url
-                )
-            )
-        
+        card = track_card(track_number)
+   
         handler_input.attributes_manager.persistent_attributes = persistence_attr
 
-        directive = PlayDirective(
-            play_behavior=PlayBehavior.REPLACE_ALL,
-            audio_item=AudioItem(
-                stream=Stream(
-                    token=audio_key,
-                    url=audio_url,
-                    offset_in_milliseconds=0,
-                    expected_previous_token=None),
-                metadata=None))
-
-        handler_input.response_builder.set_card(card).add_directive(directive).set_should_end_session(True)        
-        
+        directive = play_directive(PlayBehavior.REPLACE_ALL, queue.token(track_number), audio_url)
+
+        handler_input.response_builder.set_card(card).add_directive(directive).set_should_end_session(True)   
+   
         return handler_input.response_builder.response
 
 class StartOverHandler(AbstractRequestHandler):
@@ -494,39 +629,83 @@ class StartOverHandler(AbstractRequestHandler):
         # go to beginning of track
         logger.info("In StartOverHandler")
         persistence_attr = handler_input.attributes_manager.persistent_attributes
-        track_number = int(persistence_attr["track_number"])
+        track_number = current_track_number(handler_input, persistence_attr)
+        queue = stored_queue(persistence_attr)
 
-        audio_key = trackInfo.track_info[track_number]["url"]
+        audio_key = catalog[track_number].url
         audio_url = create_presigned_url(audio_key) 
         persistence_attr["playback_settings"]["offset_in_milliseconds"] = 0
         persistence_attr["playback_settings"]["url"] = audio_url
-        persistence_attr["playback_settings"]["token"] = audio_key
-        
+        persistence_attr["playback_settings"]["token"] = queue.token(track_number)
+   
         persistence_attr["playback_settings"]["next_stream_enqueued"] = False
-        
+   
         handler_input.attributes_manager.persistent_attributes = persistence_attr
-        
-        card = StandardCard(
-            title=trackInfo.track_info[track_number]["title"],
-            text=trackInfo.track_info[track_number]["artist"],
-            image=Image(
-                small_image_url=small_image_url,
-                large_image_url=large_image_url
-                )
-            )
-        
-        directive = PlayDirective(
-            play_behavior=PlayBehavior.REPLACE_ALL,
-            audio_item=AudioItem(
-                stream=Stream(
-                    token=audio_key,
-                    url=audio_url,
-                    offset_in_milliseconds=0,
-                    expected_previous_token=None),
-                metadata=None))
+   
+        card = track_card(track_number)
+   
+        directive = play_directive(PlayBehavior.REPLACE_ALL, queue.token(track_number), audio_url)
 
         handler_input.response_builder.set_card(card).add_directive(directive).set_should_end_session(True)
-        
+   
+        return handler_input.response_builder.response
+
+class ShuffleHandler(AbstractRequestHandler):
+    """Handler for shuffle on / off.
+    Stores a new shuffle seed, or removes it for catalog order (see shuffle.py).
+    The next track is picked from the token of the one playing, so a track that is
+    playing is restarted where it is with a token for the new order, a paused one keeps
+    it for resume (see restart_playing_track).
+    """
+    def can_handle(self, handler_input):
+        # type: (HandlerInput) -> bool
+        return (is_intent_name("AMAZON.ShuffleOnIntent")(handler_input) or
+                is_intent_name("AMAZON.ShuffleOffIntent")(handler_input))
+
+    def handle(self, handler_input):
+        # type: (HandlerInput) -> Response
+        logger.info("In ShuffleHandler")
+        persistence_attr = handler_input.attributes_manager.persistent_attributes
+        if is_intent_name("AMAZON.ShuffleOnIntent")(handler_input):
+            persistence_attr["shuffle_seed"] = new_seed()
+            speech_text = "Shuffle on"
+        else:
+            persistence_attr.pop("shuffle_seed", None)
+            speech_text = "Shuffle off"
+        handler_input.response_builder.speak(speech_text).set_should_end_session(True)
+        restart_playing_track(handler_input, persistence_attr, stored_queue(persistence_attr))
+
+        handler_input.attributes_manager.persistent_attributes = persistence_attr
+        return handler_input.response_builder.response
+
+class RepeatModeHandler(AbstractRequestHandler):
+    """Handler for loop on / loop off / repeat.
+    Loop on wraps round to the first track at the end (the default), loop off
+    stops after the last track and repeat plays the current track again until
+    loop on or off (see play_queue.py).
+    """
+    modes = {
+        "AMAZON.LoopOnIntent": (REPEAT_ALL, "Loop on"),
+        "AMAZON.LoopOffIntent": (REPEAT_OFF, "Loop off"),
+        "AMAZON.RepeatIntent": (REPEAT_ONE, "Repeating this track"),
+    }
+
+    def can_handle(self, handler_input):
+        # type: (HandlerInput) -> bool
+        return any(is_intent_name(name)(handler_input) for name in self.modes)
+
+    def handle(self, handler_input):
+        # type: (HandlerInput) -> Response
+        logger.info("In RepeatModeHandler")
+        persistence_attr = handler_input.attributes_manager.persistent_attributes
+        repeat, speech_text = self.modes[handler_input.request_envelope.request.intent.name]
+        queue = stored_queue(persistence_attr)
+        queue.repeat = repeat
+        queue.save(persistence_attr)
+        handler_input.response_builder.speak(speech_text).set_should_end_session(True)
+        restart_playing_track(handler_input, persistence_attr, queue)
+
+        handler_input.attributes_manager.persistent_attributes = persistence_attr
         return handler_input.response_builder.response
     
 # ###################################################################
@@ -581,6 +760,8 @@ class CatchAllExceptionHandler(AbstractExceptionHandler):
         logger.error(exception, exc_info=True)
         logger.info("exception")
         logger.info(exception)
+        # response interceptors don't run after an exception, log the timings here
+        metrics.end(error=True)
 
         speak_output = "Sorry, I had trouble doing what you asked. Please try again."
 
@@ -598,70 +779,110 @@ class LoadPersistenceAttributesRequestInterceptor(AbstractRequestInterceptor):
     def process(self, handler_input):
         # type: (HandlerInput) -> None
         #handler_input.attributes_manager.delete_persistent_attributes()
-        
-        persistence_attr = handler_input.attributes_manager.persistent_attributes
-        
+   
+        if is_stateless_request(handler_input):
+            # playlist progression with one of our tokens, don't read DynamoDB at all
+            return
+
+        # wrap the attributes so the response interceptor can tell whether anything changed
+        with metrics.timed(metrics.DYNAMODB_LOAD_TIME):
+            persistence_attr = TrackedDict(handler_input.attributes_manager.persistent_attributes)
+   
         if len(persistence_attr) == 0:
             logger.info("Create attributes")
-            # First time skill user
+            # First time skill user - these assignments mark the attributes as changed
             persistence_attr["playback_settings"] = {
                 "token": None,
                 "offset_in_milliseconds": 0,
                 "url" : None,
                 "next_stream_enqueued" : False
             }
-            
+       
             persistence_attr["track_number"] = 0
-
         else:
-            # Convert decimals to integers, because of AWS SDK DynamoDB issue
-            # https://github.com/boto/boto3/issues/369
-            pass
+            clamp_to_catalog(persistence_attr)
+
+        # numbers come back as ints, not DynamoDB's Decimals: the adapter converts them
 
-        
+        handler_input.attributes_manager.persistent_attributes = persistence_attr
+        handler_input.attributes_manager.request_attributes["persistence_loaded"] = True
         return    
 
 class SavePersistenceAttributesResponseInterceptor(AbstractResponseInterceptor):
     #Save persistence attributes before sending response to user.
     def process(self, handler_input, response):
         # type: (HandlerInput, Response) -> None
-        
-        handler_input.attributes_manager.persistent_attributes = persistence_attr
-        handler_input.attributes_manager.save_persistent_attributes()
-        
+   
+        if not handler_input.attributes_manager.request_attributes.get("persistence_loaded"):
+            # nothing was loaded (stateless request), reading them now would cost a GetItem
+            return
+        persistence_attr = handler_input.attributes_manager.persistent_attributes
+        # handlers that only read state (PlaybackStarted, SessionEnded, Launch...) leave
+        # the attributes clean, so skip the DynamoDB write for them
+        if not getattr(persistence_attr, "dirty", True):
+            return
+        with metrics.timed(metrics.DYNAMODB_SAVE_TIME):
+            handler_input.attributes_manager.save_persistent_attributes()
+        if isinstance(persistence_attr, TrackedDict):
+            persistence_attr.mark_clean()
+   
         return
 
 # The SkillBuilder object acts as the entry point for your skill, routing all request and response
 # payloads to the handlers above. Make sure any new handlers or interceptors you've
 # defined are included below. The order matters - they're processed top to bottom.
 
-sb = SkillBuilder()
-
-sb = CustomSkillBuilder(persistence_adapter = dynamodb_adapter)
+sb = CustomSkillBuilder(persistence_adapter = persistence_adapter)
 
 # Interceptors
+# the metrics interceptors go first and last so the timings cover the other interceptors, see metrics.py
+sb.add_global_request_interceptor(metrics.MetricsRequestInterceptor())
 sb.add_global_request_interceptor(LoadPersistenceAttributesRequestInterceptor())
 sb.add_global_response_interceptor(SavePersistenceAttributesResponseInterceptor())
-
-sb.add_request_handler(LaunchRequestHandler())
-sb.add_request_handler(HelpIntentHandler())
-sb.add_request_handler(AudioPlayIntentHandler())
-sb.add_request_handler(AudioStopIntentHandler())
-sb.add_request_handler(NextPlaybackHandler())
-sb.add_request_handler(PreviousPlaybackHandler())
-sb.add_request_handler(StartOverHandler())
+sb.add_global_response_interceptor(metrics.MetricsResponseInterceptor())
+
+# Handlers are added to the router with the request types / intents they handle,
+# so each request only tries the matching handlers (see router.py).
+router = RequestRouter()
+router.add_request_handler(LaunchRequestHandler(), request_types=["LaunchRequest"])
+router.add_request_handler(HelpIntentHandler(), intent_names=["AMAZON.HelpIntent"])
+router.add_request_handler(AudioPlayIntentHandler(), intent_names=["PlayAudio", "AMAZON.ResumeIntent"])
+router.add_request_handler(SearchPlayHandler(), intent_names=list(SearchPlayHandler.slots))
+router.add_request_handler(PlayNextHandler(), intent_names=["PlayNextIntent"])
+router.add_request_handler(AudioStopIntentHandler(), intent_names=["AMAZON.CancelIntent", "AMAZON.StopIntent", "AMAZON.PauseIntent"])
+router.add_request_handler(NextPlaybackHandler(), intent_names=["AMAZON.NextIntent"])
+router.add_request_handler(PreviousPlaybackHandler(), intent_names=["AMAZON.PreviousIntent"])
+router.add_request_handler(StartOverHandler(), intent_names=["AMAZON.StartOverIntent"])
+router.add_request_handler(ShuffleHandler(), intent_names=["AMAZON.ShuffleOnIntent", "AMAZON.ShuffleOffIntent"])
+router.add_request_handler(RepeatModeHandler(), intent_names=list(RepeatModeHandler.modes))
 
 
 # ########## AUDIOPLAYER INTERFACE HANDLERS #########################
-sb.add_request_handler(PlaybackStartedHandler())
-sb.add_request_handler(PlaybackFinishedHandler())
-sb.add_request_handler(PlaybackStoppedHandler())
-sb.add_request_handler(PlaybackNearlyFinishedHandler())
-sb.add_request_handler(PlaybackFailedHandler())
-sb.add_request_handler(ExceptionEncounteredHandler())
-sb.add_request_handler(SessionEndedRequestHandler())
-sb.add_request_handler(IntentReflectorHandler()) # make sure IntentReflectorHandler is last so it doesn't override your custom intent handlers
+router.add_request_handler(PlaybackStartedHandler(), request_types=["AudioPlayer.PlaybackStarted"])
+router.add_request_handler(PlaybackFinishedHandler(), request_types=["AudioPlayer.PlaybackFinished"])
+router.add_request_handler(PlaybackStoppedHandler(), request_types=["AudioPlayer.PlaybackStopped"])
+router.add_request_handler(PlaybackNearlyFinishedHandler(), request_types=["AudioPlayer.PlaybackNearlyFinished"])
+router.add_request_handler(PlaybackFailedHandler(), request_types=["AudioPlayer.PlaybackFailed"])
+router.add_request_handler(ExceptionEncounteredHandler(), request_types=["System.ExceptionEncountered"])
+router.add_request_handler(SessionEndedRequestHandler(), request_types=["SessionEndedRequest"])
+router.add_request_handler(IntentReflectorHandler(), request_types=["IntentRequest"]) # make sure IntentReflectorHandler is last so it doesn't override your custom intent handlers
+
+sb.add_request_handler(router)
 
 sb.add_exception_handler(CatchAllExceptionHandler())
 
-lambda_handler = sb.lambda_handler()
+sdk_lambda_handler = sb.lambda_handler()
+
+# AudioPlayer lifecycle events are answered straight from the event dict (see
+# fast_path.py), everything else goes through the SDK. Set AUDIO_FAST_PATH=0
+# to send everything through the SDK.
+fast_path = None
+if os.environ.get('AUDIO_FAST_PATH', '1') != '0':
+    fast_path = LifecycleFastPath(sb, persistence_adapter, catalog)
+
+def lambda_handler(event, context):
+    # type: (Dict[str, Any], Any) -> Dict[str, Any]
+    response = fast_path.handle(event) if fast_path is not None else None
+    if response is None:
+        response = sdk_lambda_handler(event, context)
+    return response
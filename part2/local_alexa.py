@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# Stand-in for Alexa's side of the web service (webservice.py), for running
+# it locally: a root certificate and a signing certificate for
+# echo-api.amazon.com made on the spot, the chain served over local HTTP,
+# and requests signed with it.
+#
+#   alexa = LocalAlexa()
+#   verifier = request_verifier.RequestVerifier(trust_roots=[alexa.root], fetch=alexa.fetch)
+#   headers, body = alexa.sign(event)
+#   ...
+#   alexa.close()
+#
+# fetch() gets any https://s3.amazonaws.com/echo.api/... URL from the local
+# server instead, the number of downloads is in .downloads.
+
+import base64
+import datetime
+import http.server
+import json
+import threading
+import urllib.parse
+import urllib.request
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+import request_verifier
+
+CERT_URL = "https://s3.amazonaws.com/echo.api/echo-api-cert-local.pem"
+
+
+def _certificate(subject, issuer, public_key, issuer_key, not_after, ca):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    builder = x509.CertificateBuilder().subject_name(
+        x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, subject)])).issuer_name(
+        x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, issuer)])).public_key(public_key).serial_number(
+        x509.random_serial_number()).not_valid_before(now - datetime.timedelta(hours=1)).not_valid_after(
+        not_after).add_extension(
+        x509.SubjectKeyIdentifier.from_public_key(public_key), critical=False).add_extension(
+        x509.AuthorityKeyIdentifier.from_issuer_public_key(issuer_key.public_key()), critical=False)
+    if ca:
+        builder = builder.add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True).add_extension(
+            x509.KeyUsage(False, False, False, False, False, True, True, False, False), critical=True)
+    else:
+        builder = builder.add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True).add_extension(
+            x509.KeyUsage(True, False, False, False, False, False, False, False, False), critical=True).add_extension(
+            x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH, ExtendedKeyUsageOID.CLIENT_AUTH]),
+            critical=False).add_extension(
+            x509.SubjectAlternativeName([x509.DNSName(request_verifier.CERT_DOMAIN)]), critical=False)
+    return builder.sign(issuer_key, hashes.SHA256())
+
+
+class LocalAlexa(object):
+    """Signs requests like Alexa, with certificates of its own.
+
+    :param valid_for: how long the signing certificate is valid
+    """
+
+    def __init__(self, valid_for=datetime.timedelta(days=1)):
+        root_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.root = _certificate("Local Alexa Root", "Local Alexa Root", root_key.public_key(), root_key,
+                                 now + datetime.timedelta(days=30), ca=True)
+        self.certificate = _certificate(request_verifier.CERT_DOMAIN, "Local Alexa Root", self._key.public_key(),
+                                        root_key, now + valid_for, ca=False)
+        self.chain = b"".join(certificate.public_bytes(serialization.Encoding.PEM)
+                              for certificate in (self.certificate, self.root))
+        self.downloads = 0
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def _handler(self):
+        alexa = self
+
+        class ChainHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                alexa.downloads += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-pem-file")
+                self.send_header("Content-Length", str(len(alexa.chain)))
+                self.end_headers()
+                self.wfile.write(alexa.chain)
+
+            def log_message(self, *args):
+                pass
+        return ChainHandler
+
+    def fetch(self, url):
+        # type: (str) -> bytes
+        """The chain at an Alexa certificate URL, from the local server."""
+        path = urllib.parse.urlparse(url).path
+        local_url = "http://127.0.0.1:{}{}".format(self._server.server_address[1], path)
+        with urllib.request.urlopen(local_url, timeout=5) as response:
+            return response.read()
+
+    def sign(self, event, timestamp=None):
+        # type: (Dict[str, Any], Optional[datetime.datetime]) -> Tuple[Dict[str, str], bytes]
+        """Headers and body of the request Alexa would send for event.
+
+        The request's timestamp is set to timestamp, by default now.
+        """
+        event = dict(event, request=dict(event["request"]))
+        timestamp = timestamp or datetime.datetime.now(datetime.timezone.utc)
+        event["request"]["timestamp"] = timestamp.strftime("%Y-%m-%dT%H:%M:%SZ")
+        body = json.dumps(event).encode("utf-8")
+        signature = self._key.sign(body, padding.PKCS1v15(), hashes.SHA256())
+        headers = {request_verifier.SIGNATURE_CERT_CHAIN_URL_HEADER: CERT_URL,
+                   request_verifier.SIGNATURE_HEADER: base64.b64encode(signature).decode("ascii"),
+                   "Content-Type": "application/json"}
+        return headers, body
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+# In-process stand-in for a boto3 DynamoDB resource, for running the skill and
+# the persistence adapters locally without AWS.
+#
+#   resource = LocalDynamoDbResource()
+#   adapter = dynamodb_persistence.UpdateItemDynamoDbAdapter(table_name="t", dynamodb_resource=resource)
+#
+# Only what the persistence adapters use is implemented: get_item, put_item,
+# update_item (SET/REMOVE/ADD on attribute paths, a ConditionExpression of
+# "path = :value" and "attribute_not_exists(path)" terms joined with OR) and
+# delete_item. Numbers come back as Decimal and a failed condition raises
+# ConditionalCheckFailedException, like the real service. Every call is
+# appended to table.operations so callers can check what was sent.
+
+import copy
+import re
+import threading
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+_ACTION = re.compile(r'\b(SET|REMOVE|ADD)\s+')
+_NOT_EXISTS = re.compile(r'^attribute_not_exists\((.+)\)$')
+
+
+def _to_dynamo(value):
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, Decimal)):
+        return Decimal(value)
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if isinstance(value, dict):
+        return {key: _to_dynamo(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_dynamo(item) for item in value]
+    return copy.deepcopy(value)
+
+
+def item_size(item):
+    """Stored size of an item in bytes, by the rules DynamoDB bills read and write units on:
+    attribute names and strings by UTF-8 length, numbers by significant digits, one byte
+    for booleans and nulls, three per map or list plus one per element.
+    """
+    return sum(len(name.encode('utf-8')) + _value_size(value) for name, value in item.items())
+
+
+def _value_size(value):
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (int, Decimal)):
+        digits = Decimal(value).normalize().as_tuple().digits
+        return (len(digits) + 1) // 2 + 1
+    if isinstance(value, dict):
+        return 3 + sum(1 + len(name.encode('utf-8')) + _value_size(item) for name, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return 3 + sum(1 + _value_size(item) for item in value)
+    return len(str(value).encode('utf-8'))
+
+
+class LocalTable(object):
+    def __init__(self, name):
+        self.name = name
+        self.items = {}
+        self.operations = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(key):
+        return tuple(sorted(key.items()))
+
+    def get_item(self, Key, ConsistentRead=False):
+        with self._lock:
+            self.operations.append(("get_item", Key))
+            item = self.items.get(self._key(Key))
+            return {"Item": copy.deepcopy(item)} if item is not None else {}
+
+    def put_item(self, Item):
+        with self._lock:
+            self.operations.append(("put_item", Item))
+            key = {name: Item[name] for name in self._key_names(Item)}
+            self.items[self._key(key)] = _to_dynamo(Item)
+            return {}
+
+    def delete_item(self, Key):
+        with self._lock:
+            self.operations.append(("delete_item", Key))
+            self.items.pop(self._key(Key), None)
+            return {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ConditionExpression=None):
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        with self._lock:
+            self.operations.append(("update_item", Key, UpdateExpression))
+            stored = self.items.get(self._key(Key))
+            if ConditionExpression is not None and not self._check(stored or {}, ConditionExpression, names, values):
+                raise ClientError({"Error": {"Code": "ConditionalCheckFailedException",
+                                             "Message": "The conditional request failed"}}, "UpdateItem")
+            # applied to a copy so a failed update leaves the item (or its absence) as it was
+            item = copy.deepcopy(stored) or _to_dynamo(dict(Key))
+            parts = _ACTION.split(UpdateExpression)
+            for action, clause in zip(parts[1::2], parts[2::2]):
+                for assignment in clause.split(','):
+                    if action == "SET":
+                        target, placeholder = [side.strip() for side in assignment.split('=')]
+                        self._set(item, self._path(target, names), _to_dynamo(values[placeholder]))
+                    elif action == "ADD":
+                        target, placeholder = assignment.split()
+                        path = self._path(target, names)
+                        found, current = self._get(item, path)
+                        self._set(item, path, (current if found else 0) + _to_dynamo(values[placeholder]))
+                    else:
+                        self._remove(item, self._path(assignment.strip(), names))
+            self.items[self._key(Key)] = item
+            return {}
+
+    @staticmethod
+    def _key_names(item):
+        # the adapters only use a single partition key, which is put first
+        return [next(iter(item))]
+
+    @staticmethod
+    def _path(expression, names):
+        return [names.get(part, part) for part in expression.split('.')]
+
+    def _check(self, item, condition, names, values):
+        for term in condition.split(" OR "):
+            term = term.strip()
+            not_exists = _NOT_EXISTS.match(term)
+            if not_exists:
+                if not self._get(item, self._path(not_exists.group(1), names))[0]:
+                    return True
+            else:
+                target, placeholder = [side.strip() for side in term.split('=')]
+                found, value = self._get(item, self._path(target, names))
+                if found and value == _to_dynamo(values[placeholder]):
+                    return True
+        return False
+
+    @staticmethod
+    def _get(item, path):
+        for part in path:
+            if not isinstance(item, dict) or part not in item:
+                return False, None
+            item = item[part]
+        return True, item
+
+    @staticmethod
+    def _set(item, path, value):
+        for part in path[:-1]:
+            if part not in item:
+                raise ValueError("The document path provided in the update expression is invalid for update")
+            item = item[part]
+        item[path[-1]] = value
+
+    @staticmethod
+    def _remove(item, path):
+        for part in path[:-1]:
+            item = item.get(part, {})
+        item.pop(path[-1], None)
+
+
+class LocalDynamoDbResource(object):
+    """Stand-in for boto3.resource('dynamodb'), tables are created on first use."""
+
+    def __init__(self):
+        self._tables = {}
+
+    def Table(self, name):
+        if name not in self._tables:
+            self._tables[name] = LocalTable(name)
+        return self._tables[name]
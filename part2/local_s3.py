@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+# In-process stand-in for the parts of a boto3 S3 client the skill uses, for
+# running it locally without AWS.
+#
+#   s3 = LocalS3Client(region_name="eu-west-1")
+#   s3.put_object(Bucket="bucket", Key="Media/catalog.jsonl", Body=data)
+#   manifest.load_manifest(s3, "bucket", "Media/catalog.jsonl")
+#
+# get_object returns a body with read/iter_chunks/iter_lines like botocore's
+# StreamingBody. generate_presigned_url signs locally with sigv4.py using
+# fixed test credentials. Missing objects and failed IfNoneMatch puts raise
+# botocore's ClientError. Calls are counted in .calls.
+
+import collections
+import hashlib
+import io
+
+from botocore.exceptions import ClientError
+
+import sigv4
+
+
+class LocalStreamingBody(object):
+    def __init__(self, data, chunk_size=1024):
+        self._stream = io.BytesIO(data)
+        self._chunk_size = chunk_size
+
+    def read(self, amt=None):
+        return self._stream.read(amt)
+
+    def iter_chunks(self, chunk_size=None):
+        chunk_size = chunk_size or self._chunk_size
+        while True:
+            chunk = self._stream.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def iter_lines(self, chunk_size=None, keepends=False):
+        pending = b''
+        for chunk in self.iter_chunks(chunk_size):
+            lines = (pending + chunk).splitlines(True)
+            for line in lines[:-1]:
+                yield line if keepends else line.splitlines()[0]
+            pending = lines[-1]
+        if pending:
+            yield pending if keepends else pending.splitlines()[0]
+
+    def close(self):
+        self._stream.close()
+
+
+class _Meta(object):
+    def __init__(self, region_name):
+        self.region_name = region_name
+        self.endpoint_url = "https://s3.{}.amazonaws.com".format(region_name)
+
+
+class LocalS3Client(object):
+    ACCESS_KEY = "AKIDEXAMPLE"
+    SECRET_KEY = "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY"
+
+    def __init__(self, region_name="eu-west-1"):
+        self.meta = _Meta(region_name)
+        self.objects = {}
+        self.calls = collections.Counter()
+
+    def put_object(self, Bucket, Key, Body, IfNoneMatch=None):
+        self.calls["put_object"] += 1
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        if IfNoneMatch == "*" and (Bucket, Key) in self.objects:
+            raise ClientError({"Error": {"Code": "PreconditionFailed",
+                                         "Message": "At least one of the pre-conditions you specified did not hold"}},
+                              "PutObject")
+        self.objects[(Bucket, Key)] = Body
+        return {"ETag": self._etag(Body)}
+
+    def head_object(self, Bucket, Key):
+        self.calls["head_object"] += 1
+        data = self._get(Bucket, Key)
+        return {"ETag": self._etag(data), "ContentLength": len(data)}
+
+    def get_object(self, Bucket, Key):
+        self.calls["get_object"] += 1
+        data = self._get(Bucket, Key)
+        return {"ETag": self._etag(data), "ContentLength": len(data), "Body": LocalStreamingBody(data)}
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, HttpMethod=None):
+        self.calls["generate_presigned_url"] += 1
+        return sigv4.presign_get_url(self.meta.endpoint_url, self.meta.region_name,
+                                     Params["Bucket"], Params["Key"],
+                                     self.ACCESS_KEY, self.SECRET_KEY, expires_in=ExpiresIn)
+
+    def _get(self, bucket, key):
+        try:
+            return self.objects[(bucket, key)]
+        except KeyError:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": "The specified key does not exist."}},
+                              "GetObject")
+
+    @staticmethod
+    def _etag(data):
+        return '"{}"'.format(hashlib.md5(data).hexdigest())
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+# Catalog manifests stored in S3.
+#
+# Instead of editing track_info.py and redeploying, the catalog can be kept in
+# the skill's S3 bucket as a manifest and named in CATALOG_MANIFEST_KEY, e.g.
+#   Media/catalog.jsonl    one JSON object per line: {"genre", "title", "artist", "url"}
+#   Media/catalog.idx      the binary index format below, e.g. built with write_index()
+#
+# The manifest is streamed and parsed line by line straight into a binary
+# index file in /tmp named after the manifest and its ETag. Later warm
+# invocations, and re-inits on the same container, memory-map that file
+# instead of downloading and parsing the manifest again. Tracks are decoded
+# one at a time when they are accessed. Once the manifest has changed, the
+# index files of its earlier versions are removed.
+#
+# Index file layout (little endian, like the x86_64 and arm64 Lambda runtimes):
+#   MAGIC
+#   record*        uint16 length of genre, title, artist, url, then the four UTF-8 strings
+#   uint64[count]  offset of each record
+#   footer         uint64 offset of the offset table, uint32 count, MAGIC
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+MAGIC = b"TRKIDX01"
+FIELDS = ("genre", "title", "artist", "url")
+_LENGTHS = struct.Struct("<4H")
+_FOOTER = struct.Struct("<QI8s")
+CACHE_DIR = os.environ.get('CATALOG_CACHE_DIR', tempfile.gettempdir())
+
+
+def iter_jsonl(lines):
+    """Parse JSONL incrementally.
+
+    :param lines: iterable of bytes or str lines
+    :return: generator of dicts, blank lines are skipped
+    """
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def write_index(records, path):
+    """Write records to an index file, streaming.
+
+    The file is written next to path and renamed into place, so readers never
+    see a partial file.
+
+    :param records: iterable of dicts with genre, title, artist and url
+    :param path: destination file
+    :return: number of records written
+    """
+    offsets = array('Q')
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".catalog-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(MAGIC)
+            position = len(MAGIC)
+            for record in records:
+                values = [(record.get(name) or "").encode("utf-8") for name in FIELDS]
+                offsets.append(position)
+                out.write(_LENGTHS.pack(*[len(value) for value in values]))
+                for value in values:
+                    out.write(value)
+                position += _LENGTHS.size + sum(len(value) for value in values)
+            offsets.tofile(out)
+            out.write(_FOOTER.pack(position, len(offsets), MAGIC))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return len(offsets)
+
+
+class TrackIndexFile(object):
+    """Read-only, memory-mapped index file.
+
+    Indexing returns a dict for one track, decoded from the mapping on access.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as index_file:
+            self._map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC or len(self._map) < len(MAGIC) + _FOOTER.size:
+            self._map.close()
+            raise ValueError("{} is not a catalog index file".format(path))
+        table, self._count, magic = _FOOTER.unpack_from(self._map, len(self._map) - _FOOTER.size)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError("{} is truncated".format(path))
+        self._offsets = memoryview(self._map)[table:table + 8 * self._count].cast("Q")
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("track index out of range")
+        position = self._offsets[index]
+        lengths = _LENGTHS.unpack_from(self._map, position)
+        position += _LENGTHS.size
+        record = {}
+        for name, length in zip(FIELDS, lengths):
+            record[name] = self._map[position:position + length].decode("utf-8")
+            position += length
+        return record
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+
+def _cache_prefix(bucket, key):
+    return "catalog-{}-".format(hashlib.sha1("{}/{}".format(bucket, key).encode("utf-8")).hexdigest()[:16])
+
+
+def _cache_path(bucket, key, etag):
+    name = hashlib.sha1(etag.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, "{}{}.idx".format(_cache_prefix(bucket, key), name))
+
+
+def _remove_stale(bucket, key, path):
+    # index files of earlier versions of the manifest; one still mapped by a reader stays readable
+    prefix = _cache_prefix(bucket, key)
+    for name in os.listdir(CACHE_DIR):
+        stale = os.path.join(CACHE_DIR, name)
+        if name.startswith(prefix) and name.endswith(".idx") and stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def load_manifest(s3_client, bucket, key):
+    """Load a catalog manifest from S3, using the /tmp index file when it is current.
+
+    :param s3_client: boto3 S3 client (or a stand-in with head_object/get_object)
+    :param bucket: bucket name
+    :param key: manifest key, .idx for a binary index, anything else is read as JSONL
+    :return: TrackIndexFile
+    """
+    etag = s3_client.head_object(Bucket=bucket, Key=key)["ETag"]
+    path = _cache_path(bucket, key, etag)
+    if os.path.exists(path):
+        try:
+            return TrackIndexFile(path)
+        except ValueError:
+            os.remove(path)
+
+    body = s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+    if key.endswith(".idx"):
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=".catalog-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in body.iter_chunks():
+                    out.write(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    else:
+        write_index(iter_jsonl(body.iter_lines()), path)
+    _remove_stale(bucket, key, path)
+    return TrackIndexFile(path)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+# Persistence adapter that keeps the attributes in process memory.
+#
+# Nothing survives the container, so this is for running and load testing the
+# skill locally (PERSISTENCE_BACKEND=memory, see persistence_backends.py), not
+# for a deployed skill. The least recently used users are dropped past
+# max_items, which bounds the memory a long load test can take.
+
+import copy
+import threading
+from collections import OrderedDict
+
+from ask_sdk_core.attributes_manager import AbstractPersistenceAdapter
+from ask_sdk_dynamodb.partition_keygen import user_id_partition_keygen
+
+
+class InMemoryPersistenceAdapter(AbstractPersistenceAdapter):
+    """Attributes per user in an LRU dict.
+
+    get_attributes and save_attributes copy the attributes, so a handler
+    changing the dict it got does not change what is stored until it is saved,
+    the same as with a real store.
+
+    :param max_items: users kept before the least recently used is dropped
+    :param partition_keygen: callable returning the key for a request envelope
+    """
+
+    def __init__(self, max_items=10000, partition_keygen=user_id_partition_keygen):
+        self.max_items = max_items
+        self.partition_keygen = partition_keygen
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_attributes(self, request_envelope):
+        # type: (RequestEnvelope) -> Dict[str, object]
+        key = self.partition_keygen(request_envelope)
+        with self._lock:
+            attributes = self._items.get(key)
+            if attributes is None:
+                return {}
+            self._items.move_to_end(key)
+        return copy.deepcopy(attributes)
+
+    def save_attributes(self, request_envelope, attributes):
+        # type: (RequestEnvelope, Dict[str, object]) -> None
+        key = self.partition_keygen(request_envelope)
+        attributes = copy.deepcopy(dict(attributes))
+        with self._lock:
+            self._items[key] = attributes
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def delete_attributes(self, request_envelope):
+        # type: (RequestEnvelope) -> None
+        key = self.partition_keygen(request_envelope)
+        with self._lock:
+            self._items.pop(key, None)
+
+    def __len__(self):
+        return len(self._items)
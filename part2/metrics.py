@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+# Per-invocation timings logged in CloudWatch Embedded Metric Format.
+#
+# MetricsRequestInterceptor starts an invocation and
+# MetricsResponseInterceptor ends it, writing one EMF JSON line to stdout.
+# CloudWatch Logs turns that line into metrics without any extra network
+# calls. Code in between adds to the invocation's timings with timed():
+#
+#   with metrics.timed("DynamoDBLoadTime"):
+#       persistence_attr = handler_input.attributes_manager.persistent_attributes
+#
+# The line looks like
+#   {"_aws": {"Timestamp": ..., "CloudWatchMetrics": [{"Namespace": "AudioSkill",
+#     "Dimensions": [["RequestType"]], "Metrics": [{"Name": "HandlerTime", "Unit": "Milliseconds"}, ...]}]},
+#    "RequestType": "AMAZON.NextIntent", "HandlerTime": 3.1, "DynamoDBLoadTime": 1.2, ...}
+#
+# count() adds to a count instead, e.g. metrics.count(metrics.ATTRIBUTE_CACHE_HITS).
+#
+# Outside an invocation timed() and count() do nothing. The cost per invocation is two
+# perf_counter calls per timed block plus filling in a cached line template
+# and one write, a few microseconds, see benchmarks/bench_metrics.py. Set
+# METRICS_ENABLED=0 to turn it off.
+
+import contextvars
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from ask_sdk_core.dispatch_components import AbstractRequestInterceptor
+from ask_sdk_core.dispatch_components import AbstractResponseInterceptor
+
+ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'AudioSkill')
+
+HANDLER_TIME = "HandlerTime"
+DYNAMODB_LOAD_TIME = "DynamoDBLoadTime"
+DYNAMODB_SAVE_TIME = "DynamoDBSaveTime"
+PRESIGN_TIME = "PresignTime"
+ERRORS = "Errors"
+ATTRIBUTE_CACHE_HITS = "AttributeCacheHits"
+ATTRIBUTE_CACHE_CONFLICTS = "AttributeCacheConflicts"
+COUNTS = frozenset((ERRORS, ATTRIBUTE_CACHE_HITS, ATTRIBUTE_CACHE_CONFLICTS))
+
+_current = contextvars.ContextVar("metrics_invocation", default=None)
+_output = None      # None: sys.stdout at the time of writing
+
+
+class Invocation(object):
+    """Timings (in milliseconds) collected for one request."""
+    __slots__ = ('request_type', 'start', 'values')
+
+    def __init__(self, request_type):
+        self.request_type = request_type
+        self.start = time.perf_counter()
+        self.values = {}
+
+    def add(self, name, value):
+        self.values[name] = self.values.get(name, 0) + value
+
+
+def set_output(stream):
+    """Write the EMF lines to stream instead of stdout (e.g. in benchmarks), None for stdout."""
+    global _output
+    _output = stream
+
+
+def begin(request_type):
+    # type: (str) -> Optional[Invocation]
+    """Start collecting timings for a request."""
+    if not ENABLED:
+        return None
+    invocation = Invocation(request_type)
+    _current.set(invocation)
+    return invocation
+
+
+def discard():
+    """Drop the current invocation without logging it."""
+    _current.set(None)
+
+
+def end(error=False):
+    # type: (bool) -> None
+    """Log the current invocation's timings as one EMF line."""
+    invocation = _current.get()
+    if invocation is None:
+        return
+    _current.set(None)
+    values = invocation.values
+    values[HANDLER_TIME] = (time.perf_counter() - invocation.start) * 1e3
+    if error:
+        values[ERRORS] = 1
+    (_output or sys.stdout).write(format_emf(invocation.request_type, values) + "\n")
+
+
+def format_emf(request_type, values):
+    # type: (str, Dict[str, float]) -> str
+    """EMF JSON for one invocation."""
+    names = tuple(values)
+    template = _emf_template(request_type, names)
+    return template % ((int(time.time() * 1000),) + tuple(values[name] for name in names))
+
+
+@lru_cache(maxsize=256)
+def _emf_template(request_type, names):
+    # everything but the timestamp and the values is the same for every
+    # invocation of a request type, so it is serialized once
+    directives = json.dumps([{
+        "Namespace": NAMESPACE,
+        "Dimensions": [["RequestType"]],
+        "Metrics": [{"Name": name, "Unit": "Count" if name in COUNTS else "Milliseconds"}
+                    for name in names],
+    }], separators=(',', ':'))
+    fields = "".join(",{}:%.3f".format(json.dumps(name).replace("%", "%%")) for name in names)
+    return ('{"_aws":{"Timestamp":%d,"CloudWatchMetrics":' + directives.replace("%", "%%") +
+            '},"RequestType":' + json.dumps(request_type).replace("%", "%%") + fields + '}')
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current invocation's metric name."""
+    invocation = _current.get()
+    if invocation is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        invocation.add(name, (time.perf_counter() - start) * 1e3)
+
+
+def count(name, value=1):
+    """Add value to the current invocation's count name."""
+    invocation = _current.get()
+    if invocation is not None:
+        invocation.add(name, value)
+
+
+def request_type(request_envelope):
+    # type: (RequestEnvelope) -> str
+    """Metric dimension for a request: the intent name for intents, else the request type."""
+    request = request_envelope.request
+    if request.object_type == "IntentRequest":
+        return request.intent.name
+    return request.object_type
+
+
+class MetricsRequestInterceptor(AbstractRequestInterceptor):
+    """Starts timing the request. Register it before the other request interceptors."""
+    def process(self, handler_input):
+        # type: (HandlerInput) -> None
+        begin(request_type(handler_input.request_envelope))
+
+
+class MetricsResponseInterceptor(AbstractResponseInterceptor):
+    """Logs the request's timings. Register it after the other response interceptors."""
+    def process(self, handler_input, response):
+        # type: (HandlerInput, Response) -> None
+        end()
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+
+# Helpers for the persistent attributes kept in DynamoDB.
+#
+# TrackedDict wraps the attribute map loaded by
+# LoadPersistenceAttributesRequestInterceptor and records which fields were
+# changed while handling the request, so SavePersistenceAttributesResponseInterceptor
+# only writes back when something actually changed.
+#
+# dynamodb_persistence.UpdateItemDynamoDbAdapter uses those changed paths to
+# send a DynamoDB UpdateItem with SET/REMOVE on just the changed fields
+# instead of a full put_item of the whole attribute map.
+#
+# LazyPersistenceAdapter defers creating the real adapter (and importing
+# boto3) until the first request that reads or writes attributes.
+#
+# When a write is refused because the stored attributes changed since they
+# were read (see attribute_cache.py), replay_changes() applies the recorded
+# changes again on top of the newer attributes.
+
+import copy
+import threading
+
+from ask_sdk_core.attributes_manager import AbstractPersistenceAdapter
+from ask_sdk_core.exceptions import PersistenceException
+
+# item attribute counting the writes to a DynamoDB item, see dynamodb_persistence.py
+VERSION_NAME = "version"
+
+
+class StaleAttributesError(PersistenceException):
+    """A conditional save found a newer version of the attributes than the one it was based on."""
+
+
+class TrackedDict(dict):
+    """dict that records the paths of changed keys, including nested dicts.
+
+    Nested dict values are wrapped too, so
+        attrs["playback_settings"]["offset_in_milliseconds"] = 0
+    marks ("playback_settings", "offset_in_milliseconds") as changed.
+    Setting a key to the value it already has is not a change.
+    """
+
+    def __init__(self, data=None, _root=None, _path=()):
+        super(TrackedDict, self).__init__()
+        self._root = self if _root is None else _root
+        self._path = _path
+        if _root is None:
+            self._changes = set()
+            self._new = not data
+        for key, value in (data or {}).items():
+            dict.__setitem__(self, key, self._wrap(key, value))
+
+    def _wrap(self, key, value):
+        if isinstance(value, dict) and not (isinstance(value, TrackedDict) and value._root is self._root):
+            return TrackedDict(value, _root=self._root, _path=self._path + (key,))
+        return value
+
+    def _changed(self, key):
+        self._root._changes.add(self._path + (key,))
+
+    def __setitem__(self, key, value):
+        if key in self and dict.__getitem__(self, key) == value:
+            return
+        dict.__setitem__(self, key, self._wrap(key, value))
+        self._changed(key)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._changed(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def pop(self, key, *default):
+        had_key = key in self
+        value = dict.pop(self, key, *default)
+        if had_key:
+            self._changed(key)
+        return value
+
+    def popitem(self):
+        key, value = dict.popitem(self)
+        self._changed(key)
+        return key, value
+
+    def clear(self):
+        for key in list(self):
+            self._changed(key)
+        dict.clear(self)
+
+    @property
+    def dirty(self):
+        """True if anything under the root has changed since load or mark_clean()."""
+        return bool(self._root._changes)
+
+    @property
+    def changed_paths(self):
+        """Set of key paths (tuples) changed since load or mark_clean()."""
+        return frozenset(self._root._changes)
+
+    @property
+    def new(self):
+        """True if the attributes were empty when loaded, i.e. there is no stored item yet."""
+        return self._root._new
+
+    def mark_clean(self):
+        """Forget recorded changes, e.g. after the attributes were saved."""
+        self._root._changes.clear()
+
+    def to_dict(self):
+        """Plain dict copy, with nested TrackedDicts converted too."""
+        return {key: value.to_dict() if isinstance(value, TrackedDict) else value
+                for key, value in self.items()}
+
+    def __reduce__(self):
+        # pickle/deepcopy as a plain dict
+        return (dict, (self.to_dict(),))
+
+
+def build_update_expression(attribute_name, attributes):
+    """Turn the changes recorded on a TrackedDict into an UpdateItem expression.
+
+    Only the shortest changed paths are kept, e.g. if "playback_settings" was
+    replaced the change to "playback_settings.token" is already covered.
+
+    :param attribute_name: name of the item attribute holding the attribute map
+    :param attributes: TrackedDict with recorded changes
+    :return: (update_expression, expression_attribute_names, expression_attribute_values)
+        or None if nothing changed
+    """
+    kept = _outermost_changes(attributes)
+    if not kept:
+        return None
+
+    names = {"#attr": attribute_name}
+    name_refs = {}
+    values = {}
+    set_actions = []
+    remove_actions = []
+    for path in sorted(kept):
+        refs = ["#attr"]
+        for part in path:
+            if part not in name_refs:
+                name_refs[part] = "#n{}".format(len(name_refs))
+                names[name_refs[part]] = part
+            refs.append(name_refs[part])
+        target = ".".join(refs)
+
+        found, value = _lookup(attributes, path)
+        if found:
+            placeholder = ":v{}".format(len(values))
+            values[placeholder] = value.to_dict() if isinstance(value, TrackedDict) else value
+            set_actions.append("{} = {}".format(target, placeholder))
+        else:
+            remove_actions.append(target)
+
+    expression = []
+    if set_actions:
+        expression.append("SET " + ", ".join(set_actions))
+    if remove_actions:
+        expression.append("REMOVE " + ", ".join(remove_actions))
+    return " ".join(expression), names, values
+
+
+def replay_changes(attributes, target):
+    """Make the changes recorded on attributes to target as well.
+
+    :param attributes: TrackedDict with recorded changes
+    :param target: TrackedDict, e.g. the same attributes loaded again after a
+        conflicting write, it records the changes in turn
+    """
+    for path in _outermost_changes(attributes):
+        found, value = _lookup(attributes, path)
+        parent = target
+        for part in path[:-1]:
+            if not isinstance(parent.get(part), dict):
+                parent[part] = {}
+            parent = parent[part]
+        if found:
+            parent[path[-1]] = copy.deepcopy(value)
+        elif path[-1] in parent:
+            del parent[path[-1]]
+
+
+def _outermost_changes(attributes):
+    kept = []
+    for path in sorted(attributes.changed_paths, key=len):
+        if not any(path[:len(prefix)] == prefix for prefix in kept):
+            kept.append(path)
+    return kept
+
+
+def _lookup(attributes, path):
+    value = attributes
+    for part in path:
+        if not isinstance(value, dict) or part not in value:
+            return False, None
+        value = value[part]
+    return True, value
+
+
+class LazyPersistenceAdapter(AbstractPersistenceAdapter):
+    """Persistence adapter that creates the real one on first use.
+
+    Importing ask_sdk_dynamodb.adapter imports boto3 and builds a default
+    DynamoDB resource, which is a large part of the Lambda init time.
+    Requests that never touch the attributes (e.g. the AudioPlayer fast path)
+    never pay for it.
+
+    Attributes of the real adapter (table_name, dynamodb, ...) are available
+    on this one too.
+
+    :param factory: callable returning the real adapter
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._adapter = None
+        self._lock = threading.Lock()
+
+    @property
+    def adapter(self):
+        """The real adapter, created on first access."""
+        if self._adapter is None:
+            with self._lock:
+                if self._adapter is None:
+                    self._adapter = self._factory()
+        return self._adapter
+
+    def get_attributes(self, request_envelope):
+        # type: (RequestEnvelope) -> Dict[str, object]
+        return self.adapter.get_attributes(request_envelope)
+
+    def save_attributes(self, request_envelope, attributes):
+        # type: (RequestEnvelope, Dict[str, object]) -> None
+        return self.adapter.save_attributes(request_envelope, attributes)
+
+    def delete_attributes(self, request_envelope):
+        # type: (RequestEnvelope) -> None
+        return self.adapter.delete_attributes(request_envelope)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.adapter, name)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+# Persistence backends by name, picked with the PERSISTENCE_BACKEND
+# environment variable:
+#   dynamodb  (default) the Alexa-hosted DynamoDB table, see dynamodb_persistence.py
+#             DYNAMODB_PERSISTENCE_REGION, DYNAMODB_PERSISTENCE_TABLE_NAME,
+#             PLAYBACK_STATE_FORMAT ("packed" or "map", see playback_state.py),
+#             ATTRIBUTE_CACHE_TTL (seconds a cached read may be old, default 0:
+#             no cache) and
+#             ATTRIBUTE_CACHE_SIZE (default 1000 users), see attribute_cache.py
+#   memory    process memory, see memory_persistence.py
+#             PERSISTENCE_MEMORY_MAX_ITEMS (default 10000 users)
+#   sqlite    a SQLite file, see sqlite_persistence.py
+#             PERSISTENCE_SQLITE_PATH (default /tmp/skill_attributes.sqlite3)
+#
+# Each factory imports its adapter module when called, so choosing a backend
+# doesn't import the others (boto3 in particular). Every backend implements
+# the SDK's AbstractPersistenceAdapter and passes
+# benchmarks/check_persistence.py.
+#
+#   adapter = create_persistence_adapter(os.environ.get('PERSISTENCE_BACKEND', 'dynamodb'))
+#   register_backend("redis", create_redis_adapter)   # another backend
+
+import os
+
+_backends = {}
+
+
+def register_backend(name, factory):
+    # type: (str, Callable[[], AbstractPersistenceAdapter]) -> None
+    _backends[name] = factory
+
+
+def backend_names():
+    # type: () -> List[str]
+    return sorted(_backends)
+
+
+def create_persistence_adapter(name):
+    # type: (str) -> AbstractPersistenceAdapter
+    """New adapter of the named backend.
+
+    :raises: ValueError for a name no backend is registered under
+    """
+    try:
+        factory = _backends[name]
+    except KeyError:
+        raise ValueError("Unknown persistence backend {!r}, expected one of {}".format(
+            name, ", ".join(backend_names())))
+    return factory()
+
+
+def create_dynamodb_adapter(dynamodb_resource=None):
+    from attribute_cache import CachingPersistenceAdapter
+    from dynamodb_persistence import PackedStateDynamoDbAdapter, UpdateItemDynamoDbAdapter
+    if dynamodb_resource is None:
+        import boto3
+        dynamodb_resource = boto3.resource('dynamodb', region_name=os.environ.get('DYNAMODB_PERSISTENCE_REGION'))
+    # writes only the changed fields with UpdateItem, see persistence.py
+    if os.environ.get('PLAYBACK_STATE_FORMAT', 'packed') == 'map':
+        adapter_class = UpdateItemDynamoDbAdapter
+    else:
+        adapter_class = PackedStateDynamoDbAdapter
+    adapter = adapter_class(table_name=os.environ.get('DYNAMODB_PERSISTENCE_TABLE_NAME'), create_table=False,
+                            dynamodb_resource=dynamodb_resource)
+    ttl = float(os.environ.get('ATTRIBUTE_CACHE_TTL', '0'))
+    if ttl > 0:
+        adapter = CachingPersistenceAdapter(adapter, ttl, int(os.environ.get('ATTRIBUTE_CACHE_SIZE', '1000')))
+    return adapter
+
+
+def create_memory_adapter():
+    from memory_persistence import InMemoryPersistenceAdapter
+    return InMemoryPersistenceAdapter(max_items=int(os.environ.get('PERSISTENCE_MEMORY_MAX_ITEMS', '10000')))
+
+
+def create_sqlite_adapter():
+    from sqlite_persistence import SqlitePersistenceAdapter
+    return SqlitePersistenceAdapter(os.environ.get('PERSISTENCE_SQLITE_PATH', '/tmp/skill_attributes.sqlite3'))
+
+
+register_backend("dynamodb", create_dynamodb_adapter)
+register_backend("memory", create_memory_adapter)
+register_backend("sqlite", create_sqlite_adapter)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+# Play queue: the order tracks play in, the repeat mode and tracks queued to
+# play next.
+#
+# The queue state lives with the playback settings:
+#   shuffle_seed                    the play order, see shuffle.py
+#   playback_settings["repeat"]     "all" (the default: wrap round at the end),
+#                                   "one" (play the same track again) or
+#                                   "off" (stop after the last track)
+#   playback_settings["up_next"]    track indexes queued with play_next(),
+#                                   played before the rest of the order
+#   playback_settings["filter"]     key of a genre or artist search result
+#                                   to play instead of the whole catalog
+#                                   (see search.py)
+#
+# Everything but the up_next list travels in the stream token's queue id, so
+# the track after the one playing is known from the token alone:
+#   ""            catalog order, repeat all
+#   "s1f3a-r1"    shuffled with seed 0x1f3a, repeat one
+#   "fg2e00f41599" catalog order, only the tracks in one genre
+#   "r0-q"        catalog order, repeat off, tracks queued in up_next (the
+#                 stored state has to be read, see needs_stored_state())
+#
+# Without an up_next list the queue id and a track decide the track after it,
+# so PlaybackNearlyFinished works it out from the token alone: a step through
+# the play order, the token for it and the presigned URL (cached, see utils.py).
+#
+#   queue = PlayQueue.from_queue_id(current.queue_id, catalog)
+#   entry = queue.following(current.index)    # None at the end with repeat off
+#   entry.token, entry.track.url
+
+import collections
+
+from search import get_search_index
+from shuffle import play_order
+from stream_token import encode_token
+
+REPEAT_ALL = "all"
+REPEAT_ONE = "one"
+REPEAT_OFF = "off"
+
+MAX_UP_NEXT = 50   # keeps the DynamoDB item small
+
+_REPEAT_IDS = {REPEAT_ONE: "r1", REPEAT_OFF: "r0"}
+_REPEAT_MODES = {"r1": REPEAT_ONE, "r0": REPEAT_OFF}
+
+QueueEntry = collections.namedtuple('QueueEntry', ['index', 'token', 'track'])
+
+
+def encode_queue_id(seed=None, repeat=REPEAT_ALL, has_up_next=False, filter_key=None):
+    # type: (Optional[int], str, bool, Optional[str]) -> str
+    parts = []
+    if filter_key is not None:
+        parts.append("f" + filter_key)
+    if seed is not None:
+        parts.append("s{:x}".format(int(seed)))
+    if repeat in _REPEAT_IDS:
+        parts.append(_REPEAT_IDS[repeat])
+    if has_up_next:
+        parts.append("q")
+    return "-".join(parts)
+
+
+def decode_queue_id(queue_id):
+    # type: (str) -> Tuple[Optional[int], str, bool, Optional[str]]
+    """(seed, repeat, has_up_next, filter_key) for a queue id. Unknown parts are ignored."""
+    seed, repeat, has_up_next, filter_key = None, REPEAT_ALL, False, None
+    for part in (queue_id or "").split("-"):
+        if part.startswith("f"):
+            filter_key = part[1:] or None
+        elif part.startswith("s"):
+            try:
+                seed = int(part[1:], 16)
+            except ValueError:
+                pass
+        elif part in _REPEAT_MODES:
+            repeat = _REPEAT_MODES[part]
+        elif part == "q":
+            has_up_next = True
+    return seed, repeat, has_up_next, filter_key
+
+
+def needs_stored_state(queue_id):
+    # type: (str) -> bool
+    """Whether the track after one from this queue depends on the stored up_next list."""
+    return decode_queue_id(queue_id)[2]
+
+
+class PlayQueue(object):
+    """Play order, repeat mode, up_next list and search filter for one user.
+
+    :param catalog: catalog.Catalog
+    :param seed: shuffle seed, None for catalog order
+    :param repeat: REPEAT_ALL, REPEAT_ONE or REPEAT_OFF
+    :param up_next: track indexes to play before the rest of the order
+    :param filter_key: search.Match key of the genre or artist to play, None for the whole catalog
+    """
+    __slots__ = ('catalog', 'order', 'repeat', 'up_next', 'filter_key', '_seed')
+
+    def __init__(self, catalog, seed=None, repeat=REPEAT_ALL, up_next=(), filter_key=None):
+        self.catalog = catalog
+        self._seed = seed
+        self.set_filter(filter_key)
+        self.repeat = repeat if repeat in _REPEAT_IDS else REPEAT_ALL
+        # DynamoDB returns numbers as Decimal
+        self.up_next = [int(index) for index in up_next if int(index) in catalog]
+
+    @classmethod
+    def from_attributes(cls, persistence_attr, catalog):
+        # type: (dict, catalog.Catalog) -> PlayQueue
+        """Queue stored in the persistent attributes."""
+        settings = persistence_attr.get("playback_settings") or {}
+        return cls(catalog, persistence_attr.get("shuffle_seed"),
+                   settings.get("repeat", REPEAT_ALL), settings.get("up_next") or (), settings.get("filter"))
+
+    @classmethod
+    def from_queue_id(cls, queue_id, catalog):
+        # type: (str, catalog.Catalog) -> PlayQueue
+        """Queue for a token's queue id. The up_next list is not in the token,
+        check needs_stored_state() first.
+        """
+        seed, repeat, _, filter_key = decode_queue_id(queue_id)
+        return cls(catalog, seed, repeat, filter_key=filter_key)
+
+    @property
+    def seed(self):
+        return getattr(self.order, "seed", None)
+
+    @property
+    def queue_id(self):
+        return encode_queue_id(self.seed, self.repeat, bool(self.up_next), self.filter_key)
+
+    def set_filter(self, filter_key):
+        # type: (Optional[str]) -> None
+        """Play only the tracks of a genre or artist search result, or (None) the whole catalog.
+        A key the search index doesn't know (e.g. the catalog changed) plays the whole catalog.
+        """
+        indexes = get_search_index(self.catalog).tracks_for_key(filter_key) if filter_key else None
+        self.filter_key = filter_key if indexes is not None else None
+        self.order = play_order(self._seed, self.catalog, indexes)
+
+    def token(self, index):
+        # type: (int) -> str
+        return encode_token(index, self.queue_id)
+
+    def save(self, persistence_attr):
+        # type: (dict) -> None
+        """Store the repeat mode, up_next list and filter with the playback settings.
+        Unchanged fields are left alone, so the attributes stay clean.
+        """
+        settings = persistence_attr["playback_settings"]
+        if settings.get("repeat", REPEAT_ALL) != self.repeat:
+            settings["repeat"] = self.repeat
+        if list(settings.get("up_next") or ()) != self.up_next:
+            if self.up_next:
+                settings["up_next"] = list(self.up_next)
+            else:
+                settings.pop("up_next", None)
+        if settings.get("filter") != self.filter_key:
+            if self.filter_key is not None:
+                settings["filter"] = self.filter_key
+            else:
+                settings.pop("filter", None)
+
+    def play_next(self, index):
+        # type: (int) -> None
+        """Queue a track to play after the current one, ahead of anything queued before.
+        Past MAX_UP_NEXT tracks the one queued longest ago is dropped.
+        """
+        self.up_next.insert(0, index)
+        del self.up_next[MAX_UP_NEXT:]
+
+    def first_index(self):
+        # type: () -> int
+        return self.order.first_index()
+
+    def next_index(self, index):
+        # type: (int) -> int
+        """Track to skip to from index (AMAZON.NextIntent): the first queued
+        track, otherwise the next in the order. Repeat modes don't apply to a skip.
+        """
+        if self.up_next:
+            return self.up_next.pop(0)
+        return self.order.next_index(index)
+
+    def previous_index(self, index):
+        # type: (int) -> int
+        return self.order.previous_index(index)
+
+    def following(self, index):
+        # type: (int) -> Optional[QueueEntry]
+        """Entry to play when the track at index ends, None when the queue is over."""
+        following = self.up_next.pop(0) if self.up_next else self._following_index(index)
+        if following is None:
+            return None
+        return QueueEntry(following, self.token(following), self.catalog[following])
+
+    def _following_index(self, index):
+        if self.repeat == REPEAT_ONE:
+            return index
+        if self.repeat == REPEAT_OFF and index == self.order.last_index():
+            return None
+        return self.order.next_index(index)
+
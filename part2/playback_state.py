@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+# Compact stored form of the playback state.
+#
+# The handlers work on the attribute dict the SDK hands them:
+#   {"track_number": 3, "shuffle_seed": ...,
+#    "playback_settings": {"token": ..., "offset_in_milliseconds": ..., "url": ...,
+#                          "next_stream_enqueued": ..., "repeat": ..., "up_next": [...], "filter": ...}}
+# Stored like that, every item carries a full presigned URL that is useless a
+# minute later (most of the item's size) and the field names, and the numbers
+# come back from DynamoDB as Decimal.
+#
+# PackedStateDynamoDbAdapter (see dynamodb_persistence.py) stores the same
+# state as two short base64 strings of packed structs instead:
+#   "p"  position: where the user is - track, offset, token, enqueued flag.
+#        PlaybackStopped's fast path writes it on its own (see fast_path.py).
+#   "s"  settings: how the queue plays - shuffle seed, repeat, filter, up_next.
+#
+# Each starts with a format version byte. Tokens made by stream_token are
+# stored as their index and queue id, the signature is made again on load.
+# The URL is not stored. Items in the old layout (no "p"/"s") are still read,
+# and rewritten in the packed layout on their next save.
+#
+#   stored = encode_attributes(attributes)   # {"p": "AQEDAAAA...", "s": "AQA"}
+#   attributes = decode_attributes(stored)
+
+import base64
+import logging
+import struct
+from decimal import Decimal
+
+from stream_token import decode_token, encode_token
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+POSITION = "p"
+SETTINGS = "s"
+
+# the keys the packed form replaces, removed from items in the old layout
+STATE_KEYS = ("track_number", "playback_settings", "shuffle_seed")
+
+_HEADER = struct.Struct("<BB")
+_POSITION = struct.Struct("<II")
+_U32 = struct.Struct("<I")
+_U16 = struct.Struct("<H")
+
+# position flags
+_ENQUEUED = 0x01
+_TOKEN_STRUCTURED = 0x02
+_TOKEN_RAW = 0x04
+# settings flags
+_SHUFFLE = 0x01
+_FILTER = 0x02
+_REPEAT_SHIFT = 2
+_REPEAT_CODES = {"all": 0, "one": 1, "off": 2}
+_REPEAT_NAMES = {code: name for name, code in _REPEAT_CODES.items()}
+
+
+class PlaybackState(object):
+    """Typed playback state, converted to and from the attribute dict and the packed strings."""
+    __slots__ = ('track_number', 'offset_in_milliseconds', 'token', 'next_stream_enqueued',
+                 'shuffle_seed', 'repeat', 'up_next', 'filter')
+
+    def __init__(self, track_number=0, offset_in_milliseconds=0, token=None, next_stream_enqueued=False,
+                 shuffle_seed=None, repeat="all", up_next=(), filter=None):
+        self.track_number = int(track_number)
+        self.offset_in_milliseconds = int(offset_in_milliseconds or 0)
+        self.token = token
+        self.next_stream_enqueued = bool(next_stream_enqueued)
+        self.shuffle_seed = None if shuffle_seed is None else int(shuffle_seed)
+        self.repeat = repeat if repeat in _REPEAT_CODES else "all"
+        self.up_next = [int(index) for index in up_next]
+        self.filter = filter
+
+    @classmethod
+    def from_attributes(cls, attributes):
+        # type: (dict) -> PlaybackState
+        """State from the handlers' attribute dict, or an item in the old layout (Decimals and all)."""
+        settings = attributes.get("playback_settings") or {}
+        return cls(attributes.get("track_number", 0),
+                   settings.get("offset_in_milliseconds", 0),
+                   settings.get("token"),
+                   settings.get("next_stream_enqueued", False),
+                   attributes.get("shuffle_seed"),
+                   settings.get("repeat", "all"),
+                   settings.get("up_next") or (),
+                   settings.get("filter"))
+
+    def to_attributes(self):
+        # type: () -> dict
+        """The attribute dict the handlers use. Optional fields are left out when not set."""
+        settings = {
+            "token": self.token,
+            "offset_in_milliseconds": self.offset_in_milliseconds,
+            "url": None,
+            "next_stream_enqueued": self.next_stream_enqueued,
+        }
+        if self.repeat != "all":
+            settings["repeat"] = self.repeat
+        if self.up_next:
+            settings["up_next"] = list(self.up_next)
+        if self.filter is not None:
+            settings["filter"] = self.filter
+        attributes = {"playback_settings": settings, "track_number": self.track_number}
+        if self.shuffle_seed is not None:
+            attributes["shuffle_seed"] = self.shuffle_seed
+        return attributes
+
+    def pack_position(self):
+        # type: () -> str
+        flags = _ENQUEUED if self.next_stream_enqueued else 0
+        tail = b""
+        current = decode_token(self.token)
+        if current is not None:
+            flags |= _TOKEN_STRUCTURED
+            tail = _U32.pack(current.index) + _short_bytes(current.queue_id)
+        elif self.token:
+            flags |= _TOKEN_RAW
+            raw = self.token.encode("utf-8")
+            tail = _U16.pack(len(raw)) + raw
+        return _b64(_HEADER.pack(FORMAT_VERSION, flags) +
+                    _POSITION.pack(self.track_number, self.offset_in_milliseconds) + tail)
+
+    def pack_settings(self):
+        # type: () -> str
+        flags = _REPEAT_CODES[self.repeat] << _REPEAT_SHIFT
+        tail = b""
+        if self.shuffle_seed is not None:
+            flags |= _SHUFFLE
+            tail += _U32.pack(self.shuffle_seed)
+        if self.filter is not None:
+            flags |= _FILTER
+            tail += _short_bytes(self.filter)
+        tail += struct.pack("<B{}I".format(len(self.up_next)), len(self.up_next), *self.up_next)
+        return _b64(_HEADER.pack(FORMAT_VERSION, flags) + tail)
+
+    def unpack_position(self, packed):
+        # type: (str) -> None
+        data, flags, offset = _open(packed)
+        self.track_number, self.offset_in_milliseconds = _POSITION.unpack_from(data, offset)
+        offset += _POSITION.size
+        self.next_stream_enqueued = bool(flags & _ENQUEUED)
+        self.token = None
+        if flags & _TOKEN_STRUCTURED:
+            index, = _U32.unpack_from(data, offset)
+            queue_id, offset = _read_short_bytes(data, offset + _U32.size)
+            self.token = encode_token(index, queue_id)
+        elif flags & _TOKEN_RAW:
+            length, = _U16.unpack_from(data, offset)
+            offset += _U16.size
+            self.token = data[offset:offset + length].decode("utf-8")
+
+    def unpack_settings(self, packed):
+        # type: (str) -> None
+        data, flags, offset = _open(packed)
+        self.repeat = _REPEAT_NAMES.get((flags >> _REPEAT_SHIFT) & 0x03, "all")
+        self.shuffle_seed = None
+        if flags & _SHUFFLE:
+            self.shuffle_seed, = _U32.unpack_from(data, offset)
+            offset += _U32.size
+        self.filter = None
+        if flags & _FILTER:
+            self.filter, offset = _read_short_bytes(data, offset)
+        count = data[offset]
+        self.up_next = list(struct.unpack_from("<{}I".format(count), data, offset + 1))
+
+
+def encode_attributes(attributes):
+    # type: (dict) -> dict
+    """Stored form of the handlers' attribute dict: "p" and "s", plus any other keys as they are.
+    Attributes without any playback state are stored as they are.
+    """
+    if not any(key in attributes for key in STATE_KEYS):
+        return dict(attributes)
+    state = PlaybackState.from_attributes(attributes)
+    stored = {key: value for key, value in attributes.items() if key not in STATE_KEYS}
+    stored[POSITION] = state.pack_position()
+    stored[SETTINGS] = state.pack_settings()
+    return stored
+
+
+def decode_attributes(stored):
+    # type: (dict) -> dict
+    """Handlers' attribute dict from a stored item, packed, in the old layout or a mix of
+    the two (PlaybackStopped's fast path writes "p" into old items). {} stays {}.
+    """
+    if not stored:
+        return {}
+    stored = plain_numbers(stored)
+    if POSITION not in stored and SETTINGS not in stored:
+        return stored
+    state = PlaybackState.from_attributes(stored)
+    for key, unpack in ((POSITION, state.unpack_position), (SETTINGS, state.unpack_settings)):
+        if key in stored:
+            try:
+                unpack(stored[key])
+            except (ValueError, struct.error, IndexError) as e:
+                # e.g. written by a newer version, the old layout fields (if any) or defaults stand
+                logger.warning("Unreadable playback state {!r}: {}".format(key, e))
+    attributes = {key: value for key, value in stored.items()
+                  if key not in STATE_KEYS and key not in (POSITION, SETTINGS)}
+    attributes.update(state.to_attributes())
+    return attributes
+
+
+def plain_numbers(value):
+    """Copy of value with DynamoDB's whole number Decimals turned into ints. Others stay
+    Decimal: boto3 won't store a float.
+    """
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else value
+    if isinstance(value, dict):
+        return {key: plain_numbers(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [plain_numbers(item) for item in value]
+    return value
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _open(packed):
+    data = base64.urlsafe_b64decode(packed + "=" * (-len(packed) % 4))
+    version, flags = _HEADER.unpack_from(data, 0)
+    if version != FORMAT_VERSION:
+        raise ValueError("format version {}".format(version))
+    return data, flags, _HEADER.size
+
+
+def _short_bytes(text):
+    raw = text.encode("utf-8")
+    if len(raw) > 255:
+        raise ValueError("too long to pack: {!r}".format(text))
+    return struct.pack("<B", len(raw)) + raw
+
+
+def _read_short_bytes(data, offset):
+    length = data[offset]
+    return data[offset + 1:offset + 1 + length].decode("utf-8"), offset + 1 + length
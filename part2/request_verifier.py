@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+# Checks that a request to the web service (webservice.py) was sent by Alexa,
+# as described in
+# https://developer.amazon.com/docs/custom-skills/host-a-custom-skill-as-a-web-service.html
+#
+#   - the SignatureCertChainUrl header points to https://s3.amazonaws.com/echo.api/...
+#   - the chain there is valid now up to a trusted root, and the signing
+#     certificate is for echo-api.amazon.com
+#   - the Signature-256 header is the RSA SHA-256 signature of the body by it
+#   - the request's timestamp is within 150 seconds (an hour for skill events)
+#
+# ask_sdk_webservice_support.verifier does the same, but keeps only the
+# downloaded chain and parses and validates it again for every request, and
+# it needs certvalidator/oscrypto, which fail to load against OpenSSL 3.
+# This uses cryptography's own path validation and keeps the validated
+# signing key per URL for CERT_CACHE_TTL seconds (never past the
+# certificate's expiry), so a long-lived process downloads and validates a
+# chain about once an hour and a request costs one RSA signature check.
+#
+#   verifier = RequestVerifier()
+#   verifier.verify(cert_url, signature, body, event)   # raises VerificationError
+
+import base64
+import binascii
+import datetime
+import logging
+import os
+import posixpath
+import threading
+import time
+import urllib.parse
+import urllib.request
+import warnings
+
+from ask_sdk_runtime.exceptions import AskSdkException
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.padding import PKCS1v15
+from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.x509 import verification
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_CERT_CHAIN_URL_HEADER = "SignatureCertChainUrl"
+SIGNATURE_HEADER = "Signature-256"
+CERT_URL_HOSTNAME = "s3.amazonaws.com"
+CERT_URL_PATH = "/echo.api/"
+CERT_DOMAIN = "echo-api.amazon.com"
+
+CERT_CACHE_TTL = float(os.environ.get('ALEXA_CERT_CACHE_TTL', '3600'))   # seconds
+FETCH_TIMEOUT = 5.0       # seconds
+REQUEST_TOLERANCE = 150   # seconds
+SKILL_EVENT_TOLERANCE = 3600
+SKILL_EVENTS = frozenset(("AlexaSkillEvent.SkillEnabled", "AlexaSkillEvent.SkillDisabled",
+                          "AlexaSkillEvent.SkillPermissionChanged", "AlexaSkillEvent.SkillPermissionAccepted",
+                          "AlexaSkillEvent.SkillAccountLinked"))
+
+
+class VerificationError(AskSdkException):
+    """The request is not from Alexa, or can't be shown to be."""
+    pass
+
+
+def fetch_url(url):
+    # type: (str) -> bytes
+    with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as response:
+        return response.read()
+
+
+def default_trust_roots():
+    # type: () -> List[x509.Certificate]
+    """The root certificates in ALEXA_CERT_ROOTS, else certifi's, else the system's."""
+    path = os.environ.get('ALEXA_CERT_ROOTS')
+    if not path:
+        try:
+            import certifi
+            path = certifi.where()
+        except ImportError:
+            import ssl
+            path = ssl.get_default_verify_paths().cafile
+    with open(path, "rb") as f, warnings.catch_warnings():
+        # some bundled roots have negative serial numbers, which cryptography warns about
+        warnings.simplefilter("ignore")
+        return x509.load_pem_x509_certificates(f.read())
+
+
+def check_certificate_url(url):
+    # type: (str) -> None
+    """Raise VerificationError unless url is where Alexa keeps its signing certificates."""
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme.lower() != "https":
+        raise VerificationError("Signature certificate URL is not https: {}".format(url))
+    if (parsed.hostname or "").lower() != CERT_URL_HOSTNAME:
+        raise VerificationError("Signature certificate URL has the wrong host: {}".format(url))
+    if not posixpath.normpath(parsed.path).startswith(CERT_URL_PATH):
+        raise VerificationError("Signature certificate URL has the wrong path: {}".format(url))
+    if parsed.port not in (None, 443):
+        raise VerificationError("Signature certificate URL has the wrong port: {}".format(url))
+
+
+def parse_timestamp(timestamp):
+    # type: (str) -> float
+    """Seconds since the epoch of a request timestamp like 2021-04-20T12:00:00Z."""
+    if timestamp.endswith("Z"):
+        timestamp = timestamp[:-1] + "+00:00"
+    return datetime.datetime.fromisoformat(timestamp).timestamp()
+
+
+class RequestVerifier(object):
+    """Signature and timestamp checks with the signing keys cached per URL.
+
+    :param trust_roots: root certificates the chains must lead to, default_trust_roots() by default
+    :param fetch: callable returning the PEM chain at a URL
+    :param ttl: seconds a validated signing key is used for
+    :param clock: time source, for tests
+    """
+
+    def __init__(self, trust_roots=None, fetch=fetch_url, ttl=CERT_CACHE_TTL, clock=time.time):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.clock = clock
+        self._trust_roots = trust_roots
+        self._keys = {}                # certificate URL -> (public key, expires)
+        self._lock = threading.Lock()
+
+    def verify(self, cert_url, signature, body, event):
+        # type: (Optional[str], Optional[str], bytes, Dict[str, Any]) -> None
+        """Raise VerificationError unless the request was signed by Alexa just now.
+
+        :param cert_url: the SignatureCertChainUrl header
+        :param signature: the Signature-256 header
+        :param body: the request body as received
+        :param event: the body parsed
+        """
+        self.verify_timestamp(event)
+        self.verify_signature(cert_url, signature, body)
+
+    def verify_timestamp(self, event):
+        # type: (Dict[str, Any]) -> None
+        request = event.get("request") or {}
+        try:
+            timestamp = parse_timestamp(request["timestamp"])
+        except (KeyError, TypeError, ValueError):
+            raise VerificationError("Request has no valid timestamp")
+        tolerance = SKILL_EVENT_TOLERANCE if request.get("type") in SKILL_EVENTS else REQUEST_TOLERANCE
+        if abs(self.clock() - timestamp) > tolerance:
+            raise VerificationError("Request timestamp {} is too far from now".format(request["timestamp"]))
+
+    def verify_signature(self, cert_url, signature, body):
+        # type: (Optional[str], Optional[str], bytes) -> None
+        if not cert_url or not signature:
+            raise VerificationError("Missing signature or certificate URL")
+        public_key = self._public_key(cert_url)
+        try:
+            public_key.verify(base64.b64decode(signature), body, PKCS1v15(), SHA256())
+        except (InvalidSignature, binascii.Error, ValueError):
+            raise VerificationError("Request body does not match the signature")
+
+    def _public_key(self, cert_url):
+        entry = self._keys.get(cert_url)
+        if entry is None or entry[1] <= self.clock():
+            # one download at a time: requests arriving meanwhile wait for it rather than download too
+            with self._lock:
+                now = self.clock()
+                entry = self._keys.get(cert_url)
+                if entry is None or entry[1] <= now:
+                    entry = self._load(cert_url, now)
+                    self._keys = {url: cached for url, cached in self._keys.items() if cached[1] > now}
+                    self._keys[cert_url] = entry
+        return entry[0]
+
+    def _load(self, cert_url, now):
+        check_certificate_url(cert_url)
+        try:
+            chain = x509.load_pem_x509_certificates(self.fetch(cert_url))
+        except Exception as e:
+            raise VerificationError("Unable to load the certificate chain from {}: {}".format(cert_url, e))
+        if self._trust_roots is None:
+            self._trust_roots = default_trust_roots()
+        verifier = verification.PolicyBuilder().store(verification.Store(self._trust_roots)).time(
+            datetime.datetime.fromtimestamp(now, datetime.timezone.utc)).build_server_verifier(
+            x509.DNSName(CERT_DOMAIN))
+        try:
+            verifier.verify(chain[0], chain[1:])
+        except verification.VerificationError as e:
+            raise VerificationError("Certificate chain at {} is not valid: {}".format(cert_url, e))
+        logger.info("Signing certificate from {} validated".format(cert_url))
+        expires = min(now + self.ttl, chain[0].not_valid_after_utc.timestamp())
+        return chain[0].public_key(), expires
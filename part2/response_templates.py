@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# Precompiled response pieces for playing a track.
+#
+# Building StandardCard/Image/Stream/AudioItem/PlayDirective model objects
+# and then having the SDK serializer walk them reflectively is the most
+# expensive part of a play response. The serializer passes plain dicts
+# through as they are, so instead the card and Play directive are kept as
+# dicts already in the JSON shape Alexa expects. The fixed parts (card title
+# and artist per track, directive per play behaviour) are built once and
+# cached; per request only the URL, token, offset and expected_previous_token
+# are filled in.
+#
+#   builder.set_card(track_card(track, small_image_url, large_image_url))
+#   builder.add_directive(play_directive(PlayBehavior.ENQUEUE, token, url,
+#                                        expected_previous_token=previous_token))
+#
+# The output is the same JSON the model objects serialize to.
+
+from functools import lru_cache
+
+from ask_sdk_model.interfaces.audioplayer import PlayBehavior
+
+TEMPLATE_CACHE_SIZE = 4096
+
+
+class DirectiveDict(dict):
+    """Directive in response JSON form.
+
+    ResponseFactory.add_directive looks at directive.object_type, so expose
+    the "type" key under that name like the model classes do.
+    """
+    __slots__ = ()
+
+    @property
+    def object_type(self):
+        return self.get("type")
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _card_skeleton(title, artist):
+    card = {"type": "Standard"}
+    if title is not None:
+        card["title"] = title
+    if artist is not None:
+        card["text"] = artist
+    return card
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def _directive_skeleton(play_behavior):
+    return {"type": "AudioPlayer.Play", "playBehavior": play_behavior}
+
+
+def track_card(track, small_image_url, large_image_url):
+    """Standard card for a track, as a dict in response JSON form.
+
+    :param track: catalog.Track
+    :return: dict usable with response_builder.set_card
+    """
+    card = dict(_card_skeleton(track.title, track.artist))
+    image = {}
+    if small_image_url is not None:
+        image["smallImageUrl"] = small_image_url
+    if large_image_url is not None:
+        image["largeImageUrl"] = large_image_url
+    card["image"] = image
+    return card
+
+
+def play_directive(play_behavior, token, url, offset_in_milliseconds=0, expected_previous_token=None):
+    """AudioPlayer.Play directive for a track, as a dict in response JSON form.
+
+    :param play_behavior: PlayBehavior or its string value
+    :param token: stream token
+    :param url: presigned stream URL
+    :param offset_in_milliseconds: where to start playing
+    :param expected_previous_token: required by Alexa for ENQUEUE
+    :return: dict usable with response_builder.add_directive
+    """
+    if isinstance(play_behavior, PlayBehavior):
+        play_behavior = play_behavior.value
+    stream = {"token": token, "url": url, "offsetInMilliseconds": int(offset_in_milliseconds)}
+    if expected_previous_token is not None:
+        stream["expectedPreviousToken"] = expected_previous_token
+    directive = DirectiveDict(_directive_skeleton(play_behavior))
+    directive["audioItem"] = {"stream": stream}
+    return directive
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# Dictionary based request routing.
+#
+# The SkillBuilder asks every registered handler's can_handle in turn until
+# one says yes. RequestRouter is registered as a single request handler and
+# looks the candidates up by request type and intent name instead, then
+# confirms with their own can_handle, so the registration order rules stay
+# the same:
+#
+#   router = RequestRouter()
+#   router.add_request_handler(PlaybackStartedHandler(), request_types=["AudioPlayer.PlaybackStarted"])
+#   router.add_request_handler(NextPlaybackHandler(), intent_names=["AMAZON.NextIntent"])
+#   router.add_request_handler(IntentReflectorHandler(), request_types=["IntentRequest"])
+#   sb.add_request_handler(router)
+#
+# A handler registered with a request type sees every request of that type
+# (e.g. IntentReflectorHandler for all intents), one registered with intent
+# names only sees those intents, and one registered with neither is tried for
+# every request. For each request only the matching candidates are tried, in
+# the order they were added.
+
+from ask_sdk_core.dispatch_components import AbstractRequestHandler
+
+_ROUTED_HANDLER = "_routed_handler"
+
+
+class RequestRouter(AbstractRequestHandler):
+    """Request handler that dispatches to the handlers added to it by dict lookup."""
+
+    def __init__(self):
+        self._handlers = []         # (handler, request_types, intent_names) in registration order
+        self._routes = {}           # (request_type, intent_name) -> tuple of candidate handlers
+
+    def add_request_handler(self, handler, request_types=(), intent_names=()):
+        # type: (AbstractRequestHandler, Sequence[str], Sequence[str]) -> None
+        """Add a handler for the given request types and/or intent names.
+
+        intent_names imply IntentRequest. With neither, the handler is a
+        candidate for every request.
+        """
+        self._handlers.append((handler, frozenset(request_types), frozenset(intent_names)))
+        self._routes = {}
+        for handler, request_types, intent_names in self._handlers:
+            for request_type in request_types:
+                self._route(request_type, None)
+            for intent_name in intent_names:
+                self._route("IntentRequest", intent_name)
+
+    @property
+    def handlers(self):
+        """Handlers in the order they were added."""
+        return [handler for handler, _, _ in self._handlers]
+
+    def _route(self, request_type, intent_name):
+        key = (request_type, intent_name)
+        candidates = self._routes.get(key)
+        if candidates is None:
+            candidates = tuple(
+                handler for handler, request_types, intent_names in self._handlers
+                if (not request_types and not intent_names) or
+                request_type in request_types or
+                (intent_name is not None and intent_name in intent_names))
+            self._routes[key] = candidates
+        return candidates
+
+    def route(self, handler_input):
+        # type: (HandlerInput) -> Optional[AbstractRequestHandler]
+        """Return the handler for the request, or None if no handler can handle it."""
+        request = handler_input.request_envelope.request
+        request_type = request.object_type
+        intent_name = request.intent.name if request_type == "IntentRequest" else None
+        for handler in self._route(request_type, intent_name):
+            if handler.can_handle(handler_input):
+                return handler
+        return None
+
+    def can_handle(self, handler_input):
+        # type: (HandlerInput) -> bool
+        handler = self.route(handler_input)
+        # remembered for handle(), which the SDK calls next with the same handler_input
+        handler_input.attributes_manager.request_attributes[_ROUTED_HANDLER] = handler
+        return handler is not None
+
+    def handle(self, handler_input):
+        # type: (HandlerInput) -> Response
+        handler = handler_input.attributes_manager.request_attributes.pop(_ROUTED_HANDLER, None)
+        if handler is None:
+            handler = self.route(handler_input)
+        return handler.handle(handler_input)
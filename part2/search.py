@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+# Voice search over the catalog's genres, artists and titles.
+#
+# The slot value Alexa hears is matched against an inverted index built once
+# per container: every word of every genre, artist and title maps to the
+# values that contain it. A search normalizes the spoken words (case,
+# accents, punctuation: "can't" and "Cant" are both "cant"), looks each one
+# up, allows one typo or mishearing in words of four letters or more, and
+# picks the best scoring value. Rare words count for more than common ones.
+#
+#   match = get_search_index(catalog).search("mandy montgomery", "artist")
+#   match.display, match.indexes    # "Mandy Montgomery", (2, 3)
+#
+# Fuzzy matching uses a delete index: every word is stored under itself and
+# each variant with one letter deleted, so words one edit apart share a key
+# and a lookup is a handful of dict gets, whatever the catalog size.
+#
+# A genre or artist match is played as a filtered queue (see play_queue.py).
+# Its key goes in the stream token's queue id, so Match.key has to stay
+# short and must not contain "." or "-".
+
+import collections
+import hashlib
+import math
+import re
+import unicodedata
+import weakref
+
+FIELDS = ("genre", "artist", "title")
+MIN_FUZZY_LENGTH = 4
+FUZZY_WEIGHT = 0.7
+
+# dropped from what was said ("play some blues"), unless nothing else is left
+STOP_WORDS = frozenset(("a", "an", "the", "some", "by", "of", "song", "songs", "music", "track", "tracks"))
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+Match = collections.namedtuple('Match', ['field', 'key', 'display', 'indexes'])
+
+
+def normalize(text):
+    # type: (str) -> str
+    """Lower case words without accents or punctuation, "Can't Find" -> "cant find"."""
+    if not text:
+        return ""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(char for char in text if not unicodedata.combining(char))
+    text = text.lower()
+    text = text.replace("'", "").replace(u"’", "").replace("&", " and ")
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def _deletes(word):
+    return {word[:position] + word[position + 1:] for position in range(len(word))}
+
+
+def filter_key(field, value):
+    # type: (str, str) -> str
+    """Queue id key for a genre or artist: field initial + 10 hex digits of the value's hash."""
+    return field[0] + hashlib.sha1(normalize(value).encode("utf-8")).hexdigest()[:10]
+
+
+class SearchIndex(object):
+    """Inverted index of the catalog's genres, artists and titles.
+
+    :param catalog: catalog.Catalog
+    """
+
+    def __init__(self, catalog):
+        values = {field: {} for field in FIELDS}     # normalized value -> [track indexes]
+        displays = {field: {} for field in FIELDS}   # normalized value -> value as in the catalog
+        normalized = {}                              # genres and artists repeat a lot
+        for index, entry in catalog.entries():
+            for field in FIELDS:
+                text = entry.get(field)
+                value = normalized.get(text)
+                if value is None:
+                    value = normalized[text] = normalize(text)
+                if value:
+                    values[field].setdefault(value, []).append(index)
+                    displays[field].setdefault(value, entry.get(field))
+
+        postings = {field: {} for field in FIELDS}   # word -> normalized values containing it
+        words = set()
+        for field in FIELDS:
+            for value in values[field]:
+                for word in set(value.split()):
+                    postings[field].setdefault(word, []).append(value)
+                    words.add(word)
+
+        similar = {}                                 # word or one-delete variant -> words
+        for word in words:
+            similar.setdefault(word, set()).add(word)
+            if len(word) >= MIN_FUZZY_LENGTH:
+                for variant in _deletes(word):
+                    similar.setdefault(variant, set()).add(word)
+
+        self._values = {field: {value: tuple(indexes) for value, indexes in field_values.items()}
+                        for field, field_values in values.items()}
+        self._displays = displays
+        self._postings = postings
+        self._similar = similar
+        self._keys = {filter_key(field, value): (field, value)
+                      for field in ("genre", "artist") for value in values[field]}
+
+    def search(self, query, field=None):
+        # type: (str, Optional[str]) -> Optional[Match]
+        """Best match for what was said, in one field or (field None) all of them.
+
+        :return: Match, or None when nothing matches at least half the words
+        """
+        fields = FIELDS if field is None else (field,)
+        text = normalize(query)
+        if not text:
+            return None
+        for name in fields:
+            if text in self._values[name]:
+                return self._match(name, text)
+
+        words = text.split()
+        content_words = [word for word in words if word not in STOP_WORDS]
+        words = content_words or words
+        best, best_score = None, 0.0
+        for name in fields:
+            value, score = self._best_value(name, words)
+            if value is not None and score > best_score:
+                best, best_score = (name, value), score
+        return None if best is None else self._match(*best)
+
+    def _best_value(self, field, words):
+        postings = self._postings[field]
+        total_values = len(self._values[field])
+        scores = collections.defaultdict(float)
+        matched = collections.defaultdict(int)
+        for word in words:
+            candidates = {word}
+            if len(word) >= MIN_FUZZY_LENGTH:
+                for variant in _deletes(word) | {word}:
+                    candidates.update(self._similar.get(variant, ()))
+            best_for_word = {}
+            for candidate in candidates:
+                containing = postings.get(candidate)
+                if not containing:
+                    continue
+                # inverse document frequency: rare words tell values apart
+                weight = math.log(1.0 + total_values / len(containing))
+                if candidate != word:
+                    weight *= FUZZY_WEIGHT
+                for value in containing:
+                    if weight > best_for_word.get(value, 0.0):
+                        best_for_word[value] = weight
+            for value, weight in best_for_word.items():
+                scores[value] += weight
+                matched[value] += 1
+        if not scores:
+            return None, 0.0
+        # most of what was said, then the fewest extra words, then alphabetical
+        value = min(scores, key=lambda value: (-scores[value], len(value.split()), value))
+        if matched[value] * 2 < len(words):
+            return None, 0.0
+        # as a fraction of a perfect match, so fields can be compared
+        return value, scores[value] / (len(words) * math.log(1.0 + total_values))
+
+    def _match(self, field, value):
+        return Match(field, filter_key(field, value) if field != "title" else None,
+                     self._displays[field][value], self._values[field][value])
+
+    def tracks_for_key(self, key):
+        # type: (str) -> Optional[Tuple[int, ...]]
+        """Track indexes (in catalog order) for a genre or artist key, None for an unknown key."""
+        found = self._keys.get(key)
+        if found is None:
+            return None
+        field, value = found
+        return self._values[field][value]
+
+
+# catalog -> its SearchIndex, dropped with the catalog
+_indexes = weakref.WeakKeyDictionary()
+
+
+def get_search_index(catalog):
+    # type: (catalog.Catalog) -> SearchIndex
+    """Return the search index for the catalog, built on first use and kept as long as the catalog."""
+    index = _indexes.get(catalog)
+    if index is None:
+        index = _indexes[catalog] = SearchIndex(catalog)
+    return index
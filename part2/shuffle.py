@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+# Shuffle play order.
+#
+# A shuffled order is a pseudo-random permutation of the catalog indexes
+# defined by a 32-bit seed, so the only state to store is the seed: the
+# position of the current track in the order (the cursor) is worked out from
+# the track index, and the next/previous track from the position. Nothing
+# proportional to the catalog size is built or stored, next and previous are
+# O(1) for any catalog size.
+#
+# The permutation is a small Feistel network over the smallest power-of-4
+# domain that holds the catalog, with cycle walking to stay below its size.
+# Both directions are a few integer operations per round.
+#
+# The seed travels in the stream token's queue id (see play_queue.py), so
+# PlaybackNearlyFinished can pick the next shuffled track from the token alone.
+#
+#   order = play_order(persistence_attr.get("shuffle_seed"), catalog)
+#   next_track = order.next_index(track_number)
+
+import random
+from bisect import bisect_left
+from functools import lru_cache
+
+ROUNDS = 4
+_MASK64 = (1 << 64) - 1
+
+
+def new_seed():
+    # type: () -> int
+    return random.getrandbits(32)
+
+
+def _splitmix64(state):
+    state = (state + 0x9E3779B97F4A7C15) & _MASK64
+    z = state
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return state, z ^ (z >> 31)
+
+
+class Shuffle(object):
+    """Seeded permutation of range(size).
+
+    :param seed: 32-bit seed
+    :param size: number of tracks
+    """
+    __slots__ = ('seed', 'size', '_half', '_mask', '_keys')
+
+    def __init__(self, seed, size):
+        self.seed = int(seed)
+        self.size = size
+        self._half = max(1, ((size - 1).bit_length() + 1) // 2)
+        self._mask = (1 << self._half) - 1
+        keys = []
+        state = self.seed
+        for _ in range(ROUNDS):
+            state, key = _splitmix64(state)
+            keys.append(key)
+        self._keys = tuple(keys)
+
+    def _round(self, value, key):
+        value = ((value ^ key) * 0x9E3779B1) & 0xFFFFFFFFFFFF
+        return (value ^ (value >> 17)) & self._mask
+
+    def _encrypt(self, value):
+        half, mask, round_ = self._half, self._mask, self._round
+        left, right = value >> half, value & mask
+        for key in self._keys:
+            left, right = right, left ^ round_(right, key)
+        return (left << half) | right
+
+    def _decrypt(self, value):
+        half, mask, round_ = self._half, self._mask, self._round
+        left, right = value >> half, value & mask
+        for key in reversed(self._keys):
+            left, right = right ^ round_(left, key), left
+        return (left << half) | right
+
+    def track_at(self, position):
+        # type: (int) -> int
+        """Track index at a position in the shuffled order, IndexError outside range(size)."""
+        if not 0 <= position < self.size:
+            # cycle walking from outside the range never comes back into it
+            raise IndexError("shuffle position {} out of range({})".format(position, self.size))
+        value = self._encrypt(position)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def position_of(self, index):
+        # type: (int) -> int
+        """Position of a track index in the shuffled order (the cursor), IndexError outside range(size)."""
+        if not 0 <= index < self.size:
+            raise IndexError("track index {} out of range({})".format(index, self.size))
+        value = self._decrypt(index)
+        while value >= self.size:
+            value = self._decrypt(value)
+        return value
+
+    def first_index(self):
+        return self.track_at(0)
+
+    def last_index(self):
+        return self.track_at(self.size - 1)
+
+    def next_index(self, index):
+        """Track after index, wrapping round at the end like catalog order."""
+        return self.track_at((self.position_of(index) + 1) % self.size)
+
+    def previous_index(self, index):
+        """Track before index, staying on the first track like catalog order."""
+        return self.track_at(max(self.position_of(index) - 1, 0))
+
+
+class CatalogOrder(object):
+    """Catalog order, with the same interface as Shuffle."""
+    __slots__ = ('catalog',)
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def first_index(self):
+        return 0
+
+    def last_index(self):
+        return len(self.catalog) - 1
+
+    def next_index(self, index):
+        return self.catalog[index].next_index
+
+    def previous_index(self, index):
+        return self.catalog[index].previous_index
+
+
+class FilteredOrder(object):
+    """Order over some of the catalog's tracks (a search result), shuffled
+    when seed is given, with the same interface as Shuffle.
+
+    :param indexes: the tracks' indexes, in catalog order
+    :param seed: shuffle seed, None for catalog order
+    """
+    __slots__ = ('indexes', 'shuffle', 'seed')
+
+    def __init__(self, indexes, seed=None):
+        self.indexes = indexes
+        self.shuffle = _shuffle(int(seed), len(indexes)) if seed is not None and len(indexes) >= 2 else None
+        self.seed = self.shuffle.seed if self.shuffle is not None else None
+
+    def _track(self, position):
+        return self.indexes[self.shuffle.track_at(position) if self.shuffle is not None else position]
+
+    def _position(self, index):
+        # None for a track that isn't in the order
+        position = bisect_left(self.indexes, index)
+        if position == len(self.indexes) or self.indexes[position] != index:
+            return None
+        return self.shuffle.position_of(position) if self.shuffle is not None else position
+
+    def first_index(self):
+        return self._track(0)
+
+    def last_index(self):
+        return self._track(len(self.indexes) - 1)
+
+    def next_index(self, index):
+        """Track after index, wrapping round at the end; the first track when index isn't in the order."""
+        position = self._position(index)
+        return self._track(0 if position is None else (position + 1) % len(self.indexes))
+
+    def previous_index(self, index):
+        position = self._position(index)
+        return self._track(0 if position is None else max(position - 1, 0))
+
+
+@lru_cache(maxsize=64)
+def _shuffle(seed, size):
+    return Shuffle(seed, size)
+
+
+def play_order(seed, catalog, indexes=None):
+    """Shuffle for seed, or CatalogOrder when seed is None.
+    FilteredOrder when indexes (the tracks to play) is given.
+    """
+    if indexes is not None:
+        return FilteredOrder(indexes, seed)
+    if seed is None or len(catalog) < 2:
+        return CatalogOrder(catalog)
+    return _shuffle(int(seed), len(catalog))
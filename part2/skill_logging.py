@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+# Compact, sampled request logging.
+#
+# Logging handler_input.request_envelope stringifies the whole model tree on
+# every request and sends it, user and device ids included, to CloudWatch.
+# log_request() logs a one-line JSON summary of the request instead:
+#
+#   log_request(logger, "In PlaybackStoppedHandler", handler_input.request_envelope)
+#   -> {"msg": "In PlaybackStoppedHandler", "type": "AudioPlayer.PlaybackStopped",
+#       "request_id": "...", "token": "1.3..abc", "offset": 42000, "user": "u:5f2c9a1b03de", ...}
+#
+# - the summary is only built when the record is actually emitted, so a
+#   request that is sampled out or below the logger's level costs one check
+# - user and device ids are replaced by a short hash (still good for grouping
+#   a user's requests), access tokens are never logged and query strings
+#   (presigned URL signatures) are cut from URLs
+# - each request type is logged at a sample rate, 1.0 unless set in
+#   LOG_SAMPLE_RATES, e.g.
+#     LOG_SAMPLE_RATES="AudioPlayer.PlaybackStarted=0.01,AudioPlayer.PlaybackStopped=0.1"
+#   Warnings and errors are never sampled out.
+#
+# Works with a RequestEnvelope or the raw event dict.
+
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+
+_URL_QUERY = re.compile(r'(https?://[^\s?"\']+)\?[^\s"\']*')
+
+
+def _parse_rates(value):
+    rates = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            name, rate = item.split("=", 1)
+            try:
+                rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+            except ValueError:
+                pass
+    return rates
+
+
+SAMPLE_RATES = _parse_rates(os.environ.get('LOG_SAMPLE_RATES'))
+
+
+def sample_rate(request_type):
+    # type: (str) -> float
+    return SAMPLE_RATES.get(request_type, 1.0)
+
+
+def log_request(logger, message, request_envelope, level=logging.INFO, **fields):
+    # type: (logging.Logger, str, Union[RequestEnvelope, dict], int, Any) -> None
+    """Log message with a compact summary of the request.
+
+    :param request_envelope: RequestEnvelope or the raw event dict
+    :param fields: extra JSON-serializable fields for the summary
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if level < logging.WARNING:
+        rate = sample_rate(_request_type(request_envelope))
+        if rate < 1.0 and random.random() >= rate:
+            return
+    logger.log(level, "%s", RequestSummary(message, request_envelope, fields))
+
+
+class RequestSummary(object):
+    """Log message argument that turns into the JSON summary when formatted."""
+    __slots__ = ('message', 'request_envelope', 'fields')
+
+    def __init__(self, message, request_envelope, fields=None):
+        self.message = message
+        self.request_envelope = request_envelope
+        self.fields = fields
+
+    def __str__(self):
+        summary = {"msg": self.message}
+        summary.update(summarize(self.request_envelope))
+        if self.fields:
+            summary.update(self.fields)
+        return json.dumps(summary, separators=(',', ':'), default=str)
+
+
+def summarize(request_envelope):
+    # type: (Union[RequestEnvelope, dict]) -> Dict[str, object]
+    """The parts of a request worth logging, with ids hashed and URLs cut."""
+    request = _get(request_envelope, "request", "request")
+    system = _get(_get(request_envelope, "context", "context"), "system", "System")
+    audio_player = _get(_get(request_envelope, "context", "context"), "audio_player", "AudioPlayer")
+    summary = {
+        "type": _request_type(request_envelope),
+        "request_id": _get(request, "request_id", "requestId"),
+        "locale": _get(request, "locale", "locale"),
+    }
+    intent = _get(request, "intent", "intent")
+    if intent is not None:
+        summary["intent"] = _get(intent, "name", "name")
+    token = _get(request, "token", "token")
+    if token is not None:
+        summary["token"] = _redact(token)
+    offset = _get(request, "offset_in_milliseconds", "offsetInMilliseconds")
+    if offset is not None:
+        summary["offset"] = offset
+    activity = _get(audio_player, "player_activity", "playerActivity")
+    if activity is not None:
+        summary["player"] = _value(activity)
+    error = _get(request, "error", "error")
+    if error is not None:
+        summary["error"] = {"type": _value(_get(error, "object_type", "type")),
+                            "message": _redact(_get(error, "message", "message"))}
+    cause = _get(request, "cause", "cause")
+    if cause is not None:
+        summary["cause"] = _get(cause, "request_id", "requestId")
+    user_id = _get(_get(system, "user", "user"), "user_id", "userId")
+    if user_id:
+        summary["user"] = "u:" + _hash(user_id)
+    device_id = _get(_get(system, "device", "device"), "device_id", "deviceId")
+    if device_id:
+        summary["device"] = "d:" + _hash(device_id)
+    return {name: value for name, value in summary.items() if value is not None}
+
+
+def _request_type(request_envelope):
+    request = _get(request_envelope, "request", "request")
+    if isinstance(request, dict):
+        return request.get("type")
+    return getattr(request, "object_type", None)
+
+
+def _get(obj, attribute, key):
+    # model objects and raw dicts use different names for the same field
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(key)
+    return getattr(obj, attribute, None)
+
+
+def _value(value):
+    # enums in the model objects, plain strings in the raw dict
+    return getattr(value, "value", value)
+
+
+def _hash(value):
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:12]
+
+
+def _redact(text):
+    if not isinstance(text, str):
+        return text
+    return _URL_QUERY.sub(r'\1?...', text)
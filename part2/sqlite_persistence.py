@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+# Persistence adapter that keeps the attributes in a SQLite file.
+#
+# One row per user, the attributes as JSON. The database runs in WAL mode
+# (readers don't wait for a writer, a commit is an append to the log) with
+# synchronous=NORMAL, so a save costs no fsync. Each thread gets its own
+# connection, and the SQL is fixed text with ? parameters so sqlite3's
+# statement cache keeps it compiled: a get or save is one prepared statement.
+#
+#   adapter = SqlitePersistenceAdapter("/tmp/skill_attributes.sqlite3")
+#
+# For running and load testing the skill locally or on one host
+# (PERSISTENCE_BACKEND=sqlite, see persistence_backends.py). In Lambda, /tmp
+# is per container, so users would lose their state between containers.
+
+import json
+import re
+import sqlite3
+import threading
+
+from ask_sdk_core.attributes_manager import AbstractPersistenceAdapter
+from ask_sdk_core.exceptions import PersistenceException
+from ask_sdk_dynamodb.partition_keygen import user_id_partition_keygen
+
+_TABLE_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+class SqlitePersistenceAdapter(AbstractPersistenceAdapter):
+    """Attributes per user in a SQLite table.
+
+    :param path: database file, created if missing (":memory:" gives each thread its own database)
+    :param table_name: table to use, created if missing
+    :param partition_keygen: callable returning the key for a request envelope
+    :param timeout: seconds to wait for another process's write lock
+    """
+
+    def __init__(self, path, table_name="attributes", partition_keygen=user_id_partition_keygen, timeout=5.0):
+        if not _TABLE_NAME.match(table_name):
+            raise ValueError("Invalid table name {!r}".format(table_name))
+        self.path = path
+        self.table_name = table_name
+        self.partition_keygen = partition_keygen
+        self.timeout = timeout
+        self._local = threading.local()
+        self._select = "SELECT attributes FROM {} WHERE id = ?".format(table_name)
+        self._upsert = ("INSERT INTO {} (id, attributes) VALUES (?, ?) "
+                        "ON CONFLICT(id) DO UPDATE SET attributes = excluded.attributes".format(table_name))
+        self._delete = "DELETE FROM {} WHERE id = ?".format(table_name)
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # autocommit: every statement is its own transaction
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS {} (id TEXT PRIMARY KEY, attributes TEXT NOT NULL)"
+                               .format(self.table_name))
+            self._local.connection = connection
+        return connection
+
+    def get_attributes(self, request_envelope):
+        # type: (RequestEnvelope) -> Dict[str, object]
+        key = self.partition_keygen(request_envelope)
+        try:
+            row = self._connection().execute(self._select, (key,)).fetchone()
+        except sqlite3.Error as e:
+            raise PersistenceException(
+                "Failed to retrieve attributes from SQLite table. Exception of "
+                "type {} occurred: {}".format(type(e).__name__, str(e)))
+        return json.loads(row[0]) if row is not None else {}
+
+    def save_attributes(self, request_envelope, attributes):
+        # type: (RequestEnvelope, Dict[str, object]) -> None
+        key = self.partition_keygen(request_envelope)
+        try:
+            self._connection().execute(self._upsert, (key, json.dumps(attributes, separators=(",", ":"))))
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            raise PersistenceException(
+                "Failed to save attributes to SQLite table. Exception of "
+                "type {} occurred: {}".format(type(e).__name__, str(e)))
+
+    def delete_attributes(self, request_envelope):
+        # type: (RequestEnvelope) -> None
+        key = self.partition_keygen(request_envelope)
+        try:
+            self._connection().execute(self._delete, (key,))
+        except sqlite3.Error as e:
+            raise PersistenceException(
+                "Failed to delete attributes from SQLite table. Exception of "
+                "type {} occurred: {}".format(type(e).__name__, str(e)))
+
+    def close(self):
+        """Close this thread's connection, e.g. before deleting the file."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
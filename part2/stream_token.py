@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+# Structured AudioPlayer stream tokens.
+#
+# The token sent in a Play directive comes back on every AudioPlayer request
+# (PlaybackStarted, NearlyFinished, Finished, Stopped...) and in
+# context.AudioPlayer on intent requests. Encoding the catalog index in it
+# lets those requests work out where playback is without reading DynamoDB.
+#
+#   1.<track index>.<queue id>.<signature>
+#
+# "1" is the format version. The signature is a truncated HMAC-SHA256 of the
+# rest of the token, so a token that was altered or made up is rejected
+# rather than decoded to the wrong track. Tokens in the old format (the plain
+# S3 key) decode to None and the caller falls back to the stored state.
+#
+# The HMAC key is made for each deployment: a random secret kept in the
+# skill's S3 bucket (SECRET_OBJECT_KEY), created by the first container that
+# needs it and read once per container after that. STREAM_TOKEN_SECRET in the
+# environment is used instead when it is set. Without either (no bucket) the
+# key is random for the process, so tokens from other containers fall back to
+# the stored state. Changing the secret does the same for the tracks already
+# playing, until the next Play directive.
+
+import base64
+import collections
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+
+VERSION = "1"
+SIGNATURE_BYTES = 9   # 12 characters of base64
+SECRET_OBJECT_KEY = os.environ.get('STREAM_TOKEN_SECRET_KEY', 'Config/stream_token_secret')
+
+logger = logging.getLogger(__name__)
+
+_secret = None
+_secret_lock = threading.Lock()
+
+StreamToken = collections.namedtuple('StreamToken', ['index', 'queue_id'])
+
+
+def _get_secret():
+    global _secret
+    if _secret is None:
+        with _secret_lock:
+            if _secret is None:
+                _secret = _load_secret()
+    return _secret
+
+
+def _load_secret():
+    secret = os.environ.get('STREAM_TOKEN_SECRET')
+    if secret:
+        return secret.encode('utf-8')
+    try:
+        # imported here, so the S3 client is only created with the first token
+        from utils import get_s3_client
+        return stored_secret(*get_s3_client())
+    except Exception as e:
+        logger.warning("No stream token secret in S3 ({}), tokens are signed with a key for this "
+                       "process only".format(e))
+        return secrets.token_bytes(32)
+
+
+def stored_secret(s3_client, bucket_name, key=SECRET_OBJECT_KEY):
+    # type: (Any, str, str) -> bytes
+    """The secret stored in the bucket, created there if there is none yet.
+
+    Containers starting together may all find none: the put only succeeds
+    for the first, the others read what it stored. botocore before 1.35
+    doesn't know IfNoneMatch, then the last put wins and a container that
+    read an earlier one only has its tokens fall back to the stored state.
+    """
+    from botocore.exceptions import ClientError, ParamValidationError
+    try:
+        return s3_client.get_object(Bucket=bucket_name, Key=key)["Body"].read()
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchKey":
+            raise
+    secret = secrets.token_urlsafe(32).encode('ascii')
+    try:
+        try:
+            s3_client.put_object(Bucket=bucket_name, Key=key, Body=secret, IfNoneMatch="*")
+        except ParamValidationError:
+            s3_client.put_object(Bucket=bucket_name, Key=key, Body=secret)
+        logger.info("Stream token secret created in {}/{}".format(bucket_name, key))
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("PreconditionFailed", "ConditionalRequestConflict"):
+            raise
+    return s3_client.get_object(Bucket=bucket_name, Key=key)["Body"].read()
+
+
+def _signature(payload):
+    digest = hmac.new(_get_secret(), payload.encode('utf-8'), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:SIGNATURE_BYTES]).decode('ascii')
+
+
+def encode_token(index, queue_id=""):
+    """Build the stream token for a track.
+
+    :param index: track index in the catalog
+    :param queue_id: playlist/queue the track is played from, "" for the whole catalog
+    :return: token string
+    """
+    if "." in queue_id:
+        raise ValueError("queue_id can't contain '.'")
+    payload = "{}.{}.{}".format(VERSION, int(index), queue_id)
+    return payload + "." + _signature(payload)
+
+
+def decode_token(token):
+    """Decode a token made by encode_token.
+
+    :param token: token from the request, may be None
+    :return: StreamToken, or None if the token is missing, in another format or fails the signature check
+    """
+    if not token:
+        return None
+    parts = token.split(".")
+    if len(parts) != 4 or parts[0] != VERSION or not parts[1].isdigit():
+        return None
+    payload, signature = token.rsplit(".", 1)
+    if not hmac.compare_digest(signature, _signature(payload)):
+        return None
+    return StreamToken(int(parts[1]), parts[2])
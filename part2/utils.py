@@ -1,27 +1,171 @@
 import logging
 import os
-import boto3
-from botocore.exceptions import ClientError
+import threading
+import time
+from collections import OrderedDict
 
+import metrics
+import sigv4
 
-def create_presigned_url(object_name):
+# Presigned URLs are capped at 60 seconds. A cached URL is handed out again
+# while it still has at least URL_MIN_LIFETIME seconds left, after that it is
+# signed again so the device never gets a URL that expires while it connects.
+URL_EXPIRES_IN = 60*1
+URL_MIN_LIFETIME = 30
+URL_CACHE_SIZE = 256
+
+# Sign URLs locally with sigv4.py instead of the botocore request pipeline.
+# Both produce the same URL, set S3_OFFLINE_SIGNER=1 to make it the default.
+OFFLINE_SIGNER = os.environ.get('S3_OFFLINE_SIGNER') == '1'
+
+SMALL_IMAGE_KEY = "Media/Note108.png"
+LARGE_IMAGE_KEY = "Media/Note512.png"
+
+_url_cache = OrderedDict()   # object_name -> (url, expires_at)
+_url_cache_lock = threading.Lock()
+_url_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+# One S3 client per container, created on first use. It is rebuilt when the
+# region or bucket environment variables change. Stored as a single
+# ((region, bucket), client, credentials) tuple so readers never see a
+# mismatched set.
+_s3_client_entry = None
+_s3_client_lock = threading.Lock()
+
+
+def create_presigned_url(object_name, use_cache=True, offline_signer=None):
     """Generate a presigned URL to share an S3 object with a capped expiration of 60 seconds
 
+    URLs are cached per object name and reused until they get within
+    URL_MIN_LIFETIME seconds of expiring.
+
     :param object_name: string
+    :param use_cache: set False to always sign a fresh URL
+    :param offline_signer: True to sign with sigv4.py, False for botocore, None for OFFLINE_SIGNER
     :return: Presigned URL as string. If error, returns None.
     """
-    s3_client = boto3.client('s3',
-                             region_name=os.environ.get('S3_PERSISTENCE_REGION'),
-                             config=boto3.session.Config(signature_version='s3v4',s3={'addressing_style': 'path'}))
+    if offline_signer is None:
+        offline_signer = OFFLINE_SIGNER
+    sign = _sign_url_offline if offline_signer else _sign_url
+    if not use_cache:
+        with metrics.timed(metrics.PRESIGN_TIME):
+            return sign(object_name)
+
+    now = time.monotonic()
+    with _url_cache_lock:
+        entry = _url_cache.get(object_name)
+        if entry is not None and entry[1] - now >= URL_MIN_LIFETIME:
+            _url_cache.move_to_end(object_name)
+            _url_cache_stats["hits"] += 1
+            return entry[0]
+        _url_cache_stats["misses"] += 1
+
+    with metrics.timed(metrics.PRESIGN_TIME):
+        url = sign(object_name)
+    if url is None:
+        return None
+
+    with _url_cache_lock:
+        _url_cache[object_name] = (url, now + URL_EXPIRES_IN)
+        _url_cache.move_to_end(object_name)
+        while len(_url_cache) > URL_CACHE_SIZE:
+            _url_cache.popitem(last=False)
+            _url_cache_stats["evictions"] += 1
+    return url
+
+
+def card_image_urls():
+    """Return presigned URLs for the card images, valid at the time of the call.
+
+    Call this when building the response rather than at import time, the
+    URL cache keeps it from signing on every request.
+
+    :return: (small_image_url, large_image_url)
+    """
+    return create_presigned_url(SMALL_IMAGE_KEY), create_presigned_url(LARGE_IMAGE_KEY)
+
+
+def get_s3_client():
+    """Return the shared S3 client, creating it on first use.
+
+    :return: (boto3 S3 client, bucket name)
+    """
+    entry = _get_s3_client_entry()
+    return entry[1], entry[0][1]
+
+
+def _get_s3_client_entry():
+    global _s3_client_entry
+    key = (os.environ.get('S3_PERSISTENCE_REGION'), os.environ.get('S3_PERSISTENCE_BUCKET'))
+    entry = _s3_client_entry
+    if entry is not None and entry[0] == key:
+        return entry
+
+    with _s3_client_lock:
+        entry = _s3_client_entry
+        if entry is None or entry[0] != key:
+            # imported here, boto3 takes a few hundred ms to import and is not
+            # needed until the first URL is signed
+            import boto3
+            client = boto3.client('s3',
+                                  region_name=key[0],
+                                  config=boto3.session.Config(signature_version='s3v4',s3={'addressing_style': 'path'}))
+            if entry is not None:
+                # URLs signed for the old region/bucket are no longer valid
+                with _url_cache_lock:
+                    _url_cache.clear()
+            credentials = boto3.session.Session().get_credentials()
+            entry = (key, client, credentials)
+            _s3_client_entry = entry
+        return entry
+
+
+def _sign_url(object_name):
+    from botocore.exceptions import ClientError
+    s3_client, bucket_name = get_s3_client()
     try:
-        bucket_name = os.environ.get('S3_PERSISTENCE_BUCKET')
         response = s3_client.generate_presigned_url('get_object',
                                                     Params={'Bucket': bucket_name,
                                                             'Key': object_name},
-                                                    ExpiresIn=60*1)
+                                                    ExpiresIn=URL_EXPIRES_IN)
     except ClientError as e:
         logging.error(e)
         return None
 
     # The response contains the presigned URL
-    return response
\ No newline at end of file
+    return response
+
+
+def _sign_url_offline(object_name):
+    (region, bucket_name), s3_client, credentials = _get_s3_client_entry()
+    if credentials is None:
+        logging.error("No AWS credentials available to sign %s", object_name)
+        return None
+    creds = credentials.get_frozen_credentials()
+    return sigv4.presign_get_url(s3_client.meta.endpoint_url,
+                                 s3_client.meta.region_name,
+                                 bucket_name,
+                                 object_name,
+                                 creds.access_key,
+                                 creds.secret_key,
+                                 token=creds.token,
+                                 expires_in=URL_EXPIRES_IN)
+
+
+def url_cache_stats():
+    """Return the presigned URL cache counters.
+
+    :return: dict with hits, misses, evictions and current size
+    """
+    with _url_cache_lock:
+        stats = dict(_url_cache_stats)
+        stats["size"] = len(_url_cache)
+    return stats
+
+
+def clear_url_cache():
+    """Drop all cached presigned URLs and reset the counters."""
+    with _url_cache_lock:
+        _url_cache.clear()
+        for name in _url_cache_stats:
+            _url_cache_stats[name] = 0
\ No newline at end of file
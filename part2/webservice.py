@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+# The skill as a web service: the same handlers in a long-lived process behind
+# a load balancer instead of Lambda, as a WSGI application.
+#
+#   pip install -r requirements-webservice.txt
+#   gunicorn --workers 4 --threads 8 --bind :8080 webservice:application
+#   python webservice.py --port 8080 --workers 4 --threads 8
+#
+# requirements-webservice.txt adds cryptography, for the signature checks, to
+# the skill's requirements.txt; the Lambda deployment doesn't need it.
+#
+# A POST of an Alexa request is checked with request_verifier.py and handed to
+# lambda_function.lambda_handler as the Lambda event would be (so the
+# AudioPlayer fast path applies); the response is its JSON. GET /ping answers
+# 200 for health checks. ALEXA_VERIFY=0 skips the checks, for local testing
+# only.
+#
+# A process keeps what a warm Lambda container keeps, for as long as it runs:
+# the S3 client and DynamoDB resource, the URL, attribute and search index
+# caches and the validated signing certificate. They are shared by the
+# threads of a process; the GIL keeps a process to about one core, so
+# --workers starts more processes on the same socket to use more cores. Each
+# worker has its own caches, so the attribute cache (attribute_cache.py, when
+# ATTRIBUTE_CACHE_TTL is set) works across them as across Lambda containers,
+# conditional on versions.
+# The workers are forked before any request, so no boto3 client crosses a fork.
+#
+# The metrics lines still go to stdout, see metrics.py.
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import signal
+import sys
+import wsgiref.simple_server
+
+import lambda_function
+from request_verifier import RequestVerifier, VerificationError
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY = 128 * 1024   # bytes, Alexa requests are a few KB
+
+verifier = RequestVerifier() if os.environ.get('ALEXA_VERIFY', '1') != '0' else None
+
+
+def _respond(start_response, status, body, content_type="application/json;charset=UTF-8"):
+    start_response(status, [("Content-Type", content_type), ("Content-Length", str(len(body)))])
+    return [body]
+
+
+def application(environ, start_response):
+    """WSGI entry point."""
+    method = environ["REQUEST_METHOD"]
+    if method == "GET" and environ.get("PATH_INFO") == "/ping":
+        return _respond(start_response, "200 OK", b"ok", "text/plain")
+    if method != "POST":
+        return _respond(start_response, "405 Method Not Allowed", b"", "text/plain")
+    try:
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        length = -1
+    if not 0 < length <= MAX_BODY:
+        return _respond(start_response, "400 Bad Request", b"", "text/plain")
+    body = environ["wsgi.input"].read(length)
+    try:
+        event = json.loads(body.decode("utf-8"))
+    except ValueError:
+        return _respond(start_response, "400 Bad Request", b"", "text/plain")
+
+    if verifier is not None:
+        try:
+            verifier.verify(environ.get("HTTP_SIGNATURECERTCHAINURL"), environ.get("HTTP_SIGNATURE_256"),
+                            body, event)
+        except VerificationError as e:
+            logger.info("Rejected request: {}".format(e))
+            return _respond(start_response, "400 Bad Request", b"", "text/plain")
+
+    try:
+        response = lambda_function.lambda_handler(event, None)
+    except Exception:
+        logger.exception("Request failed")
+        return _respond(start_response, "500 Internal Server Error", b"", "text/plain")
+    return _respond(start_response, "200 OK", json.dumps(response).encode("utf-8"))
+
+
+class QuietRequestHandler(wsgiref.simple_server.WSGIRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class PooledWSGIServer(wsgiref.simple_server.WSGIServer):
+    """wsgiref's server with the requests handled by a pool of threads.
+
+    :param address: (host, port) to listen on
+    :param threads: requests handled at once
+    """
+    # socketserver listens with a backlog of 5, bursts beyond it wait for a SYN retransmit (1 s)
+    request_queue_size = 128
+
+    def __init__(self, address, threads=8):
+        wsgiref.simple_server.WSGIServer.__init__(self, address, QuietRequestHandler)
+        self.set_app(application)
+        self._pool = concurrent.futures.ThreadPoolExecutor(threads, thread_name_prefix="request")
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve(host, port, workers=1, threads=8):
+    """Serve on host:port with workers processes of threads threads, until SIGTERM or SIGINT."""
+    server = PooledWSGIServer((host, port), threads)
+    children = []
+    for _ in range(workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                signal.signal(signal.SIGTERM, lambda *args: os._exit(0))
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    logger.info("Serving on {}:{}, {} workers of {} threads".format(host, server.server_port, workers, threads))
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the skill as a web service")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes")
+    parser.add_argument("--threads", type=int, default=8, help="threads per process")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        serve(args.host, args.port, args.workers, args.threads)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()